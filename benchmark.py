@@ -0,0 +1,378 @@
+#!/usr/bin/env -S uv run
+
+"""Reproducible inference benchmark for BrickCamera models.
+
+Runs a fixed, seeded set of images through each combination of backend,
+thread count and batch size, and reports latency percentiles, throughput
+and peak memory as JSON. Each combination runs in a fresh process, so that
+its peak memory isn't hidden by an earlier, larger one. Compare the output
+with an earlier run via --baseline to catch performance regressions, e.g.
+between weights files.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import cv2
+import numpy as np
+
+from brick_camera import BrickCamera
+from brick_evaluation import collect_images
+
+
+def load_frames(
+    images_root: Path | None,
+    num_images: int,
+    seed: int,
+) -> list[np.ndarray]:
+    """Load a fixed set of frames into memory, so disk I/O isn't measured.
+
+    If images_root is None, seeded random noise frames are generated instead,
+    which is enough to measure latency on machines without a dataset.
+    """
+    if images_root is None:
+        rng = np.random.default_rng(seed)
+        return [
+            rng.integers(0, 256, size=(640, 480, 3), dtype=np.uint8)
+            for _ in range(num_images)
+        ]
+
+    num_classes = sum(1 for path in images_root.iterdir() if path.is_dir())
+    per_class = max(1, math.ceil(num_images / max(1, num_classes)))
+    paths = collect_images(images_root, per_class=per_class, seed=seed)
+    random.Random(seed).shuffle(paths)
+    paths = paths[:num_images]
+    frames = []
+    for path in paths:
+        img = cv2.imread(str(path))
+        if img is not None:
+            frames.append(img)
+    return frames
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in megabytes.
+
+    This is a high-water mark over the lifetime of the process, see
+    run_in_subprocess().
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(
+    camera: BrickCamera,
+    frames: list[np.ndarray],
+    batch_size: int = 1,
+    warmup: int = 3,
+    iterations: int = 1,
+) -> dict[str, Any]:
+    """Measure latency and throughput of a camera on the given frames.
+
+    Args:
+        camera: The camera (with a loaded model) to benchmark.
+        frames: Input frames; each iteration processes all of them.
+        batch_size: Number of frames per forward pass.
+        warmup: Number of untimed forward passes before measuring.
+        iterations: Number of timed passes over all frames.
+
+    Returns:
+        A dict with per-batch latency percentiles in milliseconds, the
+        throughput in frames per second and the peak RSS of this process
+        in megabytes.
+    """
+    assert frames and batch_size >= 1
+    batches = [
+        frames[start : start + batch_size]
+        for start in range(0, len(frames), batch_size)
+    ]
+
+    def forward(batch: list[np.ndarray]) -> None:
+        if batch_size == 1:
+            camera.recognize(batch[0], 0.0)
+        else:
+            camera.recognize_batch(batch, [0.0] * len(batch))
+
+    for i in range(warmup):
+        forward(batches[i % len(batches)])
+
+    latencies = []
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        for batch in batches:
+            batch_start = time.perf_counter()
+            forward(batch)
+            latencies.append(time.perf_counter() - batch_start)
+    elapsed = time.perf_counter() - start_time
+
+    latency_ms = np.array(latencies) * 1000
+    p50, p90, p99 = np.percentile(latency_ms, [50, 90, 99])
+    num_frames = len(frames) * iterations
+    return {
+        "batch_size": batch_size,
+        "frames": num_frames,
+        "latency_ms": {
+            "min": float(latency_ms.min()),
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+            "max": float(latency_ms.max()),
+            "mean": float(latency_ms.mean()),
+        },
+        "fps": num_frames / elapsed if elapsed > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare_results(
+    current: list[dict[str, Any]],
+    baseline: list[dict[str, Any]],
+    tolerance: float = 0.1,
+) -> list[str]:
+    """Find configurations that got slower than the baseline.
+
+    Results are matched by (backend, threads, batch_size). A regression is
+    a p50 latency increase or FPS decrease by more than the tolerance.
+
+    Returns:
+        A human-readable description of each regression.
+    """
+
+    def key(result: dict[str, Any]) -> tuple:
+        return result["backend"], result["threads"], result["batch_size"]
+
+    baseline_by_key = {key(result): result for result in baseline}
+    regressions = []
+    for result in current:
+        before = baseline_by_key.get(key(result))
+        if before is None:
+            continue
+        name = "backend={} threads={} batch_size={}".format(*key(result))
+        p50_before = before["latency_ms"]["p50"]
+        p50_after = result["latency_ms"]["p50"]
+        if p50_after > p50_before * (1 + tolerance):
+            regressions.append(
+                f"{name}: p50 latency {p50_before:.1f}ms => {p50_after:.1f}ms"
+            )
+        if result["fps"] < before["fps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {before['fps']:.1f} => {result['fps']:.1f} FPS"
+            )
+    return regressions
+
+
+def make_camera(
+    backend: str,
+    weights: Path,
+    threads: int,
+    device: str,
+    names: list[str] | None = None,
+    input_size: int | None = None,
+) -> BrickCamera:
+    """Load a model with the given backend and number of CPU threads.
+
+    Args:
+        names: Class names for ONNX models; required for the opencv backend,
+            which can't read them from the model.
+        input_size: Input size of ONNX models chosen at export time.
+    """
+    if backend == "torch":
+        import torch
+
+        from brick_camera_demo import load_model
+
+        torch.set_num_threads(threads)
+        return BrickCamera(load_model(weights, device))
+
+    from onnx_model import load_onnx_model
+
+    model = load_onnx_model(
+        weights,
+        backend=backend,
+        names=names,
+        threads=threads,
+        input_size=input_size or 640,
+    )
+    return BrickCamera(model)
+
+
+def run_in_subprocess(function: Callable[..., Any], *args: Any) -> Any:
+    """Call function(*args) in a fresh process and return its result.
+
+    The peak RSS measured in the new process covers only this call (and
+    the interpreter), not earlier configurations of this benchmark.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(function, *args).result()
+
+
+def benchmark_config(
+    backend: str,
+    weights: Path,
+    threads: int,
+    device: str,
+    images: Path | None,
+    num_images: int,
+    seed: int,
+    batch_size: int,
+    warmup: int,
+    iterations: int,
+    names: list[str] | None = None,
+    input_size: int | None = None,
+) -> dict[str, Any]:
+    """Load the frames and the model, and benchmark one configuration."""
+    frames = load_frames(images, num_images, seed)
+    camera = make_camera(backend, weights, threads, device, names, input_size)
+    return run_benchmark(camera, frames, batch_size, warmup, iterations)
+
+
+def parse_ints(text: str) -> list[int]:
+    return [int(part) for part in text.split(",")]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Brick Camera Benchmark")
+    parser.add_argument(
+        "weights",
+        type=Path,
+        help="Weights file: .pt for the torch backend, .onnx for the others",
+    )
+    parser.add_argument(
+        "--backends",
+        type=str,
+        default=None,
+        help="Comma-separated list of torch, onnxruntime, opencv"
+        " (default: torch for .pt files, onnxruntime for .onnx files)",
+    )
+    parser.add_argument(
+        "--names",
+        type=Path,
+        default=None,
+        help="Class names file for ONNX models (e.g. bricks.yaml),"
+        " required for the opencv backend",
+    )
+    parser.add_argument(
+        "--input-size",
+        type=int,
+        default=None,
+        help="Input size of ONNX models chosen at export time (default: 640)",
+    )
+    parser.add_argument(
+        "--images",
+        type=Path,
+        default=None,
+        help="Dataset split directory, e.g. ../exported/images/val2023"
+        " (default: seeded synthetic frames)",
+    )
+    parser.add_argument("--num-images", type=int, default=64, help="Image count")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--warmup", type=int, default=5, help="Warm-up passes")
+    parser.add_argument(
+        "--iterations", type=int, default=3, help="Timed passes over all images"
+    )
+    parser.add_argument(
+        "--batch-sizes", type=parse_ints, default=[1], help="e.g. 1,2,4"
+    )
+    parser.add_argument("--threads", type=parse_ints, default=[1], help="e.g. 1,2,4")
+    parser.add_argument("--device", type=str, default="cpu", help="Torch device")
+    parser.add_argument(
+        "--output", type=Path, default=None, help="Write JSON results to this path"
+    )
+    parser.add_argument(
+        "--baseline", type=Path, default=None, help="JSON results to compare with"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Allowed slowdown compared to the baseline (fraction)",
+    )
+    args = parser.parse_args()
+
+    default_backend = "torch" if args.weights.suffix == ".pt" else "onnxruntime"
+    backends = args.backends.split(",") if args.backends else [default_backend]
+    if "opencv" in backends and not args.names:
+        parser.error("the opencv backend needs --names")
+    names = None
+    if args.names:
+        from onnx_model import load_class_names
+
+        names = load_class_names(args.names)
+
+    frames = load_frames(args.images, args.num_images, args.seed)
+    if not frames:
+        print(f"No valid images found in {args.images}")
+        sys.exit(1)
+    print(f"Benchmarking {args.weights} on {len(frames)} frames...")
+
+    results = []
+    for backend in backends:
+        for threads in args.threads:
+            for batch_size in args.batch_sizes:
+                result = run_in_subprocess(
+                    benchmark_config,
+                    backend,
+                    args.weights,
+                    threads,
+                    args.device,
+                    args.images,
+                    args.num_images,
+                    args.seed,
+                    batch_size,
+                    args.warmup,
+                    args.iterations,
+                    names,
+                    args.input_size,
+                )
+                result = {"backend": backend, "threads": threads, **result}
+                latency = result["latency_ms"]
+                print(
+                    f"{backend} threads={threads} batch_size={batch_size}:"
+                    f" p50={latency['p50']:.1f}ms p90={latency['p90']:.1f}ms"
+                    f" p99={latency['p99']:.1f}ms {result['fps']:.1f} FPS"
+                    f" peak_rss={result['peak_rss_mb']:.0f}MB"
+                )
+                results.append(result)
+
+    report = {
+        "weights": str(args.weights),
+        "images": str(args.images) if args.images else "synthetic",
+        "num_images": len(frames),
+        "seed": args.seed,
+        "warmup": args.warmup,
+        "iterations": args.iterations,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare_results(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions compared to {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+from unittest.mock import MagicMock
+
+import cv2
+import numpy as np
+import pytest
+
+import benchmark
+from benchmark import (
+    compare_results,
+    load_frames,
+    peak_rss_mb,
+    run_benchmark,
+    run_in_subprocess,
+)
+from brick_camera import BrickCamera
+
+
+def make_camera() -> BrickCamera:
+    def forward(imgs):
+        result = MagicMock()
+        batch = imgs if isinstance(imgs, list) else [imgs]
+        result.xywhn = [np.zeros((0, 6)) for _ in batch]
+        result.names = []
+        return result
+
+    return BrickCamera(MagicMock(side_effect=forward))
+
+
+def make_result(backend, p50, fps):
+    return {
+        "backend": backend,
+        "threads": 1,
+        "batch_size": 1,
+        "latency_ms": {"p50": p50},
+        "fps": fps,
+    }
+
+
+def test_load_frames_synthetic_is_reproducible():
+    frames = load_frames(None, 3, seed=7)
+    assert len(frames) == 3
+    assert frames[0].shape == (640, 480, 3)
+    again = load_frames(None, 3, seed=7)
+    assert all(np.array_equal(a, b) for a, b in zip(frames, again))
+    other = load_frames(None, 3, seed=8)
+    assert not np.array_equal(frames[0], other[0])
+
+
+def test_load_frames_from_dataset(tmp_path):
+    for class_name in ["3001_brick_2x4", "3003_brick_2x2"]:
+        (tmp_path / class_name).mkdir()
+        for i in range(3):
+            path = tmp_path / class_name / f"{i}.jpg"
+            cv2.imwrite(str(path), np.full((640, 480, 3), i, dtype=np.uint8))
+    frames = load_frames(tmp_path, 4, seed=1)
+    assert len(frames) == 4
+    assert frames[0].shape == (640, 480, 3)
+
+
+def test_run_benchmark():
+    camera = make_camera()
+    frames = load_frames(None, 4, seed=0)
+    result = run_benchmark(camera, frames, batch_size=1, warmup=2, iterations=2)
+
+    assert result["batch_size"] == 1
+    assert result["frames"] == 8
+    assert camera._model.call_count == 2 + 8
+    latency = result["latency_ms"]
+    assert latency["min"] <= latency["p50"] <= latency["p90"] <= latency["p99"]
+    assert latency["p99"] <= latency["max"]
+    assert result["fps"] > 0
+    assert result["peak_rss_mb"] > 0
+
+
+def test_run_benchmark_batched():
+    camera = make_camera()
+    frames = load_frames(None, 5, seed=0)
+    result = run_benchmark(camera, frames, batch_size=2, warmup=0, iterations=1)
+
+    assert result["frames"] == 5
+    batch_sizes = [len(call.args[0]) for call in camera._model.call_args_list]
+    assert batch_sizes == [2, 2, 1]
+
+
+def allocate(megabytes: int) -> float:
+    data = np.ones(megabytes * 1024 * 1024, dtype=np.uint8)
+    assert data.sum() > 0
+    return peak_rss_mb()
+
+
+def test_run_in_subprocess_measures_each_peak():
+    large = run_in_subprocess(allocate, 200)
+    small = run_in_subprocess(allocate, 1)
+    # In a single process, the second peak would include the first one.
+    assert small < large - 100
+
+
+def test_compare_results():
+    baseline = [make_result("torch", 10.0, 100.0), make_result("opencv", 10.0, 100.0)]
+    current = [
+        make_result("torch", 10.5, 96.0),  # Within tolerance.
+        make_result("opencv", 12.0, 80.0),  # Slower.
+        make_result("onnxruntime", 5.0, 200.0),  # Not in baseline.
+    ]
+    regressions = compare_results(current, baseline, tolerance=0.1)
+    assert regressions == [
+        "backend=opencv threads=1 batch_size=1: p50 latency 10.0ms => 12.0ms",
+        "backend=opencv threads=1 batch_size=1: throughput 100.0 => 80.0 FPS",
+    ]
+
+
+def test_run_benchmark_requires_frames():
+    with pytest.raises(AssertionError):
+        run_benchmark(make_camera(), [])
+
+
+def write_tiny_onnx_model(path, input_size, num_classes):
+    """An ONNX model that reshapes its input to raw predictions."""
+    onnx = pytest.importorskip("onnx")
+    helper = onnx.helper
+    row = 5 + num_classes
+    graph = helper.make_graph(
+        [helper.make_node("Reshape", ["images", "shape"], ["output"])],
+        "tiny",
+        [
+            helper.make_tensor_value_info(
+                "images", onnx.TensorProto.FLOAT, [1, 3, input_size, input_size]
+            )
+        ],
+        [
+            helper.make_tensor_value_info(
+                "output",
+                onnx.TensorProto.FLOAT,
+                [1, 3 * input_size * input_size // row, row],
+            )
+        ],
+        [helper.make_tensor("shape", onnx.TensorProto.INT64, [3], [1, -1, row])],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    onnx.save(model, str(path))
+
+
+def test_make_camera_opencv(tmp_path):
+    path = tmp_path / "tiny.onnx"
+    write_tiny_onnx_model(path, input_size=64, num_classes=1)
+    with pytest.raises(ValueError, match="class names are required"):
+        benchmark.make_camera("opencv", path, threads=1, device="cpu", input_size=64)
+
+    camera = benchmark.make_camera(
+        "opencv", path, threads=1, device="cpu", names=["a"], input_size=64
+    )
+    frames = load_frames(None, num_images=2, seed=1)
+    result = run_benchmark(camera, frames, warmup=1)
+    assert result["frames"] == 2
@@ -1,11 +1,14 @@
 from dataclasses import dataclass
+from collections.abc import Callable, Collection
 from typing import Any
 
-import statistics
 import time
 
 import cv2
 import cv2.typing
+import numpy as np
+
+from latency_histogram import StageLatencies
 
 
 @dataclass
@@ -28,73 +31,441 @@ class Hypothesis:
     class_id: int
     class_name: str
 
+    def to_frame(
+        self,
+        region: "Region",
+        image_width: int,
+        image_height: int,
+    ) -> "Hypothesis":
+        """Map coordinates relative to a cropped region back to the full frame.
+
+        Args:
+            region: The region that was cropped from the full frame.
+            image_width: Width of the full frame in pixels.
+            image_height: Height of the full frame in pixels.
+        """
+        return Hypothesis(
+            confidence=self.confidence,
+            x_center=(region.x + self.x_center * region.width) / image_width,
+            y_center=(region.y + self.y_center * region.height) / image_height,
+            width=self.width * region.width / image_width,
+            height=self.height * region.height / image_height,
+            class_id=self.class_id,
+            class_name=self.class_name,
+        )
+
+
+@dataclass(frozen=True)
+class Region:
+    """A rectangular region of interest in pixel coordinates."""
+
+    x: int
+    y: int
+    width: int
+    height: int
+
+    @classmethod
+    def central_band(
+        cls,
+        image_width: int,
+        image_height: int,
+        left: float = 0.3,
+        right: float = 0.7,
+        margin: int = 60,
+    ) -> "Region":
+        """The band where bricks matter, as in webcam.should_save()."""
+        x = int(left * image_width)
+        return cls(x, margin, int(right * image_width) - x, image_height - 2 * margin)
+
+    @classmethod
+    def around(
+        cls,
+        box: tuple[int, int, int, int],
+        image_width: int,
+        image_height: int,
+        margin: int = 32,
+    ) -> "Region":
+        """Pad an (x, y, width, height) bounding box, clipped to the image."""
+        x, y, width, height = box
+        left = max(0, x - margin)
+        top = max(0, y - margin)
+        right = min(image_width, x + width + margin)
+        bottom = min(image_height, y + height + margin)
+        return cls(left, top, right - left, bottom - top)
+
+    def crop(self, img: cv2.typing.MatLike) -> cv2.typing.MatLike:
+        """Return a view of the region within the image (without copying)."""
+        return img[self.y : self.y + self.height, self.x : self.x + self.width]
+
+
+class Detections:
+    """Columnar detections for one image, backed by NumPy arrays.
+
+    Avoids creating a Hypothesis object per box: thresholding, class
+    filtering and coordinate conversion operate on whole columns. Indexing
+    with an int returns a Hypothesis; slices and masks return Detections.
+    """
+
+    __slots__ = ("class_id", "confidence", "names", "xywhn")
+
+    def __init__(
+        self,
+        xywhn: np.ndarray,
+        confidence: np.ndarray,
+        class_id: np.ndarray,
+        names: list[str],
+    ) -> None:
+        """Initialize from columns.
+
+        Args:
+            xywhn: (N, 4) float array of x_center, y_center, width, height in
+                YOLO normalized format (see Hypothesis).
+            confidence: (N,) float array.
+            class_id: (N,) int array of indices into names.
+            names: Class names of the model, indexed by class id.
+        """
+        self.xywhn = xywhn
+        self.confidence = confidence
+        self.class_id = class_id
+        self.names = names
+
+    @classmethod
+    def from_rows(cls, rows: Any, names: list[str]) -> "Detections":
+        """Wrap model output rows of [x, y, w, h, conf, cls] without copying.
+
+        Args:
+            rows: A (N, 6) NumPy array or torch tensor, e.g. results.xywhn[i].
+            names: Class names of the model, e.g. results.names.
+        """
+        if hasattr(rows, "cpu"):
+            rows = rows.cpu().numpy()
+        rows = np.asarray(rows).reshape(-1, 6)
+        return cls(rows[:, :4], rows[:, 4], rows[:, 5].astype(np.intp), names)
+
+    def __len__(self) -> int:
+        return len(self.confidence)
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, (int, np.integer)):
+            x_center, y_center, width, height = self.xywhn[index].tolist()
+            class_id = int(self.class_id[index])
+            return Hypothesis(
+                confidence=float(self.confidence[index]),
+                x_center=x_center,
+                y_center=y_center,
+                width=width,
+                height=height,
+                class_id=class_id,
+                class_name=self.names[class_id],
+            )
+        return Detections(
+            self.xywhn[index], self.confidence[index], self.class_id[index], self.names
+        )
+
+    @property
+    def class_names(self) -> list[str]:
+        """The class name of each detection."""
+        return [self.names[class_id] for class_id in self.class_id.tolist()]
+
+    def filter(
+        self,
+        min_confidence: float = 0.0,
+        class_names: Collection[str] | None = None,
+    ) -> "Detections":
+        """Keep detections with at least min_confidence and one of class_names."""
+        mask = self.confidence >= min_confidence
+        if class_names is not None:
+            class_ids = [i for i, name in enumerate(self.names) if name in class_names]
+            mask &= np.isin(self.class_id, class_ids)
+        return self[mask]
+
+    def to_frame(
+        self,
+        region: "Region",
+        image_width: int,
+        image_height: int,
+    ) -> "Detections":
+        """Map all boxes from a cropped region back to the full frame.
+
+        Vectorized version of Hypothesis.to_frame().
+        """
+        scale = np.array(
+            [region.width / image_width, region.height / image_height] * 2,
+            dtype=self.xywhn.dtype,
+        )
+        offset = np.array(
+            [region.x / image_width, region.y / image_height, 0.0, 0.0],
+            dtype=self.xywhn.dtype,
+        )
+        return Detections(
+            self.xywhn * scale + offset, self.confidence, self.class_id, self.names
+        )
+
+    def xyxy(self, image_width: int, image_height: int) -> np.ndarray:
+        """Return (N, 4) corner coordinates x1, y1, x2, y2 in pixels."""
+        scale = np.array([image_width, image_height] * 2, dtype=self.xywhn.dtype)
+        xy = self.xywhn[:, :2]
+        half_wh = self.xywhn[:, 2:] / 2
+        return np.concatenate([xy - half_wh, xy + half_wh], axis=1) * scale
+
+    def hypotheses(self) -> list[Hypothesis]:
+        """Convert to Hypothesis objects, ordered like the detections."""
+        names = self.names
+        return [
+            Hypothesis(
+                confidence=conf,
+                x_center=x_center,
+                y_center=y_center,
+                width=width,
+                height=height,
+                class_id=class_id,
+                class_name=names[class_id],
+            )
+            for (x_center, y_center, width, height), conf, class_id in zip(
+                self.xywhn.tolist(), self.confidence.tolist(), self.class_id.tolist()
+            )
+        ]
+
 
 class BrickCamera:
     """Runs YOLO object recognition on camera frames to detect brick types."""
 
-    def __init__(self, model: Any) -> None:
+    def __init__(
+        self,
+        model: Any,
+        roi: Region | None = None,
+        input_size: int | None = None,
+    ) -> None:
         """Initialize with a pre-loaded YOLOv7 model.
 
         Args:
             model: A loaded YOLOv7 model (e.g. from yolov7.load()) or a
                 compatible mock for testing.
+            roi: If set, only this region of each frame is sent to the model.
+            input_size: If set, the model resizes its input to this many
+                pixels (longest side) instead of its default. Smaller crops
+                at smaller input sizes reduce inference latency.
         """
         self._model = model
-        self._latencies: list[float] = []
+        self._roi = roi
+        self._input_size = input_size
+        # Per-stage latency: preprocess (cropping), model and postprocess.
+        self.latencies = StageLatencies()
 
     def recognize(
         self,
         img: cv2.typing.MatLike,
         capture_timestamp: float,
+        roi: Region | None = None,
     ) -> list[Hypothesis]:
         """Detect bricks in a camera frame and return recognition hypotheses.
 
         Args:
             img: A BGR image as returned by cv2.VideoCapture.read().
             capture_timestamp: The time (seconds) when this frame was captured.
+            roi: Region to crop before inference, e.g. around the foreground
+                bounding box. Overrides the default region of this camera.
 
         Returns:
             A list of Hypothesis objects, one per detected object. May be empty
             if no bricks were detected. Results are ordered by confidence
             (highest first) as determined by the YOLO model's NMS output.
+            Coordinates are always relative to the full frame.
         """
+        return self.detect(img, capture_timestamp, roi).hypotheses()
+
+    def detect(
+        self,
+        img: cv2.typing.MatLike,
+        capture_timestamp: float,
+        roi: Region | None = None,
+    ) -> Detections:
+        """Like recognize(), but return columnar Detections."""
+        region = roi or self._roi
+        with self.latencies.measure("preprocess"):
+            crop = region.crop(img) if region else img
         # yolov7 accepts BGR numpy arrays directly (same format as cv2).
-        start_time = time.perf_counter()
-        results = self._model(img)
-        end_time = time.perf_counter()
-        self._latencies.append(end_time - start_time)
+        with self.latencies.measure("model"):
+            results = self._infer(crop)
 
-        hypotheses: list[Hypothesis] = []
         # results.xywhn is a list of tensors, one per image in the batch.
         # We pass a single image, so we only use index 0.
-        for *xywh, conf, cls in results.xywhn[0].tolist():
-            x_center, y_center, width, height = xywh
-            hypotheses.append(
-                Hypothesis(
-                    confidence=conf,
-                    x_center=x_center,
-                    y_center=y_center,
-                    width=width,
-                    height=height,
-                    class_id=int(cls),
-                    class_name=results.names[int(cls)],
-                )
-            )
-        return hypotheses
+        with self.latencies.measure("postprocess"):
+            return self._detections(results, 0, region, img)
+
+    def recognize_batch(
+        self,
+        frames: list[cv2.typing.MatLike],
+        capture_timestamps: list[float],
+        rois: list[Region | None] | None = None,
+    ) -> list[list[Hypothesis]]:
+        """Detect bricks in several frames with a single forward pass.
+
+        The frames may come from one camera or from several camera streams.
+        One latency sample is recorded for the whole batch.
+
+        Args:
+            frames: BGR images as returned by cv2.VideoCapture.read().
+            capture_timestamps: The capture time (seconds) of each frame.
+            rois: Region to crop before inference, per frame. Each overrides
+                the default region of this camera, like in recognize().
+
+        Returns:
+            One list of Hypothesis objects per frame, in the same order.
+        """
+        return [
+            detections.hypotheses()
+            for detections in self.detect_batch(frames, capture_timestamps, rois)
+        ]
+
+    def detect_batch(
+        self,
+        frames: list[cv2.typing.MatLike],
+        capture_timestamps: list[float],
+        rois: list[Region | None] | None = None,
+    ) -> list[Detections]:
+        """Like recognize_batch(), but return columnar Detections."""
+        assert len(frames) == len(capture_timestamps)
+        if rois is None:
+            rois = [None] * len(frames)
+        assert len(rois) == len(frames)
+        if not frames:
+            return []
+
+        regions = [roi or self._roi for roi in rois]
+        with self.latencies.measure("preprocess"):
+            crops = [
+                region.crop(img) if region else img
+                for img, region in zip(frames, regions)
+            ]
+        with self.latencies.measure("model"):
+            results = self._infer(crops)
+
+        with self.latencies.measure("postprocess"):
+            return [
+                self._detections(results, index, region, img)
+                for index, (img, region) in enumerate(zip(frames, regions))
+            ]
+
+    def _infer(self, imgs: Any) -> Any:
+        """Run the model on one image or a list of images."""
+        if self._input_size is None:
+            return self._model(imgs)
+        return self._model(imgs, size=self._input_size)
+
+    def _detections(
+        self,
+        results: Any,
+        index: int,
+        region: Region | None,
+        img: cv2.typing.MatLike,
+    ) -> Detections:
+        """Extract the detections for one image in a batch."""
+        detections = Detections.from_rows(results.xywhn[index], results.names)
+        if region is not None:
+            image_height, image_width = img.shape[:2]
+            detections = detections.to_frame(region, image_width, image_height)
+        return detections
 
     def latency(self) -> tuple[float, float, float, float]:
         """Return the (min, max, avg, median) latency of model inference in seconds.
 
+        The median is approximate (within 1%), see LatencyHistogram. Use
+        self.latencies for percentiles, recent windows and other stages.
+
         Returns:
             A tuple of (min, max, average, median) latency in float seconds.
             Returns (0.0, 0.0, 0.0, 0.0) if no inferences have been run.
         """
-        if not self._latencies:
-            return 0.0, 0.0, 0.0, 0.0
-
-        return (
-            min(self._latencies),
-            max(self._latencies),
-            statistics.mean(self._latencies),
-            statistics.median(self._latencies),
-        )
+        return self.latencies.histogram("model").summary()
+
+
+class FrameBatcher:
+    """Collects frames into batches for BrickCamera.recognize_batch().
+
+    A batch is flushed when it reaches the current batch size, or when the
+    oldest pending frame has waited longer than the latency deadline. The
+    batch size adapts between 1 and max_batch_size: it grows while full
+    batches are processed within the deadline, and it is halved whenever
+    a forward pass takes longer than the deadline.
+    """
+
+    def __init__(
+        self,
+        camera: BrickCamera,
+        max_batch_size: int = 4,
+        deadline: float = 0.1,  # seconds
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        assert max_batch_size >= 1
+        self._camera = camera
+        self._max_batch_size = max_batch_size
+        self._deadline = deadline
+        self._clock = clock
+        self.batch_size = 1
+        # Pending frames as (arrival_time, frame, capture_timestamp, roi).
+        self._pending: list[tuple[float, cv2.typing.MatLike, float, Region | None]] = []
+
+    def __len__(self) -> int:
+        """The number of pending frames."""
+        return len(self._pending)
+
+    def add(
+        self,
+        frame: cv2.typing.MatLike,
+        capture_timestamp: float,
+        roi: Region | None = None,
+    ) -> list[tuple[cv2.typing.MatLike, float, list[Hypothesis]]]:
+        """Queue a frame, and run the model if a batch is ready.
+
+        Args:
+            frame: A BGR image as returned by cv2.VideoCapture.read().
+            capture_timestamp: The time (seconds) when this frame was captured.
+            roi: Region to crop before inference, see BrickCamera.recognize().
+
+        Returns:
+            A list of (frame, capture_timestamp, hypotheses) tuples for all
+            frames in the flushed batch, or an empty list if the batch is
+            still waiting for more frames.
+        """
+        self._pending.append((self._clock(), frame, capture_timestamp, roi))
+        return self.poll()
+
+    def poll(self) -> list[tuple[cv2.typing.MatLike, float, list[Hypothesis]]]:
+        """Run the model if the batch is full or the deadline has passed."""
+        if not self._pending:
+            return []
+        if len(self._pending) >= self.batch_size:
+            return self._run_batch()
+        if self._clock() - self._pending[0][0] >= self._deadline:
+            return self._run_batch()
+        return []
+
+    def flush(self) -> list[tuple[cv2.typing.MatLike, float, list[Hypothesis]]]:
+        """Run the model on all pending frames, regardless of batch size.
+
+        More than max_batch_size pending frames take several forward passes.
+        """
+        results = []
+        while self._pending:
+            results.extend(self._run_batch())
+        return results
+
+    def _run_batch(self) -> list[tuple[cv2.typing.MatLike, float, list[Hypothesis]]]:
+        """Run the model on up to max_batch_size of the oldest pending frames."""
+        batch = self._pending[: self._max_batch_size]
+        del self._pending[: self._max_batch_size]
+        frames = [frame for _, frame, _, _ in batch]
+        timestamps = [timestamp for _, _, timestamp, _ in batch]
+        rois = [roi for _, _, _, roi in batch]
+
+        start_time = time.perf_counter()
+        results = self._camera.recognize_batch(frames, timestamps, rois)
+        elapsed = time.perf_counter() - start_time
+
+        if elapsed > self._deadline:
+            self.batch_size = max(1, self.batch_size // 2)
+        elif len(batch) >= self.batch_size:
+            self.batch_size = min(self._max_batch_size, self.batch_size + 1)
+
+        return list(zip(frames, timestamps, results))
@@ -2,16 +2,15 @@
 
 import argparse
 import functools
-import random
 import sys
-import time
 from pathlib import Path
+from typing import Any
 
-import cv2
 import numpy as np
 import PIL.ImageFont
 import torch
 from brick_camera import BrickCamera
+from brick_evaluation import collect_images, evaluate
 
 
 class ELAN1(torch.nn.Module):
@@ -48,28 +47,8 @@ def patch_pil() -> None:
         PIL.ImageFont.FreeTypeFont.getsize = getsize
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser(description="Brick Camera Demo")
-    parser.add_argument(
-        "--device",
-        type=str,
-        default="cpu",
-        help="Device to use (e.g., cpu, 0, mps)",
-    )
-    parser.add_argument(
-        "weights",
-        type=str,
-        nargs="?",
-        default="yolov7-tiny.pt",
-        help="Path to weights file (e.g., yolov7-tiny.pt or yolov9-s2.pt)",
-    )
-    args = parser.parse_args()
-
-    weights_path = Path(args.weights)
-    if not weights_path.exists():
-        print(f"Error: {weights_path} not found.")
-        return
-
+def load_model(weights_path: Path, device: str = "cpu") -> Any:
+    """Load a YOLOv7 or YOLOv9 model (depending on the weights file name)."""
     is_yolov9 = "yolov9" in weights_path.name.lower()
     print(f"Loading {'YOLOv9' if is_yolov9 else 'YOLOv7'} model from {weights_path}...")
     if is_yolov9:
@@ -90,93 +69,87 @@ def main() -> None:
     original_load = torch.load
     torch.load = functools.partial(original_load, weights_only=False)
     try:
-        device = "cpu" if args.device == "mps" else args.device
-        print(f"Loading to device={device}...")
-        model = model_loader(str(weights_path), device=device)
+        load_device = "cpu" if device == "mps" else device
+        print(f"Loading to device={load_device}...")
+        model = model_loader(str(weights_path), device=load_device)
     finally:
         torch.load = original_load
 
-    if args.device == "mps":
+    if device == "mps":
         assert torch.backends.mps.is_available(), "MPS not available"
         print("Moving model to MPS...")
         model = model.to("mps")
+    return model
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Brick Camera Demo")
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cpu",
+        help="Device to use (e.g., cpu, 0, mps)",
+    )
+    parser.add_argument(
+        "weights",
+        type=str,
+        nargs="?",
+        default="yolov7-tiny.pt",
+        help="Path to weights file (e.g., yolov7-tiny.pt or yolov9-s2.pt)",
+    )
+    parser.add_argument(
+        "--images",
+        type=str,
+        default="../exported/images/val2023",
+        help="Path to validation images, with one subdirectory per class",
+    )
+    parser.add_argument(
+        "--mosaic",
+        type=str,
+        default="../mosaic.jpg",
+        help="Output path for the mosaic grid of recognized images",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Random seed for picking images (default: random)",
+    )
+    args = parser.parse_args()
+
+    weights_path = Path(args.weights)
+    if not weights_path.exists():
+        print(f"Error: {weights_path} not found.")
+        return
+
+    is_yolov9 = "yolov9" in weights_path.name.lower()
+    model = load_model(weights_path, args.device)
 
-    # Path to validation images.
-    images_root = Path("../exported/images/val2023")
+    images_root = Path(args.images)
     if not images_root.exists():
         print(f"Error: {images_root} not found.")
         return
 
     # Collect one JPG image from each class subdirectory with correct dimensions.
-    image_paths: list[Path] = []
-    target_shape = (640, 480)
-    for class_dir in sorted(images_root.iterdir()):
-        if class_dir.is_dir():
-            jpgs = list(class_dir.glob("*.jpg"))
-            random.shuffle(jpgs)
-            for jpg_path in jpgs:
-                img = cv2.imread(str(jpg_path))
-                if img is not None and img.shape[:2] == target_shape:
-                    image_paths.append(jpg_path)
-                    break
-
+    image_paths = collect_images(images_root, seed=args.seed)
     if not image_paths:
-        print(f"No valid {target_shape} images found in {images_root}")
+        print(f"No valid (640, 480) images found in {images_root}")
         return
 
     print(f"Processing {len(image_paths)} images...")
 
-    all_images = []
-    all_targets = []
-    processed_count = 0
-    correct_count = 0
-
     camera = BrickCamera(model)
-    for path in image_paths:
-        img = cv2.imread(str(path))
-        if img is None:
-            print(f"Failed to load {path}")
-            continue
-
-        capture_timestamp = time.time()
-        hypotheses = camera.recognize(img, capture_timestamp)
-
-        ground_truth = path.parent.name
-        recognized_names = [h.class_name for h in hypotheses]
-        is_correct = ground_truth in recognized_names
-        if is_correct:
-            correct_count += 1
-
-        match_status = "OK" if is_correct else "FAIL"
-        print(f"  {path.parent.name}/{path.name}: {recognized_names} {match_status}")
-
-        for hypo in hypotheses:
-            all_targets.append(
-                [
-                    processed_count,
-                    hypo.class_id,
-                    hypo.x_center,
-                    hypo.y_center,
-                    hypo.width,
-                    hypo.height,
-                ]
-            )
-
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img_reshaped = img_rgb.transpose(2, 0, 1)
-        all_images.append(img_reshaped)
-        processed_count += 1
-
-    if not all_images:
+    evaluation = evaluate(camera, image_paths, keep_images=True)
+    if not evaluation.images:
         print("No images successfully processed.")
         return
 
-    accuracy = correct_count / processed_count if processed_count > 0 else 0
     print(
-        f"\nClassification accuracy: {accuracy:.1%} ({correct_count}/{processed_count})"
+        f"\nClassification accuracy: {evaluation.accuracy:.1%}"
+        f" ({evaluation.correct}/{evaluation.total})"
     )
 
-    l_min, l_max, l_avg, l_med = camera.latency()
+    l_min, l_max, l_avg, l_med = evaluation.latency
     print("\nInference Latency:")
     print(f"  Min:    {l_min:.4f}s ({1 / l_min:.1f} FPS)")
     print(f"  Max:    {l_max:.4f}s ({1 / l_max:.1f} FPS)")
@@ -184,9 +157,11 @@ def main() -> None:
     print(f"  Median: {l_med:.4f}s ({1 / l_med:.1f} FPS)")
 
     print("\nCreating mosaic grid...")
-    images_np = np.stack(all_images)
-    targets_np = np.array(all_targets) if all_targets else np.zeros((0, 6))
-    mosaic_path = "../mosaic.jpg"
+    images_np = np.stack(evaluation.images)
+    targets_np = (
+        np.array(evaluation.targets) if evaluation.targets else np.zeros((0, 6))
+    )
+    mosaic_path = args.mosaic
 
     if is_yolov9:
         from yolov9.utils.plots import plot_images
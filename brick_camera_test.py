@@ -1,7 +1,8 @@
+import time
 from unittest.mock import MagicMock
 import numpy as np
 import pytest
-from brick_camera import BrickCamera, Hypothesis
+from brick_camera import BrickCamera, Detections, FrameBatcher, Hypothesis, Region
 
 
 def make_mock_model(detections: list[list[float]]) -> MagicMock:
@@ -70,3 +71,253 @@ def test_recognize_empty(fake_img):
     hypotheses = camera.recognize(fake_img, capture_timestamp=0.0)
 
     assert hypotheses == []
+
+
+def make_mock_batch_model(delay: float = 0.0) -> MagicMock:
+    """Build a mock model that returns one detection per image in a batch.
+
+    The x_center of each detection is the first pixel value of its image, so
+    tests can tell which result belongs to which frame.
+    """
+    import torch
+
+    def forward(imgs):
+        time.sleep(delay)
+        result = MagicMock()
+        result.xywhn = [
+            torch.tensor([[float(img[0, 0, 0]), 0.5, 0.1, 0.1, 0.9, 1]]) for img in imgs
+        ]
+        result.names = ["3001_brick_2x4", "3003_brick_2x2"]
+        return result
+
+    return MagicMock(side_effect=forward)
+
+
+def make_img(value: int) -> np.ndarray:
+    return np.full((4, 4, 3), value, dtype=np.uint8)
+
+
+def test_recognize_batch():
+    model = make_mock_batch_model()
+    camera = BrickCamera(model)
+    results = camera.recognize_batch([make_img(1), make_img(2)], [1.0, 2.0])
+
+    model.assert_called_once()
+    assert len(model.call_args.args[0]) == 2
+    assert len(results) == 2
+    assert [h.x_center for h in results[0]] == [1.0]
+    assert [h.x_center for h in results[1]] == [2.0]
+    assert results[1][0].class_name == "3003_brick_2x2"
+    assert camera.latency()[0] > 0.0
+
+
+def test_recognize_batch_empty():
+    model = make_mock_batch_model()
+    camera = BrickCamera(model)
+    assert camera.recognize_batch([], []) == []
+    model.assert_not_called()
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_frame_batcher_grows_batch_size():
+    model = make_mock_batch_model()
+    batcher = FrameBatcher(BrickCamera(model), max_batch_size=3, deadline=1.0)
+    assert batcher.batch_size == 1
+
+    results = batcher.add(make_img(1), 1.0)
+    assert [timestamp for _, timestamp, _ in results] == [1.0]
+    assert batcher.batch_size == 2
+
+    assert batcher.add(make_img(2), 2.0) == []
+    results = batcher.add(make_img(3), 3.0)
+    assert [hypotheses[0].x_center for _, _, hypotheses in results] == [2.0, 3.0]
+    assert batcher.batch_size == 3
+
+    for i in range(4, 7):
+        results = batcher.add(make_img(i), float(i))
+    assert len(results) == 3
+    assert batcher.batch_size == 3  # Limited by max_batch_size.
+
+
+def test_frame_batcher_flushes_on_deadline():
+    clock = FakeClock()
+    model = make_mock_batch_model()
+    batcher = FrameBatcher(BrickCamera(model), deadline=0.1, clock=clock)
+    batcher.batch_size = 4
+
+    assert batcher.add(make_img(1), 1.0) == []
+    clock.now = 0.05
+    assert batcher.add(make_img(2), 2.0) == []
+    assert batcher.poll() == []
+    clock.now = 0.1
+    results = batcher.poll()
+    assert [timestamp for _, timestamp, _ in results] == [1.0, 2.0]
+    assert batcher.batch_size == 4  # Partial batch doesn't grow.
+    assert batcher.poll() == []
+
+
+def test_frame_batcher_flush_runs_all_pending_frames():
+    clock = FakeClock()
+    model = make_mock_batch_model()
+    batcher = FrameBatcher(BrickCamera(model), max_batch_size=2, clock=clock)
+    batcher.batch_size = 8  # More than max_batch_size, to queue all frames.
+    for i in range(5):
+        assert batcher.add(make_img(i), float(i)) == []
+    assert len(batcher) == 5
+
+    results = batcher.flush()
+    assert [timestamp for _, timestamp, _ in results] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert [len(call.args[0]) for call in model.call_args_list] == [2, 2, 1]
+    assert len(batcher) == 0
+
+
+def test_frame_batcher_crops_each_frame():
+    model = make_mock_batch_model()
+    batcher = FrameBatcher(BrickCamera(model), max_batch_size=2, deadline=1.0)
+    batcher.batch_size = 2
+    img = np.zeros((8, 8, 3), dtype=np.uint8)
+    assert batcher.add(img, 1.0, Region(x=0, y=0, width=4, height=4)) == []
+    results = batcher.add(img, 2.0)
+
+    crops = model.call_args.args[0]
+    assert [crop.shape for crop in crops] == [(4, 4, 3), (8, 8, 3)]
+    # The first detection is mapped from its crop back to the full frame.
+    assert results[0][2][0].width == pytest.approx(0.05)
+    assert results[1][2][0].width == pytest.approx(0.1)
+
+
+def test_frame_batcher_shrinks_when_model_is_slow():
+    model = make_mock_batch_model(delay=0.02)
+    batcher = FrameBatcher(BrickCamera(model), deadline=0.01)
+    batcher.batch_size = 4
+    for i in range(4):
+        results = batcher.add(make_img(i), float(i))
+    assert len(results) == 4
+    assert batcher.batch_size == 2
+
+
+def test_region_central_band():
+    region = Region.central_band(480, 640)
+    assert region == Region(x=144, y=60, width=192, height=520)
+
+
+def test_region_around_clips_to_image():
+    assert Region.around((100, 200, 50, 60), 480, 640) == Region(68, 168, 114, 124)
+    assert Region.around((0, 600, 50, 40), 480, 640) == Region(0, 568, 82, 72)
+
+
+def test_region_crop():
+    img = np.arange(6 * 8).reshape(6, 8)
+    crop = Region(x=2, y=1, width=3, height=4).crop(img)
+    assert crop.shape == (4, 3)
+    assert crop[0, 0] == img[1, 2]
+
+
+def test_hypothesis_to_frame():
+    h = Hypothesis(0.9, 0.5, 0.25, 0.5, 0.5, 0, "3001_brick_2x4")
+    full = h.to_frame(Region(x=100, y=200, width=200, height=400), 400, 800)
+    assert full.x_center == pytest.approx(0.5)  # (100 + 0.5 * 200) / 400
+    assert full.y_center == pytest.approx(0.375)  # (200 + 0.25 * 400) / 800
+    assert full.width == pytest.approx(0.25)
+    assert full.height == pytest.approx(0.25)
+    assert full.confidence == h.confidence
+    assert full.class_name == h.class_name
+
+
+def test_recognize_with_roi():
+    model = make_mock_model([[0.5, 0.5, 0.5, 0.5, 0.9, 0]])
+    camera = BrickCamera(model, roi=Region(x=120, y=160, width=240, height=320))
+    img = np.zeros((640, 480, 3), dtype=np.uint8)
+    hypotheses = camera.recognize(img, capture_timestamp=1.0)
+
+    assert model.call_args.args[0].shape == (320, 240, 3)
+    assert hypotheses[0].x_center == pytest.approx(0.5)
+    assert hypotheses[0].y_center == pytest.approx(0.5)
+    assert hypotheses[0].width == pytest.approx(0.25)
+    assert hypotheses[0].height == pytest.approx(0.25)
+
+
+def test_recognize_roi_argument_overrides_default():
+    model = make_mock_model([[0.5, 0.5, 1.0, 1.0, 0.9, 0]])
+    camera = BrickCamera(model, roi=Region.central_band(480, 640))
+    img = np.zeros((640, 480, 3), dtype=np.uint8)
+    hypotheses = camera.recognize(img, 1.0, roi=Region(0, 0, 48, 64))
+
+    assert model.call_args.args[0].shape == (64, 48, 3)
+    assert hypotheses[0].x_center == pytest.approx(0.05)
+    assert hypotheses[0].width == pytest.approx(0.1)
+
+
+def test_recognize_input_size():
+    model = make_mock_model([])
+    camera = BrickCamera(model, input_size=320)
+    camera.recognize(np.zeros((640, 480, 3), dtype=np.uint8), 1.0)
+    assert model.call_args.kwargs == {"size": 320}
+
+
+def make_detections() -> Detections:
+    rows = np.array(
+        [
+            [0.5, 0.5, 0.2, 0.4, 0.92, 0],
+            [0.2, 0.7, 0.1, 0.1, 0.65, 2],
+            [0.8, 0.1, 0.2, 0.2, 0.30, 1],
+        ],
+        dtype=np.float32,
+    )
+    return Detections.from_rows(rows, ["3001_brick_2x4", "3003_brick_2x2", "reject"])
+
+
+def test_detections_columns_and_indexing():
+    detections = make_detections()
+    assert len(detections) == 3
+    assert detections.class_names == ["3001_brick_2x4", "reject", "3003_brick_2x2"]
+
+    h = detections[1]
+    assert isinstance(h, Hypothesis)
+    assert h.confidence == pytest.approx(0.65)
+    assert h.class_id == 2
+    assert h.class_name == "reject"
+    assert detections.hypotheses()[1] == h
+    assert len(detections[1:]) == 2
+
+
+def test_detections_filter():
+    detections = make_detections()
+    assert detections.filter(min_confidence=0.5).class_names == [
+        "3001_brick_2x4",
+        "reject",
+    ]
+    filtered = detections.filter(class_names={"3003_brick_2x2", "reject"})
+    assert filtered.class_names == ["reject", "3003_brick_2x2"]
+    assert len(detections.filter(0.5, class_names={"3003_brick_2x2"})) == 0
+
+
+def test_detections_to_frame_matches_hypotheses():
+    detections = make_detections()
+    region = Region(x=100, y=200, width=200, height=400)
+    mapped = detections.to_frame(region, 400, 800)
+    for h, expected in zip(mapped.hypotheses(), detections.hypotheses()):
+        full = expected.to_frame(region, 400, 800)
+        assert h.x_center == pytest.approx(full.x_center)
+        assert h.y_center == pytest.approx(full.y_center)
+        assert h.width == pytest.approx(full.width)
+        assert h.height == pytest.approx(full.height)
+
+
+def test_detections_xyxy():
+    xyxy = make_detections().xyxy(100, 200)
+    assert xyxy[0].tolist() == pytest.approx([40, 60, 60, 140])
+
+
+def test_detect_empty(fake_img):
+    camera = BrickCamera(make_mock_model([]))
+    detections = camera.detect(fake_img, capture_timestamp=0.0)
+    assert len(detections) == 0
+    assert detections.hypotheses() == []
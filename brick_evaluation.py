@@ -0,0 +1,131 @@
+"""Measures recognizer accuracy per class on an exported YOLO dataset split."""
+
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import cv2
+import numpy as np
+
+
+@dataclass
+class ClassAccuracy:
+    """Number of correctly recognized images for a single class."""
+
+    correct: int = 0
+    total: int = 0
+
+    @property
+    def accuracy(self) -> float:
+        return self.correct / self.total if self.total else 0.0
+
+
+@dataclass
+class Evaluation:
+    """Results of running a BrickCamera over a set of labeled images."""
+
+    per_class: dict[str, ClassAccuracy] = field(
+        default_factory=lambda: defaultdict(ClassAccuracy)
+    )
+    # (min, max, avg, median) model latency in seconds.
+    latency: tuple[float, float, float, float] = (0.0, 0.0, 0.0, 0.0)
+    # RGB images in CHW layout and YOLO targets, for plot_images().
+    images: list[np.ndarray] = field(default_factory=list)
+    targets: list[list[float]] = field(default_factory=list)
+
+    @property
+    def correct(self) -> int:
+        return sum(c.correct for c in self.per_class.values())
+
+    @property
+    def total(self) -> int:
+        return sum(c.total for c in self.per_class.values())
+
+    @property
+    def accuracy(self) -> float:
+        return self.correct / self.total if self.total else 0.0
+
+
+def collect_images(
+    images_root: Path,
+    per_class: int = 1,
+    seed: int | None = None,
+    target_shape: tuple[int, int] = (640, 480),
+) -> list[Path]:
+    """Pick random JPG images with the expected shape from each class directory.
+
+    Args:
+        images_root: A split directory such as exported/images/val2023, with
+            one subdirectory per class.
+        per_class: Maximum number of images to pick from each class.
+        seed: Random seed, for a reproducible selection of images.
+        target_shape: Expected (height, width) of each image.
+    """
+    rng = random.Random(seed)
+    image_paths: list[Path] = []
+    for class_dir in sorted(images_root.iterdir()):
+        if not class_dir.is_dir():
+            continue
+        jpgs = sorted(class_dir.glob("*.jpg"))
+        rng.shuffle(jpgs)
+        found = 0
+        for jpg_path in jpgs:
+            if found >= per_class:
+                break
+            img = cv2.imread(str(jpg_path))
+            if img is not None and img.shape[:2] == target_shape:
+                image_paths.append(jpg_path)
+                found += 1
+    return image_paths
+
+
+def evaluate(
+    camera: Any,
+    image_paths: list[Path],
+    keep_images: bool = False,
+    verbose: bool = True,
+) -> Evaluation:
+    """Recognize each image and check if its class directory name was found.
+
+    Args:
+        camera: A BrickCamera (or compatible) with detect() and latency().
+        image_paths: Images whose parent directory name is the ground truth.
+        keep_images: Also collect images and targets for a mosaic plot.
+        verbose: Print the result for each image.
+    """
+    evaluation = Evaluation()
+    for path in image_paths:
+        img = cv2.imread(str(path))
+        if img is None:
+            print(f"Failed to load {path}")
+            continue
+
+        capture_timestamp = time.time()
+        detections = camera.detect(img, capture_timestamp)
+
+        ground_truth = path.parent.name
+        recognized_names = detections.class_names
+        is_correct = ground_truth in recognized_names
+        class_accuracy = evaluation.per_class[ground_truth]
+        class_accuracy.total += 1
+        if is_correct:
+            class_accuracy.correct += 1
+
+        if verbose:
+            match_status = "OK" if is_correct else "FAIL"
+            print(f"  {ground_truth}/{path.name}: {recognized_names} {match_status}")
+
+        if keep_images:
+            image_index = np.full(len(detections), len(evaluation.images))
+            targets = np.column_stack(
+                [image_index, detections.class_id, detections.xywhn]
+            )
+            evaluation.targets.extend(targets.tolist())
+            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            evaluation.images.append(img_rgb.transpose(2, 0, 1))
+
+    evaluation.latency = camera.latency()
+    return evaluation
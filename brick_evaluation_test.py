@@ -0,0 +1,69 @@
+from unittest.mock import MagicMock
+
+import cv2
+import numpy as np
+
+from brick_camera import Detections
+from brick_evaluation import ClassAccuracy, Evaluation, collect_images, evaluate
+
+
+def write_images(root, class_name, count, shape=(640, 480, 3)):
+    class_dir = root / class_name
+    class_dir.mkdir(parents=True)
+    for i in range(count):
+        cv2.imwrite(str(class_dir / f"{i:03d}.jpg"), np.zeros(shape, dtype=np.uint8))
+
+
+NAMES = ["3001_brick_2x4", "3003_brick_2x2"]
+
+
+def make_detections(*class_ids):
+    rows = [[0.5, 0.5, 0.1, 0.1, 0.9, class_id] for class_id in class_ids]
+    return Detections.from_rows(np.array(rows, dtype=np.float32), NAMES)
+
+
+def test_collect_images(tmp_path):
+    write_images(tmp_path, "3001_brick_2x4", 5)
+    write_images(tmp_path, "3003_brick_2x2", 2)
+    write_images(tmp_path, "wrong_shape", 2, shape=(480, 640, 3))
+
+    paths = collect_images(tmp_path, per_class=3, seed=1)
+    assert [p.parent.name for p in paths].count("3001_brick_2x4") == 3
+    assert [p.parent.name for p in paths].count("3003_brick_2x2") == 2
+    assert "wrong_shape" not in [p.parent.name for p in paths]
+
+    # The same seed picks the same images.
+    assert collect_images(tmp_path, per_class=3, seed=1) == paths
+
+
+def test_evaluate(tmp_path):
+    write_images(tmp_path, "3001_brick_2x4", 2)
+    write_images(tmp_path, "3003_brick_2x2", 1)
+    paths = collect_images(tmp_path, per_class=2)
+
+    camera = MagicMock()
+    camera.detect.side_effect = [
+        make_detections(0),
+        make_detections(1),
+        make_detections(),
+    ]
+    camera.latency.return_value = (0.1, 0.3, 0.2, 0.2)
+    evaluation = evaluate(camera, paths, keep_images=True, verbose=False)
+
+    assert evaluation.per_class["3001_brick_2x4"] == ClassAccuracy(1, 2)
+    assert evaluation.per_class["3003_brick_2x2"] == ClassAccuracy(0, 1)
+    assert evaluation.correct == 1
+    assert evaluation.total == 3
+    assert evaluation.latency == (0.1, 0.3, 0.2, 0.2)
+    assert len(evaluation.images) == 3
+    assert evaluation.images[0].shape == (3, 640, 480)
+    # Targets are [image_index, class_id, x, y, w, h] rows for plot_images().
+    assert np.allclose(
+        evaluation.targets,
+        [[0, 0, 0.5, 0.5, 0.1, 0.1], [1, 1, 0.5, 0.5, 0.1, 0.1]],
+    )
+
+
+def test_evaluation_accuracy_empty():
+    assert Evaluation().accuracy == 0.0
+    assert ClassAccuracy().accuracy == 0.0
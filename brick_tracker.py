@@ -0,0 +1,246 @@
+"""Associates per-frame detections into tracks, one per physical brick.
+
+A brick stays in view for several frames while the belt carries it from the
+top to the bottom of the (rotated) camera frame. The tracker predicts where
+each known brick should be from the belt speed, matches new detections by
+IoU (or centroid distance for small, fast bricks), sums the confidence of
+each class over the whole track, and emits a single decision per brick once
+it has left the view. The observed motion of matched bricks is passed back
+to the belt, to measure its speed between calibration mark sightings.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any
+
+from brick_camera import Hypothesis
+
+
+@dataclass
+class TrackDecision:
+    """The fused classification of one brick, emitted once per track."""
+
+    track_id: int
+    class_name: str
+    # Mean confidence of the winning class over all frames of the track.
+    confidence: float
+    # Capture time of the frame in which the brick was closest to the
+    # camera mid-line, i.e. the time to pass to ServoShelf.
+    timestamp: float
+    hits: int
+
+
+@dataclass
+class Track:
+    """A brick seen in one or more frames."""
+
+    track_id: int
+    # Last known (x_center, y_center, width, height), normalized.
+    box: tuple[float, float, float, float]
+    last_seen: float
+    hits: int = 1
+    # Class name => sum of confidences over all frames.
+    votes: dict[str, float] = field(default_factory=lambda: defaultdict(float))
+    # Capture time and distance of the observation closest to the mid-line.
+    center_time: float = 0.0
+    center_distance: float = 1.0
+    # Observed y_center at last_seen; box moves on with the belt prediction.
+    last_y: float = 0.0
+
+    def observe(self, hypothesis: Hypothesis, timestamp: float) -> None:
+        self.box = (
+            hypothesis.x_center,
+            hypothesis.y_center,
+            hypothesis.width,
+            hypothesis.height,
+        )
+        self.last_seen = timestamp
+        self.last_y = hypothesis.y_center
+        self.votes[hypothesis.class_name] += hypothesis.confidence
+        distance = abs(hypothesis.y_center - 0.5)
+        if distance < self.center_distance:
+            self.center_distance = distance
+            self.center_time = timestamp
+
+    def decide(self) -> TrackDecision:
+        class_name = max(self.votes, key=self.votes.__getitem__)
+        return TrackDecision(
+            track_id=self.track_id,
+            class_name=class_name,
+            confidence=self.votes[class_name] / self.hits,
+            timestamp=self.center_time,
+            hits=self.hits,
+        )
+
+
+def iou(
+    a: tuple[float, float, float, float],
+    b: tuple[float, float, float, float],
+) -> float:
+    """Intersection over union of two (x_center, y_center, width, height) boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    width = min(ax + aw / 2, bx + bw / 2) - max(ax - aw / 2, bx - bw / 2)
+    height = min(ay + ah / 2, by + bh / 2) - max(ay - ah / 2, by - bh / 2)
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    return intersection / (aw * ah + bw * bh - intersection)
+
+
+class BrickTracker:
+    """Tracks bricks across frames and fuses their class votes."""
+
+    def __init__(
+        self,
+        conveyor_belt: Any,
+        mm_per_pixel: float,
+        image_height: int = 640,
+        min_iou: float = 0.3,
+        max_distance: float = 0.1,
+        max_age: float = 0.5,  # seconds
+        min_hits: int = 2,
+    ) -> None:
+        """Initialize the tracker.
+
+        Args:
+            conveyor_belt: Provides the belt speed (mm/s) to predict motion,
+                and observed_displacement() to measure it.
+            mm_per_pixel: Size of one camera pixel on the belt surface (mm).
+            image_height: Height of the (rotated) camera frames in pixels,
+                along the direction of belt travel.
+            min_iou: Minimum IoU between a predicted track box and a new
+                detection to match them.
+            max_distance: Otherwise, maximum normalized centroid distance.
+            max_age: A track that isn't seen for this long is finished.
+            min_hits: Tracks seen in fewer frames are discarded as noise.
+        """
+        self.conveyor_belt = conveyor_belt
+        self._mm_per_pixel = mm_per_pixel
+        self._image_height = image_height
+        self._min_iou = min_iou
+        self._max_distance = max_distance
+        self._max_age = max_age
+        self._min_hits = min_hits
+        self._tracks: list[Track] = []
+        self._next_id = 1
+        self._last_timestamp: float | None = None
+        self.decisions = 0
+        self.discarded = 0
+
+    @property
+    def tracks(self) -> list[Track]:
+        """The active tracks, oldest first."""
+        return list(self._tracks)
+
+    def _displacement(self, elapsed: float) -> float:
+        """Predicted normalized downward motion of the belt over elapsed seconds."""
+        pixels = self.conveyor_belt.speed * elapsed / self._mm_per_pixel
+        return pixels / self._image_height
+
+    def update(
+        self,
+        hypotheses: list[Hypothesis],
+        timestamp: float,
+    ) -> list[TrackDecision]:
+        """Add the detections of one frame.
+
+        Call this for every frame, even if nothing was detected, so that
+        finished tracks are emitted.
+
+        Args:
+            hypotheses: Detections in the frame, in full-frame coordinates.
+            timestamp: Capture time of the frame (seconds).
+
+        Returns:
+            Decisions for the bricks whose tracks finished with this frame.
+        """
+        elapsed = 0.0
+        if self._last_timestamp is not None:
+            elapsed = max(0.0, timestamp - self._last_timestamp)
+        self._last_timestamp = timestamp
+
+        # Move all tracks along with the belt.
+        dy = self._displacement(elapsed)
+        for track in self._tracks:
+            x, y, width, height = track.box
+            track.box = (x, y + dy, width, height)
+
+        # Greedy matching, best pairs first.
+        pairs = []
+        for t, track in enumerate(self._tracks):
+            for h, hypo in enumerate(hypotheses):
+                box = (hypo.x_center, hypo.y_center, hypo.width, hypo.height)
+                overlap = iou(track.box, box)
+                if overlap >= self._min_iou:
+                    pairs.append((overlap, 0.0, t, h))
+                    continue
+                distance = (
+                    (track.box[0] - box[0]) ** 2 + (track.box[1] - box[1]) ** 2
+                ) ** 0.5
+                if distance <= self._max_distance:
+                    pairs.append((0.0, -distance, t, h))
+        pairs.sort(reverse=True)
+
+        matched_tracks: set[int] = set()
+        matched_hypotheses: set[int] = set()
+        for _, _, t, h in pairs:
+            if t in matched_tracks or h in matched_hypotheses:
+                continue
+            matched_tracks.add(t)
+            matched_hypotheses.add(h)
+            track = self._tracks[t]
+            if timestamp > track.last_seen:
+                # Measured since the last sighting, which may be several
+                # frames ago, e.g. if the motion gate skipped frames.
+                moved = hypotheses[h].y_center - track.last_y
+                self.conveyor_belt.observed_displacement(
+                    moved * self._image_height, timestamp - track.last_seen, timestamp
+                )
+            track.hits += 1
+            track.observe(hypotheses[h], timestamp)
+
+        for h, hypo in enumerate(hypotheses):
+            if h in matched_hypotheses:
+                continue
+            track = Track(
+                track_id=self._next_id,
+                box=(hypo.x_center, hypo.y_center, hypo.width, hypo.height),
+                last_seen=timestamp,
+            )
+            track.observe(hypo, timestamp)
+            self._next_id += 1
+            self._tracks.append(track)
+
+        finished = [
+            track
+            for track in self._tracks
+            if timestamp - track.last_seen > self._max_age
+            or track.box[1] - track.box[3] / 2 > 1.0
+        ]
+        for track in finished:
+            self._tracks.remove(track)
+        return self._decide(finished)
+
+    def flush(self) -> list[TrackDecision]:
+        """Finish all active tracks, e.g. on shutdown."""
+        finished = self._tracks
+        self._tracks = []
+        return self._decide(finished)
+
+    def _decide(self, finished: list[Track]) -> list[TrackDecision]:
+        decisions = []
+        for track in finished:
+            if track.hits < self._min_hits:
+                self.discarded += 1
+                continue
+            decisions.append(track.decide())
+        self.decisions += len(decisions)
+        return decisions
+
+    def report(self) -> str:
+        """Return a human-readable summary of emitted and discarded tracks."""
+        return (
+            f"tracker: {self.decisions} bricks, {self.discarded} discarded,"
+            f" {len(self._tracks)} active"
+        )
@@ -0,0 +1,112 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from brick_camera import Hypothesis
+from brick_tracker import BrickTracker, iou
+
+
+def make_belt(speed: float) -> MagicMock:
+    belt = MagicMock()
+    belt.speed = speed
+    return belt
+
+
+def hypo(class_name: str, y: float, confidence: float = 0.8, x: float = 0.5):
+    return Hypothesis(confidence, x, y, 0.1, 0.1, 0, class_name)
+
+
+def test_iou():
+    box = (0.5, 0.5, 0.2, 0.2)
+    assert iou(box, box) == pytest.approx(1.0)
+    assert iou(box, (0.6, 0.5, 0.2, 0.2)) == pytest.approx(1 / 3)
+    assert iou(box, (0.9, 0.9, 0.2, 0.2)) == 0.0
+
+
+def test_one_decision_per_brick():
+    # 64 mm/s at 0.5 mm per pixel is 128 px/s, i.e. 0.2 of a 640 px frame.
+    tracker = BrickTracker(make_belt(64.0), mm_per_pixel=0.5, max_age=0.3)
+    decisions = []
+    for i in range(5):
+        t = i * 0.5
+        decisions += tracker.update([hypo("3001_brick_2x4", 0.1 + 0.1 * i)], t)
+    assert decisions == []
+    assert len(tracker.tracks) == 1
+
+    decisions = tracker.update([], 3.0)
+    assert len(decisions) == 1
+    decision = decisions[0]
+    assert decision.class_name == "3001_brick_2x4"
+    assert decision.hits == 5
+    assert decision.confidence == pytest.approx(0.8)
+    assert decision.timestamp == 2.0  # y=0.5, on the mid-line.
+    assert tracker.tracks == []
+
+
+def test_reports_brick_motion_to_belt():
+    belt = make_belt(64.0)
+    tracker = BrickTracker(belt, mm_per_pixel=0.5)
+    tracker.update([hypo("3001_brick_2x4", 0.1)], 0.0)
+    tracker.update([hypo("3001_brick_2x4", 0.15)], 0.25)
+    # 0.05 of 640 px in 0.25 s.
+    pixels, elapsed, timestamp = belt.observed_displacement.call_args.args
+    assert pixels == pytest.approx(32.0)
+    assert (elapsed, timestamp) == (0.25, 0.25)
+
+
+def test_reports_brick_motion_since_last_sighting():
+    belt = make_belt(64.0)
+    tracker = BrickTracker(belt, mm_per_pixel=0.5)
+    tracker.update([hypo("3001_brick_2x4", 0.1)], 0.0)
+    tracker.update([], 0.1)  # Missed, or skipped by the motion gate.
+    tracker.update([hypo("3001_brick_2x4", 0.14)], 0.2)
+    # 0.04 of 640 px in 0.2 s, not in the 0.1 s since the previous frame.
+    pixels, elapsed, timestamp = belt.observed_displacement.call_args.args
+    assert pixels == pytest.approx(25.6)
+    assert (elapsed, timestamp) == (0.2, 0.2)
+
+
+def test_fuses_class_votes():
+    tracker = BrickTracker(make_belt(0.0), mm_per_pixel=0.5)
+    tracker.update([hypo("3001_brick_2x4", 0.5, 0.6)], 0.0)
+    tracker.update([hypo("3003_brick_2x2", 0.5, 0.9)], 0.1)
+    tracker.update([hypo("3001_brick_2x4", 0.5, 0.5)], 0.2)
+    decisions = tracker.flush()
+    assert len(decisions) == 1
+    assert decisions[0].class_name == "3001_brick_2x4"  # 1.1 votes vs. 0.9
+    assert decisions[0].confidence == pytest.approx(1.1 / 3)
+
+
+def test_separate_bricks_get_separate_tracks():
+    tracker = BrickTracker(make_belt(0.0), mm_per_pixel=0.5)
+    for t in (0.0, 0.1):
+        tracker.update(
+            [hypo("3001_brick_2x4", 0.3, x=0.2), hypo("3003_brick_2x2", 0.3, x=0.8)],
+            t,
+        )
+    assert [track.track_id for track in tracker.tracks] == [1, 2]
+    names = sorted(decision.class_name for decision in tracker.flush())
+    assert names == ["3001_brick_2x4", "3003_brick_2x2"]
+
+
+def test_prediction_matches_fast_bricks():
+    # Each frame the brick moves 0.3 of the frame height, so its box doesn't
+    # overlap the previous one, but it does overlap the predicted position.
+    tracker = BrickTracker(
+        make_belt(96.0), mm_per_pixel=0.5, max_distance=0.0, max_age=5.0
+    )
+    tracker.update([hypo("3001_brick_2x4", 0.1)], 0.0)
+    tracker.update([hypo("3001_brick_2x4", 0.4)], 1.0)
+    assert len(tracker.tracks) == 1
+
+    # Leaving the bottom of the frame finishes the track immediately.
+    decisions = tracker.update([], 3.5)
+    assert [decision.hits for decision in decisions] == [2]
+
+
+def test_single_frame_tracks_are_discarded():
+    tracker = BrickTracker(make_belt(0.0), mm_per_pixel=0.5, max_age=0.5)
+    tracker.update([hypo("3001_brick_2x4", 0.5)], 0.0)
+    assert tracker.update([], 1.0) == []
+    assert tracker.discarded == 1
+    assert tracker.report() == "tracker: 0 bricks, 1 discarded, 0 active"
@@ -0,0 +1,86 @@
+"""Timestamps camera frames at their estimated exposure time.
+
+All sorter timing (frame timestamps, belt calibration and servo events)
+uses the monotonic clock, so NTP adjustments of the wall clock can't shift
+a kick. Frames are grabbed some time after the sensor exposed them, because
+the driver buffers them; this delay is estimated from the driver's frame
+timestamps (CAP_PROP_POS_MSEC) when available, plus a fixed latency that
+can be measured once per camera.
+"""
+
+import time
+from collections import deque
+from collections.abc import Callable
+
+import cv2
+
+
+def monotonic() -> float:
+    """The sorter clock in seconds: time.monotonic_ns(), immune to NTP steps."""
+    return time.monotonic_ns() / 1e9
+
+
+class CaptureClock:
+    """Estimates the monotonic exposure time of grabbed frames.
+
+    Driver frame timestamps don't share a time base with our clock, so their
+    offset is estimated as the smallest observed (grab time - driver time)
+    over a window of recent frames: the frame that was delivered fastest.
+    Each exposure time is then its driver time plus that offset. Without
+    driver timestamps, the grab time is used. In both cases the fixed
+    latency is subtracted.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,  # seconds
+        use_driver_timestamps: bool = True,
+        window: int = 300,  # frames
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        """Initialize the clock.
+
+        Args:
+            latency: Measured delay between exposure and delivery of the
+                fastest frames, e.g. by filming a LED toggled at known times.
+            use_driver_timestamps: Use CAP_PROP_POS_MSEC if the driver
+                provides increasing values.
+            window: Number of frames over which the driver offset is
+                estimated, so that it follows slow drift between the clocks.
+            clock: Returns the current time in seconds.
+        """
+        self._latency = latency
+        self._use_driver_timestamps = use_driver_timestamps
+        self._clock = clock
+        self._offsets: deque[float] = deque(maxlen=window)
+        self._last_position: float | None = None
+
+    def exposure_time(self, grab_time: float, position_ms: float) -> float:
+        """Estimate when a frame was exposed.
+
+        Args:
+            grab_time: Time (seconds, our clock) when the frame was grabbed.
+            position_ms: The driver timestamp of the frame (CAP_PROP_POS_MSEC),
+                or 0.0 if not available.
+        """
+        position = position_ms / 1000
+        valid = (
+            self._use_driver_timestamps
+            and position > 0
+            and (self._last_position is None or position > self._last_position)
+        )
+        if not valid:
+            # Non-increasing timestamps mean the driver doesn't provide them,
+            # or it restarted; start the offset estimate over.
+            self._offsets.clear()
+            self._last_position = None
+            return grab_time - self._latency
+
+        self._last_position = position
+        self._offsets.append(grab_time - position)
+        return position + min(self._offsets) - self._latency
+
+    def timestamp(self, cap: cv2.VideoCapture) -> float:
+        """Timestamp a frame right after cap.grab() returned it."""
+        grab_time = self._clock()
+        return self.exposure_time(grab_time, cap.get(cv2.CAP_PROP_POS_MSEC))
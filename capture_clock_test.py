@@ -0,0 +1,51 @@
+import time
+from unittest.mock import MagicMock
+
+import cv2
+import pytest
+
+from capture_clock import CaptureClock, monotonic
+
+
+def test_monotonic_matches_time_monotonic():
+    assert abs(monotonic() - time.monotonic()) < 0.01
+
+
+def test_without_driver_timestamps():
+    clock = CaptureClock(latency=0.03)
+    assert clock.exposure_time(10.0, 0.0) == pytest.approx(9.97)
+
+    clock = CaptureClock(latency=0.03, use_driver_timestamps=False)
+    assert clock.exposure_time(10.0, 5000.0) == pytest.approx(9.97)
+
+
+def test_driver_timestamps_remove_delivery_jitter():
+    clock = CaptureClock(latency=0.01)
+    # Frames exposed every 100 ms (driver time 5.0 s, 5.1 s, ...) and
+    # delivered 20, 50 and 30 ms later (our clock is 100 s ahead).
+    assert clock.exposure_time(105.02, 5000.0) == pytest.approx(105.01)
+    assert clock.exposure_time(105.15, 5100.0) == pytest.approx(105.11)
+    assert clock.exposure_time(105.23, 5200.0) == pytest.approx(105.21)
+
+
+def test_driver_restart_resets_offset():
+    clock = CaptureClock()
+    clock.exposure_time(105.02, 5000.0)
+    assert clock.exposure_time(106.0, 10.0) == pytest.approx(106.0)
+    assert clock.exposure_time(106.1, 110.0) == pytest.approx(106.1)
+
+
+def test_offset_window_follows_drift():
+    clock = CaptureClock(window=2)
+    clock.exposure_time(100.00, 1000.0)  # Offset 99.0
+    clock.exposure_time(100.12, 1100.0)  # Offset 99.02
+    clock.exposure_time(100.22, 1200.0)  # Offset 99.02, 99.0 dropped.
+    assert clock.exposure_time(100.33, 1300.0) == pytest.approx(100.32)
+
+
+def test_timestamp_reads_driver_position():
+    cap = MagicMock()
+    cap.get.return_value = 2000.0
+    clock = CaptureClock(clock=lambda: 50.0)
+    assert clock.timestamp(cap) == pytest.approx(50.0)
+    cap.get.assert_called_once_with(cv2.CAP_PROP_POS_MSEC)
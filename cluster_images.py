@@ -7,9 +7,15 @@ import random
 import sys
 from pathlib import Path
 from datetime import datetime
+
+import numpy as np
+
+from scan_index import ScanIndex, timestamp_ms, to_datetime
 from yolo_exporter import YoloExporter
 
 MIN_CLUSTERS_PER_CLASS = 20
+# Exporting is I/O bound: probing JPEG headers, linking and writing labels.
+EXPORT_WORKERS = 16
 
 
 def parse_timestamp(filename: str) -> datetime:
@@ -18,51 +24,45 @@ def parse_timestamp(filename: str) -> datetime:
     Example: 20230523_105352366_... ->
       datetime(2023, 5, 23, 10, 53, 52, 366000)
     """
-    parts = filename.split("_")
-    ts_str = parts[0] + parts[1]  # YYYYmmdd + HHMMSSfff
-    return datetime.strptime(ts_str, "%Y%m%d%H%M%S%f")
+    return to_datetime(timestamp_ms(filename))
 
 
 def cluster_images_in_directory(
     input_dir: Path,
     gap_threshold_seconds: float = 0.5,
+    index: ScanIndex | None = None,
 ) -> list[list[tuple[datetime, Path]]]:
-    filenames = sorted(input_dir.glob("*.jpg"))
-    if not filenames:
-        return []
-
-    # Parse timestamps and store with original filename
-    data = []
-    for path in filenames:
-        try:
-            dt = parse_timestamp(path.name)
-            data.append((dt, path))
-        except (ValueError, IndexError):
-            continue
+    if index is not None:
+        # Already parsed and sorted.
+        data = index.images(input_dir)
+    else:
+        # Parse timestamps (in milliseconds) and store with original filename
+        data = []
+        for path in input_dir.glob("*.jpg"):
+            try:
+                data.append((timestamp_ms(path.name), path))
+            except (ValueError, IndexError):
+                continue
+
+        # Sort by timestamp, then by filename
+        data.sort()
 
-    # Sort by datetime
-    data.sort()
-
-    clusters = []
     if not data:
         return []
 
-    current_cluster = [data[0]]
-
-    for i in range(1, len(data)):
-        prev_dt, _ = data[i - 1]
-        curr_dt, name = data[i]
-
-        gap = (curr_dt - prev_dt).total_seconds()
-
-        if gap <= gap_threshold_seconds:
-            current_cluster.append(data[i])
-        else:
-            clusters.append(current_cluster)
-            current_cluster = [data[i]]
-
-    clusters.append(current_cluster)
-    return clusters
+    # Split wherever the gap to the previous image exceeds the threshold.
+    # Dividing the integer milliseconds rounds exactly like total_seconds().
+    times = np.array([ms for ms, _ in data], dtype=np.int64)
+    splits = np.flatnonzero(np.diff(times) / 1000 > gap_threshold_seconds) + 1
+    datetimes = times.astype("datetime64[ms]").astype(object)
+    paths = [path for _, path in data]
+    return [
+        list(zip(dts, cluster_paths))
+        for dts, cluster_paths in zip(
+            np.split(datetimes, splits),
+            np.split(np.array(paths, dtype=object), splits),
+        )
+    ]
 
 
 def print_summary(sets: dict[str, list], total_clusters: int) -> None:
@@ -95,13 +95,22 @@ def find_paths_with_jpg_files(path: Path) -> list[Path]:
 def cluster_and_filter_by_class(
     exporter: YoloExporter,
     root_dirs: list[Path],
+    index: ScanIndex | None = None,
 ) -> dict[str, list[list[tuple[datetime, Path]]]]:
-    """Finds images in root_dirs, clusters them, and filters by class count."""
+    """Finds images in root_dirs, clusters them, and filters by class count.
+
+    With an index (of the single root dir), the images are read from it
+    instead of scanning the directory tree.
+    """
     clusters_by_class = defaultdict(list)
 
     for root_dir in root_dirs:
-        for class_dir in find_paths_with_jpg_files(root_dir):
-            class_clusters = cluster_images_in_directory(class_dir)
+        if index is not None:
+            class_dirs = index.dirs_with_jpg_files()
+        else:
+            class_dirs = find_paths_with_jpg_files(root_dir)
+        for class_dir in class_dirs:
+            class_clusters = cluster_images_in_directory(class_dir, index=index)
             class_name = exporter.path_to_class(class_dir)
             clusters_by_class[class_name].extend(class_clusters)
 
@@ -152,13 +161,28 @@ def export_cluster(
 def main(argv: list[str]) -> None:
     input_dir = Path(argv[1]) if len(argv) > 1 else Path(".")
     output_dir = Path(argv[2]) if len(argv) > 2 else Path("../yolo_dataset")
+    # Optional SQLite scan index, to avoid rescanning the input directory.
+    index_path = Path(argv[3]) if len(argv) > 3 else None
 
     # Initialize YoloExporter
     exporter = YoloExporter(
         input_dir=input_dir,
         output_dir=output_dir,
+        workers=EXPORT_WORKERS,
+        incremental=True,
     )
-    clusters_by_class = cluster_and_filter_by_class(exporter, [input_dir])
+    if index_path is not None:
+        with ScanIndex(index_path, input_dir) as index:
+            index.update()
+            print(
+                f"scan index: {index.scanned_dirs} directories scanned,"
+                f" {index.unchanged_dirs} unchanged"
+            )
+            clusters_by_class = cluster_and_filter_by_class(
+                exporter, [input_dir], index
+            )
+    else:
+        clusters_by_class = cluster_and_filter_by_class(exporter, [input_dir])
 
     # Set seed for reproducibility
     random.seed(42)
@@ -205,7 +229,9 @@ def main(argv: list[str]) -> None:
                 )
                 current_cluster_idx += 1
 
+    exporter.finish()
     exporter.write_yaml()
+    print(f"exported {exporter.num_exported} images, {exporter.num_skipped} unchanged")
     print_summary(sets, total_clusters)
 
 
@@ -1,5 +1,8 @@
+import random
+from itertools import pairwise
+
 import pytest
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 from unittest.mock import patch, MagicMock, call
 from cluster_images import (
@@ -10,6 +13,7 @@ from cluster_images import (
     export_cluster,
     find_paths_with_jpg_files,
 )
+from scan_index import ScanIndex
 
 
 def test_parse_timestamp():
@@ -45,6 +49,27 @@ def test_cluster_images_basic(tmp_path):
     assert clusters[1][0][1] == tmp_path / "20230523_105354000_c.jpg"
 
 
+def test_cluster_images_like_loop(tmp_path):
+    rng = random.Random(1)
+    t = datetime(2023, 5, 23, 10, 0, 0)
+    for i in range(200):
+        t += timedelta(milliseconds=rng.choice([0, 1, 299, 300, 301, 5000]))
+        (tmp_path / f"{t:%Y%m%d_%H%M%S}{t.microsecond // 1000:03d}_{i}.jpg").touch()
+
+    # The clustering loop that the NumPy version replaced.
+    data = sorted((parse_timestamp(path.name), path) for path in tmp_path.glob("*.jpg"))
+    expected = [[data[0]]]
+    for previous, current in pairwise(data):
+        if (current[0] - previous[0]).total_seconds() <= 0.3:
+            expected[-1].append(current)
+        else:
+            expected.append([current])
+
+    clusters = cluster_images_in_directory(tmp_path, gap_threshold_seconds=0.3)
+    assert clusters == expected
+    assert 1 < len(clusters) < 200
+
+
 def test_find_paths_with_jpg_files(tmp_path):
     # Setup real file structure
     dir_with_jpg = tmp_path / "dir1"
@@ -219,3 +244,26 @@ def test_per_class_split(tmp_path):
     # train: 6 clusters -> 6 export calls
     # Total calls = 18
     assert exporter.export_file.call_count == 18
+
+
+def test_cluster_with_scan_index(tmp_path):
+    class_dir = tmp_path / "input" / "class_a"
+    class_dir.mkdir(parents=True)
+    for i in range(5):
+        for j in range(3):
+            (class_dir / f"20230523_10{i:02d}00{j:03d}_foo.jpg").touch()
+    (class_dir / "invalid_name.jpg").touch()
+
+    exporter = MagicMock()
+    exporter.path_to_class.return_value = "class_a"
+    with (
+        patch("cluster_images.MIN_CLUSTERS_PER_CLASS", 1),
+        ScanIndex(tmp_path / "index.sqlite", tmp_path / "input") as index,
+    ):
+        index.update()
+        assert cluster_images_in_directory(
+            class_dir, index=index
+        ) == cluster_images_in_directory(class_dir)
+        assert cluster_and_filter_by_class(
+            exporter, [tmp_path / "input"], index
+        ) == cluster_and_filter_by_class(exporter, [tmp_path / "input"])
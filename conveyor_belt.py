@@ -1,8 +1,46 @@
-import statistics
+import bisect
+import math
+from collections import deque
+from operator import itemgetter
+
+
+def _within(value: float, mean: float) -> bool:
+    """Whether a value is within [3/4, 4/3] * mean, i.e. not an outlier."""
+    return 3 / 4 * mean < value < 4 / 3 * mean
+
+
+# Sort key of the brick registry: the camera pass time of a brick.
+_pass_time = itemgetter(0)
+
+# Brick motion samples and estimates further apart than this many standard
+# errors disagree.
+MAX_SIGMAS = 4.0
+# Number of consecutive, agreeing motion outliers that show a speed change.
+MOTION_RESTART = 5
 
 
 class ConveyorBelt:
-    """Tracks the speed of a conveyor belt and predicts object arrival times."""
+    """Tracks the speed of a conveyor belt and predicts object arrival times.
+
+    The speed is estimated from the rotation times of all marks jointly: the
+    mean over a window of recent intervals, kept as running sums so that each
+    sighting updates it in O(1). The speed and its standard error are plain
+    attributes, because they are read for every brick.
+
+    Marks pass the camera only once per rotation, so the speed is also
+    measured from how far tracked bricks move between frames, averaged over
+    a short time window. Both estimates are fused by inverse-variance
+    weighting, so speed changes show up within about one window. If the
+    brick motion disagrees with the marks by more than their standard
+    errors allow, the belt speed changed since the last marks, and the
+    motion estimate is used alone until the marks catch up.
+
+    The belt also keeps a registry of the bricks in flight, sorted by the
+    time they passed the camera. That order is their order along the belt,
+    independent of the speed, so queries about which bricks pass a kicker
+    when are bisections. Bricks that passed in the same frame share a
+    timestamp, so each one also carries a unique id.
+    """
 
     def __init__(
         self,
@@ -10,6 +48,9 @@ class ConveyorBelt:
         min_intervals: int = 3,
         max_intervals: int = 10,
         kicker_distances: dict[str, float] | None = None,
+        mm_per_pixel: float = 0.5,
+        motion_window: float = 1.0,  # seconds
+        sighting_error: float = 1 / 30,  # seconds
     ) -> None:
         """
         Initialize the conveyor belt.
@@ -19,18 +60,130 @@ class ConveyorBelt:
             min_intervals: Minimum number of intervals to make predictions.
             max_intervals: Maximum number of intervals to keep for calibration.
             kicker_distances: dict mapping kicker labels to distance from camera (mm).
+            mm_per_pixel: Size of one camera pixel on the belt surface (mm),
+                to convert brick displacements.
+            motion_window: Time window over which brick displacements are
+                averaged (seconds).
+            sighting_error: Standard error of the time of a mark sighting,
+                about one frame (seconds).
         """
         self.length = length
         self._min_intervals = min_intervals
         self._max_intervals = max_intervals
         self._last_seen: dict[str, float] = {}
-        self._intervals: list[float] = []
+        self._intervals: deque[float] = deque()
+        self._sum = 0.0
+        self._sum_squares = 0.0
+        # Consecutive intervals rejected as outliers.
+        self._rejected: list[float] = []
         self._kicker_distances = kicker_distances or {}
+        # (camera pass time, brick id) of the bricks in flight, sorted by time.
+        self._bricks: list[tuple[float, int]] = []
+        self._mm_per_pixel = mm_per_pixel
+        self._motion_window = motion_window
+        self._sighting_error = sighting_error
+        # Speed and variance from mark intervals alone.
+        self._mark_speed = 0.0
+        self._mark_variance = 0.0
+        # (timestamp, speed, elapsed) samples from brick displacements.
+        self._motion: deque[tuple[float, float, float]] = deque()
+        self._motion_sum = 0.0
+        self._motion_sum_squares = 0.0
+        self._motion_elapsed = 0.0
+        # Consecutive displacement samples rejected as outliers.
+        self._motion_rejected: list[tuple[float, float, float]] = []
+        # Current speed (mm/s) and its standard error, or 0.0 if not
+        # enough calibration data is available.
+        self.speed = 0.0
+        self.speed_stddev = 0.0
+        self.outliers = 0
+        self.motion_outliers = 0
 
     def get_kicker_distance(self, label: str) -> float:
         """Get the distance from the camera to a kicker servo by its label."""
         return self._kicker_distances.get(label, 0.0)
 
+    @property
+    def bricks(self) -> list[tuple[float, int]]:
+        """(camera pass time, id) of the bricks in flight, in order along the belt."""
+        return list(self._bricks)
+
+    def add_brick(self, timestamp: float, brick_id: int) -> None:
+        """
+        Register a brick that passed the camera mid-line.
+
+        Args:
+            timestamp: Time (seconds) when the brick passed the camera mid-line.
+            brick_id: Identifies the brick, e.g. its tracker track id.
+        """
+        bisect.insort(self._bricks, (timestamp, brick_id), key=_pass_time)
+
+    def forget_passed(self, now: float, margin: float = 0.0) -> None:
+        """
+        Drop the bricks that have passed the last kicker.
+
+        Args:
+            now: The current time (seconds).
+            margin: Keep bricks until they are this far past the last kicker (mm).
+        """
+        distance = max(self._kicker_distances.values(), default=0.0)
+        horizon = self.predict_travel_time(distance + margin)
+        del self._bricks[
+            : bisect.bisect_left(self._bricks, now - horizon, key=_pass_time)
+        ]
+
+    def bricks_passing(
+        self, label: str, start: float, end: float
+    ) -> list[tuple[float, int]]:
+        """
+        Find the bricks that pass a kicker in a time window.
+
+        Args:
+            label: The kicker label.
+            start: Start of the window (seconds).
+            end: End of the window (seconds).
+
+        Returns:
+            (camera pass time, id) of the bricks, or [] if not enough
+            calibration data.
+        """
+        travel_time = self.predict_travel_time(self.get_kicker_distance(label))
+        if travel_time <= 0:
+            return []
+
+        first = bisect.bisect_left(self._bricks, start - travel_time, key=_pass_time)
+        last = bisect.bisect_right(self._bricks, end - travel_time, key=_pass_time)
+        return self._bricks[first:last]
+
+    def next_gap(self, label: str, earliest: float, length: float) -> float:
+        """
+        Find when the next empty stretch of belt starts passing a kicker.
+
+        Args:
+            label: The kicker label.
+            earliest: The stretch may not start passing before this time (s).
+            length: Minimum length of the stretch without bricks (mm).
+
+        Returns:
+            The time (seconds) when the stretch starts passing the kicker,
+            or earliest if not enough calibration data.
+        """
+        travel_time = self.predict_travel_time(self.get_kicker_distance(label))
+        if travel_time <= 0:
+            return earliest
+
+        duration = length / self.speed
+        start = earliest
+        i = bisect.bisect_right(self._bricks, earliest - travel_time, key=_pass_time)
+        # Only the bricks in the way are visited.
+        while i < len(self._bricks):
+            passing_time = self._bricks[i][0] + travel_time
+            if passing_time >= start + duration:
+                break
+            start = passing_time
+            i += 1
+        return start
+
     def observed_mark_at(self, mark: str, timestamp: float) -> None:
         """
         Record a sighting of a permanent mark on the belt at a specific time.
@@ -45,40 +198,178 @@ class ConveyorBelt:
             # One interval represents one full rotation of the belt.
             interval = timestamp - last_timestamp
             if interval > 0:
-                self._intervals.append(interval)
-                # Keep only the most recent intervals.
-                while len(self._intervals) > self._max_intervals:
-                    self._intervals.pop(0)
+                self._add_interval(interval)
 
         self._last_seen[mark] = timestamp
+        self._expire_motion(timestamp)
+        self._update_speed()
 
-    @property
-    def speed(self) -> float:
+    def observed_displacement(
+        self,
+        pixels: float,
+        elapsed: float,
+        timestamp: float,
+    ) -> None:
         """
-        Returns the current belt speed in millimeters per second (mm/s).
+        Record how far a tracked brick moved along the belt between two sightings.
 
-        Discards obvious outliers (intervals outside [3/4, 4/3] * median).
+        Ignored until the marks have calibrated the speed. A sample more than
+        MAX_SIGMAS standard errors off the current speed is an outlier, e.g.
+        because the tracker mixed up two bricks. If MOTION_RESTART
+        consecutive outliers agree with each other, the belt speed really
+        changed, and the motion window restarts from them.
 
-        Returns:
-            Current speed, or 0.0 if not enough calibration data is available.
+        Args:
+            pixels: Displacement in the direction of belt travel (pixels).
+            elapsed: Time between the two sightings (seconds).
+            timestamp: Time of the later sighting (seconds).
         """
-        if len(self._intervals) < self._min_intervals:
-            return 0.0
+        if elapsed <= 0 or self._mark_speed <= 0:
+            return
+        sample = (timestamp, pixels * self._mm_per_pixel / elapsed, elapsed)
+        if self._is_motion_outlier(sample):
+            self.motion_outliers += 1
+            self._motion_rejected.append(sample)
+            if len(self._motion_rejected) < MOTION_RESTART:
+                return
+            speeds = [speed for _, speed, _ in self._motion_rejected]
+            rejected_mean = sum(speeds) / len(speeds)
+            if any(
+                abs(speed - rejected_mean) > MAX_SIGMAS * self._pixel_error(elapsed)
+                for _, speed, elapsed in self._motion_rejected
+            ):
+                self._motion_rejected.pop(0)
+                return
+            # The speed really changed, restart the window.
+            self._motion.clear()
+            self._motion_sum = self._motion_sum_squares = self._motion_elapsed = 0.0
+            samples, self._motion_rejected = self._motion_rejected, []
+        else:
+            self._motion_rejected.clear()
+            samples = [sample]
 
-        # Discard obvious outliers using the median.
-        median = statistics.median(self._intervals)
-        below = 3 / 4 * median
-        above = 4 / 3 * median
-        clean_intervals = [i for i in self._intervals if below < i < above]
+        for sample_time, speed, sample_elapsed in samples:
+            self._motion.append((sample_time, speed, sample_elapsed))
+            self._motion_sum += speed
+            self._motion_sum_squares += speed * speed
+            self._motion_elapsed += sample_elapsed
+        self._expire_motion(timestamp)
+        self._update_speed()
 
-        if len(clean_intervals) < self._min_intervals:
-            return 0.0
+    def _pixel_error(self, elapsed: float) -> float:
+        """Speed error (mm/s) of a displacement with one pixel error per sighting."""
+        return math.sqrt(2) * self._mm_per_pixel / elapsed
 
-        avg_interval = statistics.mean(clean_intervals)
-        if avg_interval <= 0:
-            return 0.0
+    def _is_motion_outlier(self, sample: tuple[float, float, float]) -> bool:
+        """Whether a displacement sample is too far off the current speed.
+
+        Its expected deviation combines the standard error of the speed and
+        the spread of single samples: that of the recent samples, but at
+        least one pixel per sighting.
+        """
+        _, speed, elapsed = sample
+        variance = self._pixel_error(elapsed) ** 2
+        count = len(self._motion)
+        if count >= 2:
+            mean = self._motion_sum / count
+            variance = max(variance, self._motion_sum_squares / count - mean * mean)
+        sigma = math.sqrt(self.speed_stddev**2 + variance)
+        return abs(speed - self.speed) > MAX_SIGMAS * sigma
+
+    def _expire_motion(self, timestamp: float) -> None:
+        """Drop brick displacements that are older than the motion window."""
+        while self._motion and self._motion[0][0] <= timestamp - self._motion_window:
+            _, speed, elapsed = self._motion.popleft()
+            self._motion_sum -= speed
+            self._motion_sum_squares -= speed * speed
+            self._motion_elapsed -= elapsed
+
+    def _add_interval(self, interval: float) -> None:
+        """
+        Add an interval to the window, unless it is an outlier.
+
+        Intervals outside [3/4, 4/3] * the current mean are outliers, e.g.
+        when a mark wasn't recognized in one rotation. If min_intervals
+        consecutive outliers agree with each other, the belt speed really
+        changed, and the window restarts from them.
+        """
+        if self._intervals and not _within(interval, self._sum / len(self._intervals)):
+            self.outliers += 1
+            self._rejected.append(interval)
+            if len(self._rejected) < self._min_intervals:
+                return
+            rejected_mean = sum(self._rejected) / len(self._rejected)
+            if not all(_within(i, rejected_mean) for i in self._rejected):
+                self._rejected.pop(0)
+                return
+            # The speed really changed, restart the window.
+            self._intervals.clear()
+            self._sum = self._sum_squares = 0.0
+            intervals, self._rejected = self._rejected, []
+        else:
+            intervals = [interval]
+            self._rejected.clear()
+
+        for i in intervals:
+            self._append(i)
+        self._update_mark_speed()
+
+    def _append(self, interval: float) -> None:
+        self._intervals.append(interval)
+        self._sum += interval
+        self._sum_squares += interval * interval
+        # Keep only the most recent intervals.
+        while len(self._intervals) > self._max_intervals:
+            oldest = self._intervals.popleft()
+            self._sum -= oldest
+            self._sum_squares -= oldest * oldest
+
+    def _update_mark_speed(self) -> None:
+        count = len(self._intervals)
+        if count < self._min_intervals:
+            self._mark_speed = self._mark_variance = 0.0
+            return
+
+        mean = self._sum / count
+        self._mark_speed = self.length / mean
+        # Variance of the mean interval, propagated to the speed
+        # (d speed / d interval = -length / interval^2). Each interval is
+        # at least as uncertain as the two sightings it is measured from.
+        variance = max(
+            self._sum_squares / count - mean * mean, 2 * self._sighting_error**2
+        )
+        self._mark_variance = (self.length / (mean * mean)) ** 2 * variance / count
+
+    def _update_speed(self) -> None:
+        """Fuse the mark and brick motion estimates by inverse variance."""
+        count = len(self._motion)
+        if self._mark_speed <= 0 or self._mark_variance <= 0 or count < 2:
+            self.speed = self._mark_speed
+            self.speed_stddev = math.sqrt(self._mark_variance)
+            return
 
-        return self.length / avg_interval
+        mean = self._motion_sum / count
+        # Each displacement is at least as uncertain as one pixel in both
+        # frames.
+        pixel_speed = self._mm_per_pixel * count / self._motion_elapsed
+        variance = max(
+            self._motion_sum_squares / count - mean * mean, 2 * pixel_speed**2
+        )
+        if (mean - self._mark_speed) ** 2 > MAX_SIGMAS**2 * (
+            self._mark_variance + variance / count
+        ):
+            # The speed changed since the marks were last seen.
+            self.speed = mean
+            self.speed_stddev = math.sqrt(variance / count)
+            return
+
+        mark_weight = 1 / self._mark_variance
+        motion_weight = count / variance
+        total_weight = mark_weight + motion_weight
+        self.speed = (
+            self._mark_speed * mark_weight + mean * motion_weight
+        ) / total_weight
+        self.speed_stddev = math.sqrt(1 / total_weight)
 
     def predict_travel_time(self, distance: float) -> float:
         """
@@ -90,8 +381,19 @@ class ConveyorBelt:
         Returns:
             Travel time in seconds (s), or 0.0 if not enough calibration data.
         """
-        current_speed = self.speed
-        if current_speed <= 0:
+        if self.speed <= 0:
+            return 0.0
+
+        return distance / self.speed
+
+    def travel_time_stddev(self, distance: float) -> float:
+        """
+        Standard error of predict_travel_time(distance) due to the uncertain speed.
+
+        Returns:
+            Standard error in seconds (s), or 0.0 if not enough calibration data.
+        """
+        if self.speed <= 0:
             return 0.0
 
-        return distance / current_speed
+        return distance * self.speed_stddev / (self.speed * self.speed)
@@ -117,3 +117,141 @@ def test_conveyor_belt_outlier_rejection():
     # Add another outlier (1.4s is > 4/3 * median)
     belt.observed_mark_at("m", 5.1)  # Interval 1.4
     assert belt.speed == 1000.0
+
+
+def test_conveyor_belt_speed_change_recovers():
+    belt = ConveyorBelt(length=1000, min_intervals=3)
+    for t in range(4):
+        belt.observed_mark_at("m", t)  # 1.0 s per rotation
+    assert belt.speed == 1000.0
+
+    # The belt slows down to 2.0 s per rotation: outliers at first.
+    for t in (5, 7):
+        belt.observed_mark_at("m", t)
+        assert belt.speed == 1000.0
+    belt.observed_mark_at("m", 9)
+    assert belt.speed == 500.0
+    assert belt.outliers == 3
+    assert len(belt._intervals) == 3
+
+
+def test_conveyor_belt_speed_stddev():
+    belt = ConveyorBelt(length=1000, min_intervals=2)
+    belt.observed_mark_at("m", 0.0)
+    belt.observed_mark_at("m", 2.0)
+    assert belt.speed_stddev == 0.0
+
+    belt.observed_mark_at("m", 3.6)  # Intervals 2.0 and 1.6, mean 1.8
+    # Interval stddev 0.2, standard error 0.2 / sqrt(2), times 1000 / 1.8^2.
+    assert belt.speed_stddev == pytest.approx(1000 / 1.8**2 * 0.2 / 2**0.5)
+    assert belt.travel_time_stddev(belt.speed) == pytest.approx(
+        belt.speed_stddev / belt.speed
+    )
+
+
+def test_conveyor_belt_travel_time_stddev_no_speed():
+    belt = ConveyorBelt(length=1000)
+    assert belt.travel_time_stddev(100) == 0.0
+
+
+def make_calibrated_belt() -> ConveyorBelt:
+    """A belt at 1000 mm/s, from marks with 0.1 s interval jitter."""
+    belt = ConveyorBelt(length=1000, min_intervals=2, mm_per_pixel=0.5)
+    for t in (0.0, 0.9, 2.0, 2.9):
+        belt.observed_mark_at("m", t)
+    # Intervals 0.9, 1.1, 0.9: mean 29/30 s.
+    return belt
+
+
+def test_conveyor_belt_displacement_before_calibration_is_ignored():
+    belt = ConveyorBelt(length=1000, mm_per_pixel=0.5)
+    belt.observed_displacement(60.0, 1 / 30, 0.0)
+    belt.observed_displacement(60.0, 1 / 30, 0.1)
+    assert belt.speed == 0.0
+
+
+def test_conveyor_belt_fuses_brick_motion():
+    belt = make_calibrated_belt()
+    mark_speed = belt.speed
+    mark_stddev = belt.speed_stddev
+    # The belt sags to 900 mm/s: 60 px of 0.5 mm every 1/30 s.
+    for i in range(1, 31):
+        belt.observed_displacement(60.0, 1 / 30, 2.9 + i / 30)
+    assert belt.speed < mark_speed
+    assert belt.speed == pytest.approx(900.0, abs=5.0)
+    assert belt.speed_stddev < mark_stddev
+
+    # Displacements expire after the motion window.
+    belt.observed_mark_at("n", 10.0)
+    assert belt.speed == mark_speed
+
+
+def test_conveyor_belt_rejects_displacement_outliers():
+    belt = make_calibrated_belt()
+    speed = belt.speed
+    belt.observed_displacement(10.0, 1 / 30, 3.0)  # Mismatched track.
+    belt.observed_displacement(10.0, 1 / 30, 3.1)
+    assert belt.speed == speed
+    assert belt.motion_outliers == 2
+
+
+def test_conveyor_belt_learns_speed_change_from_brick_motion():
+    belt = make_calibrated_belt()
+    mark_speed = belt.speed
+    # The belt slows down to 600 mm/s: 40 px of 0.5 mm every 1/30 s. That
+    # is far outside the standard error, so the first samples are outliers.
+    for i in range(1, 5):
+        belt.observed_displacement(40.0, 1 / 30, 2.9 + i / 30)
+    assert belt.speed == mark_speed
+    assert belt.motion_outliers == 4
+
+    # Consecutive outliers that agree are a real speed change.
+    for i in range(5, 31):
+        belt.observed_displacement(40.0, 1 / 30, 2.9 + i / 30)
+    assert belt.speed == pytest.approx(600.0)
+    assert belt.motion_outliers == 5
+
+    # A mismatched track is still an outlier at the new speed.
+    belt.observed_displacement(60.0, 1 / 30, 4.0)
+    assert belt.motion_outliers == 6
+    assert belt.speed == pytest.approx(600.0)
+
+
+def make_registry_belt() -> ConveyorBelt:
+    """A belt at 250 mm/s with a kicker 500 mm (2 s) from the camera."""
+    belt = ConveyorBelt(length=1000, min_intervals=1, kicker_distances={"A0": 500.0})
+    belt.observed_mark_at("m", 0.0)
+    belt.observed_mark_at("m", 4.0)
+    for brick_id, timestamp in enumerate((10.3, 10.0, 10.1, 11.0)):
+        belt.add_brick(timestamp, brick_id)
+    return belt
+
+
+def test_conveyor_belt_bricks_passing():
+    belt = make_registry_belt()
+    assert belt.bricks == [(10.0, 1), (10.1, 2), (10.3, 0), (11.0, 3)]
+    assert belt.bricks_passing("A0", 12.05, 12.3) == [(10.1, 2), (10.3, 0)]
+    assert belt.bricks_passing("A0", 14.0, 15.0) == []
+    assert ConveyorBelt(length=1000).bricks_passing("A0", 0.0, 1.0) == []
+
+
+def test_conveyor_belt_next_gap():
+    belt = make_registry_belt()
+    # Bricks pass A0 at 12.0, 12.1, 12.3 and 13.0.
+    assert belt.next_gap("A0", 11.0, 100.0) == 11.0  # 0.4 s before 12.0
+    assert belt.next_gap("A0", 12.0, 30.0) == pytest.approx(12.1)  # Until 12.3
+    assert belt.next_gap("A0", 12.0, 100.0) == 12.3
+    assert belt.next_gap("A0", 12.5, 200.0) == 13.0
+
+
+def test_conveyor_belt_forget_passed():
+    belt = make_registry_belt()
+    # With a 50 mm (0.2 s) margin past the last kicker.
+    belt.forget_passed(12.25, margin=50.0)
+    assert belt.bricks == [(10.1, 2), (10.3, 0), (11.0, 3)]
+
+
+def test_conveyor_belt_bricks_in_the_same_frame():
+    belt = make_registry_belt()
+    belt.add_brick(10.1, 4)
+    assert belt.bricks_passing("A0", 12.05, 12.15) == [(10.1, 2), (10.1, 4)]
@@ -0,0 +1,237 @@
+"""Constant-memory latency statistics for long-running sorter sessions.
+
+Samples are counted in logarithmic buckets (like HdrHistogram), so memory
+use and query time don't grow with the number of samples, and percentiles
+are accurate to within the relative precision of a bucket. Only occupied
+buckets are stored: latencies of one stage typically span a few dozen
+buckets, not the whole range, so many histograms can be kept around.
+"""
+
+import math
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+
+class LatencyHistogram:
+    """Streaming histogram of durations in seconds with percentile queries.
+
+    Values between min_value and max_value are counted in buckets whose
+    width grows geometrically, so each reported percentile is within
+    `precision` (relative) of the true value. Smaller or larger values are
+    clamped to the first or last bucket; min and max are exact.
+    """
+
+    def __init__(
+        self,
+        min_value: float = 1e-6,  # seconds
+        max_value: float = 100.0,  # seconds
+        precision: float = 0.01,
+    ) -> None:
+        assert 0 < min_value < max_value and precision > 0
+        self._min_value = min_value
+        self._log_base = math.log1p(precision)
+        self._num_buckets = int(math.log(max_value / min_value) / self._log_base) + 2
+        # Bucket index => number of samples, for occupied buckets only.
+        self._counts: dict[int, int] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget all recorded samples."""
+        self._counts.clear()
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _bucket(self, value: float) -> int:
+        if value <= self._min_value:
+            return 0
+        index = int(math.log(value / self._min_value) / self._log_base) + 1
+        return min(index, self._num_buckets - 1)
+
+    def _bucket_value(self, index: int) -> float:
+        """The geometric center of a bucket."""
+        return self._min_value * math.exp((index - 0.5) * self._log_base)
+
+    def record(self, value: float) -> None:
+        """Add one sample."""
+        index = self._bucket(value)
+        self._counts[index] = self._counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """Add all samples of another histogram with the same bucket layout."""
+        assert self._num_buckets == other._num_buckets
+        for index, count in other._counts.items():
+            self._counts[index] = self._counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def copy(self) -> "LatencyHistogram":
+        histogram = LatencyHistogram.__new__(LatencyHistogram)
+        histogram.__dict__.update(self.__dict__)
+        histogram._counts = self._counts.copy()
+        return histogram
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """Return the value below which `percent` % of the samples fall.
+
+        Returns:
+            The approximate percentile in seconds, or 0.0 if no samples
+            have been recorded.
+        """
+        if not self.count:
+            return 0.0
+        if percent <= 0:
+            return self.min
+        if percent >= 100:
+            return self.max
+        rank = math.ceil(percent / 100 * self.count)
+        cumulative = 0
+        for index in sorted(self._counts):
+            cumulative += self._counts[index]
+            if cumulative >= rank:
+                break
+        # The first and last buckets also hold clamped, out-of-range values.
+        if index == 0:
+            return self.min
+        if index == self._num_buckets - 1:
+            return self.max
+        return min(max(self._bucket_value(index), self.min), self.max)
+
+    def summary(self) -> tuple[float, float, float, float]:
+        """Return (min, max, avg, median) in seconds, or zeros if empty."""
+        if not self.count:
+            return 0.0, 0.0, 0.0, 0.0
+        return self.min, self.max, self.mean, self.percentile(50)
+
+
+class RollingHistogram:
+    """A LatencyHistogram over only the last `window` seconds.
+
+    The window is divided into a fixed number of slots. Each slot is a
+    histogram that is cleared when it is reused, so old samples expire one
+    slot at a time and memory stays constant.
+    """
+
+    def __init__(
+        self,
+        window: float = 60.0,  # seconds
+        slots: int = 6,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        assert window > 0 and slots >= 1
+        self._slot_duration = window / slots
+        self._clock = clock
+        self._slots = [LatencyHistogram() for _ in range(slots)]
+        # The absolute slot number each histogram was last used for.
+        self._slot_numbers = [-1] * slots
+
+    def reset(self) -> None:
+        for histogram in self._slots:
+            histogram.reset()
+        self._slot_numbers = [-1] * len(self._slots)
+
+    def record(self, value: float) -> None:
+        number = int(self._clock() // self._slot_duration)
+        index = number % len(self._slots)
+        if self._slot_numbers[index] != number:
+            self._slots[index].reset()
+            self._slot_numbers[index] = number
+        self._slots[index].record(value)
+
+    def snapshot(self) -> LatencyHistogram:
+        """Merge the slots that are still inside the window."""
+        current = int(self._clock() // self._slot_duration)
+        merged = LatencyHistogram()
+        for number, histogram in zip(self._slot_numbers, self._slots):
+            if current - len(self._slots) < number <= current:
+                merged.merge(histogram)
+        return merged
+
+
+class StageLatencies:
+    """Per-stage latency histograms, both since start and for a recent window.
+
+    Thread-safe, so pipeline stages on different threads can record into
+    the same instance.
+    """
+
+    def __init__(
+        self,
+        window: float = 60.0,  # seconds
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._window = window
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Stage name => (all-time histogram, rolling histogram).
+        self._stages: dict[str, tuple[LatencyHistogram, RollingHistogram]] = {}
+
+    @property
+    def stages(self) -> list[str]:
+        with self._lock:
+            return list(self._stages)
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            if stage not in self._stages:
+                self._stages[stage] = (
+                    LatencyHistogram(),
+                    RollingHistogram(self._window, clock=self._clock),
+                )
+            all_time, recent = self._stages[stage]
+            all_time.record(seconds)
+            recent.record(seconds)
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """Record the duration of a `with` block."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start_time)
+
+    def histogram(self, stage: str, recent: bool = False) -> LatencyHistogram:
+        """Return a copy of the histogram of a stage.
+
+        Args:
+            stage: The stage name; unknown stages return an empty histogram.
+            recent: Only include samples from the last `window` seconds.
+        """
+        with self._lock:
+            if stage not in self._stages:
+                return LatencyHistogram()
+            all_time, rolling = self._stages[stage]
+            return rolling.snapshot() if recent else all_time.copy()
+
+    def reset(self) -> None:
+        with self._lock:
+            for all_time, recent in self._stages.values():
+                all_time.reset()
+                recent.reset()
+
+    def report(self, recent: bool = False) -> str:
+        """Return a human-readable summary with one line per stage."""
+        lines = []
+        for stage in self.stages:
+            histogram = self.histogram(stage, recent)
+            p50, p90, p99 = (histogram.percentile(p) for p in (50, 90, 99))
+            lines.append(
+                f"{stage}: n={histogram.count} p50={p50 * 1000:.1f}ms"
+                f" p90={p90 * 1000:.1f}ms p99={p99 * 1000:.1f}ms"
+                f" max={max(histogram.max, 0.0) * 1000:.1f}ms"
+            )
+        return "\n".join(lines)
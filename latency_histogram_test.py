@@ -0,0 +1,140 @@
+import random
+import threading
+
+import numpy as np
+import pytest
+
+from latency_histogram import LatencyHistogram, RollingHistogram, StageLatencies
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.count == 0
+    assert histogram.percentile(50) == 0.0
+    assert histogram.summary() == (0.0, 0.0, 0.0, 0.0)
+
+
+def test_percentiles_within_precision():
+    rng = random.Random(1)
+    values = [rng.lognormvariate(-3, 1) for _ in range(10000)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+
+    assert histogram.count == 10000
+    assert histogram.min == min(values)
+    assert histogram.max == max(values)
+    assert histogram.mean == pytest.approx(np.mean(values))
+    for percent in (1, 50, 90, 99, 99.9):
+        expected = np.percentile(values, percent, method="inverted_cdf")
+        assert histogram.percentile(percent) == pytest.approx(expected, rel=0.01)
+    assert histogram.percentile(0) == min(values)
+    assert histogram.percentile(100) == max(values)
+
+
+def test_summary_and_reset():
+    histogram = LatencyHistogram()
+    for value in [0.1, 0.2, 0.3]:
+        histogram.record(value)
+    l_min, l_max, l_avg, l_med = histogram.summary()
+    assert (l_min, l_max) == (0.1, 0.3)
+    assert l_avg == pytest.approx(0.2)
+    assert l_med == pytest.approx(0.2, rel=0.01)
+
+    histogram.reset()
+    assert histogram.count == 0
+    assert histogram.summary() == (0.0, 0.0, 0.0, 0.0)
+
+
+def test_out_of_range_values_are_clamped():
+    histogram = LatencyHistogram(min_value=0.001, max_value=1.0)
+    histogram.record(0.0)
+    histogram.record(10.0)
+    assert histogram.percentile(25) == 0.0
+    assert histogram.percentile(75) == 10.0
+
+
+def test_only_occupied_buckets_are_stored():
+    histogram = LatencyHistogram()
+    rng = random.Random(3)
+    for _ in range(10_000):
+        histogram.record(rng.uniform(0.010, 0.020))
+    # 1% buckets between 10ms and 20ms, out of ~1850 in the whole range.
+    assert len(histogram._counts) <= 71
+    assert histogram.percentile(50) == pytest.approx(0.015, rel=0.02)
+
+
+def test_merge_and_copy():
+    a = LatencyHistogram()
+    b = LatencyHistogram()
+    a.record(0.01)
+    b.record(0.03)
+    c = a.copy()
+    c.merge(b)
+    assert c.count == 2
+    assert (c.min, c.max) == (0.01, 0.03)
+    assert a.count == 1
+
+
+def test_rolling_histogram_expires_old_samples():
+    clock = FakeClock()
+    rolling = RollingHistogram(window=10.0, slots=5, clock=clock)
+    rolling.record(0.5)
+    clock.now = 5.0
+    rolling.record(0.1)
+    assert rolling.snapshot().count == 2
+
+    clock.now = 10.5  # The first slot [0, 2) has expired.
+    snapshot = rolling.snapshot()
+    assert snapshot.count == 1
+    assert snapshot.max == 0.1
+
+    clock.now = 100.0
+    assert rolling.snapshot().count == 0
+    rolling.record(0.2)
+    assert rolling.snapshot().count == 1
+
+
+def test_stage_latencies():
+    clock = FakeClock()
+    latencies = StageLatencies(window=10.0, clock=clock)
+    latencies.record("model", 0.05)
+    with latencies.measure("dispatch"):
+        pass
+    assert latencies.stages == ["model", "dispatch"]
+    assert latencies.histogram("model").count == 1
+    assert latencies.histogram("dispatch").max >= 0.0
+    assert latencies.histogram("unknown").count == 0
+
+    clock.now = 20.0
+    assert latencies.histogram("model", recent=True).count == 0
+    assert latencies.histogram("model").count == 1
+
+    report = latencies.report()
+    assert report.splitlines()[0].startswith("model: n=1 p50=50.0ms")
+
+    latencies.reset()
+    assert latencies.histogram("model").count == 0
+
+
+def test_stage_latencies_threads():
+    latencies = StageLatencies()
+
+    def worker():
+        for _ in range(1000):
+            latencies.record("model", 0.01)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert latencies.histogram("model").count == 4000
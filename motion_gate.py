@@ -0,0 +1,108 @@
+"""Cheap foreground detection to skip model inference on empty belt frames."""
+
+import cv2
+import cv2.typing
+
+
+def detect_edges(
+    img: cv2.typing.MatLike,
+) -> tuple[cv2.typing.MatLike, cv2.typing.MatLike]:
+    """Find edges of colored or dark objects on the bright belt.
+
+    Returns:
+        A (blur, edges) tuple of single-channel images, where blur is the
+        smoothed foreground intensity and edges is the Canny output.
+    """
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    _hue, saturation, value = cv2.split(hsv)
+    gray = cv2.max(saturation, 255 - value)
+
+    blur = cv2.blur(gray, (5, 5))
+    edges = cv2.Canny(blur, threshold1=80, threshold2=160)
+    return blur, edges
+
+
+def find_foreground(img: cv2.typing.MatLike) -> tuple[int, int, int, int]:
+    """Return the (x, y, width, height) bounding box of all foreground edges.
+
+    The box is (0, 0, 0, 0) if the belt is empty.
+    """
+    _blur, edges = detect_edges(img)
+    x, y, width, height = cv2.boundingRect(edges)
+    return x, y, width, height
+
+
+class MotionGate:
+    """Decides which frames need to be sent through the recognizer model.
+
+    Frames are skipped unless the foreground bounding box overlaps the region
+    of interest. The default region is the central band where webcam.py saves
+    training images (30% to 70% horizontally, 60px margins at top and
+    bottom). To avoid missing belt calibration marks outside that region,
+    inference is forced at least once per force_interval seconds.
+    """
+
+    def __init__(
+        self,
+        left: float = 0.3,  # fraction of image width
+        right: float = 0.7,  # fraction of image width
+        margin: int = 60,  # pixels at top and bottom
+        min_size: int = 20,  # pixels
+        force_interval: float = 0.2,  # seconds
+    ) -> None:
+        self._left = left
+        self._right = right
+        self._margin = margin
+        self._min_size = min_size
+        self._force_interval = force_interval
+        self._last_inferred: float | None = None
+        self.last_box = (0, 0, 0, 0)
+        self.inferred = 0
+        self.forced = 0
+        self.skipped = 0
+
+    def in_region(
+        self,
+        box: tuple[int, int, int, int],
+        image_width: int,
+        image_height: int,
+    ) -> bool:
+        """Check if a foreground bounding box overlaps the region of interest."""
+        x, y, width, height = box
+        if width < self._min_size or height < self._min_size:
+            return False
+        if x + width < self._left * image_width or x > self._right * image_width:
+            return False
+        return not (y + height < self._margin or y > image_height - self._margin)
+
+    def should_infer(self, img: cv2.typing.MatLike, capture_timestamp: float) -> bool:
+        """Return True if the frame should be sent to the recognizer model.
+
+        Args:
+            img: A BGR image as returned by cv2.VideoCapture.read().
+            capture_timestamp: The time (seconds) when this frame was captured.
+        """
+        image_height, image_width = img.shape[:2]
+        self.last_box = find_foreground(img)
+        if self.in_region(self.last_box, image_width, image_height):
+            self.inferred += 1
+        elif (
+            self._last_inferred is None
+            or capture_timestamp - self._last_inferred >= self._force_interval
+        ):
+            self.forced += 1
+        else:
+            self.skipped += 1
+            return False
+
+        self._last_inferred = capture_timestamp
+        return True
+
+    def report(self) -> str:
+        """Return a human-readable summary of skipped and inferred frames."""
+        total = self.inferred + self.forced + self.skipped
+        percent = 100 * self.skipped / total if total else 0.0
+        return (
+            f"motion gate: {self.inferred} inferred, {self.forced} forced,"
+            f" {self.skipped} skipped ({percent:.1f}% of {total} frames)"
+        )
@@ -0,0 +1,79 @@
+import numpy as np
+
+from motion_gate import MotionGate, find_foreground
+
+WIDTH = 480
+HEIGHT = 640
+
+
+def empty_belt() -> np.ndarray:
+    """A rotated camera frame showing only the bright, empty belt."""
+    return np.full((HEIGHT, WIDTH, 3), 230, dtype=np.uint8)
+
+
+def belt_with_brick(x: int, y: int, size: int = 60) -> np.ndarray:
+    """A frame with a saturated red brick at the given position."""
+    img = empty_belt()
+    img[y : y + size, x : x + size] = (0, 0, 200)
+    return img
+
+
+def test_find_foreground_empty():
+    assert find_foreground(empty_belt()) == (0, 0, 0, 0)
+
+
+def test_find_foreground_brick():
+    x, y, width, height = find_foreground(belt_with_brick(200, 300))
+    assert 190 <= x <= 200
+    assert 290 <= y <= 300
+    assert 60 <= width <= 80
+    assert 60 <= height <= 80
+
+
+def test_motion_gate_skips_empty_frames():
+    gate = MotionGate(force_interval=1.0)
+    assert gate.should_infer(empty_belt(), 0.0)  # Forced, first frame.
+    assert not gate.should_infer(empty_belt(), 0.1)
+    assert not gate.should_infer(empty_belt(), 0.5)
+    assert gate.forced == 1
+    assert gate.skipped == 2
+    assert gate.inferred == 0
+
+
+def test_motion_gate_infers_brick_in_region():
+    gate = MotionGate(force_interval=1.0)
+    gate.should_infer(empty_belt(), 0.0)
+    assert gate.should_infer(belt_with_brick(200, 300), 0.1)
+    assert gate.should_infer(belt_with_brick(200, 320), 0.2)
+    assert gate.inferred == 2
+    assert gate.last_box[2] > 0
+
+
+def test_motion_gate_ignores_brick_outside_region():
+    gate = MotionGate(force_interval=1.0)
+    gate.should_infer(empty_belt(), 0.0)
+    # Too far left (left of the 30% line).
+    assert not gate.should_infer(belt_with_brick(20, 300), 0.1)
+    # Too far away (top margin).
+    assert not gate.should_infer(belt_with_brick(200, 0, size=40), 0.2)
+    # Too small.
+    assert not gate.should_infer(belt_with_brick(200, 300, size=10), 0.3)
+    assert gate.skipped == 3
+
+
+def test_motion_gate_forces_periodic_inference():
+    gate = MotionGate(force_interval=0.2)
+    results = [gate.should_infer(empty_belt(), i * 0.05) for i in range(10)]
+    # Forced at 0.0, 0.2 and 0.4 seconds.
+    assert results.count(True) == 3
+    assert gate.forced == 3
+    assert gate.skipped == 7
+    assert "7 skipped (70.0% of 10 frames)" in gate.report()
+
+
+def test_motion_gate_inference_resets_force_timer():
+    gate = MotionGate(force_interval=0.2)
+    gate.should_infer(empty_belt(), 0.0)
+    gate.should_infer(belt_with_brick(200, 300), 0.15)
+    assert not gate.should_infer(empty_belt(), 0.3)
+    assert gate.should_infer(empty_belt(), 0.36)
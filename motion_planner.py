@@ -0,0 +1,596 @@
+"""Plans flap and kicker movements for ServoShelf around the bricks on the belt.
+
+For each sorted brick, the drawer flap must be fully open when the kicker
+pushes the brick off the belt, and the kicker must later return to its rest
+position. The return swing would knock other bricks off the belt, so it is
+only scheduled in a gap when no brick passes the kicker. A kicker that is
+out also pushes off every brick that passes it, so it may only stay out
+until its next kick if no other brick passes in between. Otherwise it must
+be back at rest before that brick arrives, and if there is no gap for that,
+the kick is called off, so that the kicked brick rides on instead of taking
+the other brick with it. When bricks for the same drawer follow each other
+closely, the flap simply stays open.
+
+Each kick reserves its kicker from the kick until it is back at rest, or
+until its next kick if it stays out. A brick that arrives while its kicker
+is reserved for another brick is a conflict, which is resolved by a
+policy: "merge" keeps the kicker out for both bricks if they go to the
+same drawer, "delay" kicks later while the brick is still within reach,
+and "reject" doesn't kick the brick, so it rides to the overflow bin at
+the end of the belt. Bricks for different drawers can't be merged, because
+the flap of the first drawer would still be open, so "merge" falls back to
+"delay" for them. For the same reason, the open windows of the flaps are
+reserved too, and a flap window that overlaps the window of another flap
+in the same column is a conflict as well. Counting these decisions shows
+how close the belt speed is to the mechanical limit of the kickers.
+"""
+
+import bisect
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from capture_clock import monotonic
+
+FLAP_CLOSED = 0.0  # degrees
+FLAP_OPEN = 90.0  # degrees
+KICKER_REST = 0.0  # degrees
+KICKER_KICK = 45.0  # degrees
+
+
+@dataclass
+class ServoMotion:
+    """A simple model of how long a servo takes to move.
+
+    The default speed is typical for SG90 micro servos (0.1 s per 60 degrees).
+    """
+
+    seconds_per_degree: float = 0.1 / 60
+    # Extra time for the horn to stop oscillating at the target angle.
+    settle_time: float = 0.02
+
+    def travel_time(self, from_angle: float, to_angle: float) -> float:
+        """Seconds to move between two angles, including settling."""
+        return self.settle_time + abs(to_angle - from_angle) * self.seconds_per_degree
+
+
+@dataclass
+class Kick:
+    """A planned kick, and the kicker reset after it."""
+
+    brick: int  # id of the kicked brick
+    time: float
+    event: int
+    flap: str
+    flap_span: tuple[float, float]  # (open, close) the kick asked for
+    reset_time: float | None = None  # None while the kicker stays out
+    reset_event: int = -1
+
+
+@dataclass
+class FlapWindow:
+    """A time window during which a drawer flap is open."""
+
+    open_time: float
+    close_time: float
+    open_event: int
+    close_event: int
+    # (open, close) of each kick whose window was merged into this one.
+    spans: list[tuple[float, float]] = field(default_factory=list)
+
+
+def find_gap(
+    busy: list[tuple[float, float]],
+    earliest: float,
+    duration: float,
+    latest: float = float("inf"),
+) -> float | None:
+    """Find the earliest free time span between busy intervals.
+
+    Args:
+        busy: (start, end) intervals, sorted by start.
+        earliest: The span may not start before this time.
+        duration: Length of the span.
+        latest: The span must end by this time.
+
+    Returns:
+        The start of the span, or None if there is no gap before latest.
+    """
+    start = earliest
+    for busy_start, busy_end in busy:
+        if busy_end <= start:
+            continue
+        if busy_start >= start + duration:
+            break
+        start = busy_end
+    return start if start + duration <= latest else None
+
+
+class Reservations:
+    """Busy time intervals per servo.
+
+    The intervals of one servo never overlap, because overlapping
+    reservations are merged, so their starts and ends are both sorted and
+    overlap queries are two bisections.
+    """
+
+    def __init__(self) -> None:
+        # Servo label => sorted interval starts, and the matching ends.
+        self._starts: dict[str, list[float]] = {}
+        self._ends: dict[str, list[float]] = {}
+
+    def intervals(self, label: str) -> list[tuple[float, float]]:
+        """All (start, end) intervals of a servo, sorted by start."""
+        return list(zip(self._starts.get(label, []), self._ends.get(label, [])))
+
+    def _range(self, label: str, start: float, end: float) -> tuple[int, int]:
+        """Index range of the intervals that overlap [start, end)."""
+        first = bisect.bisect_right(self._ends.get(label, []), start)
+        last = bisect.bisect_left(self._starts.get(label, []), end)
+        return first, last
+
+    def conflicts(
+        self,
+        label: str,
+        start: float,
+        end: float,
+    ) -> list[tuple[float, float]]:
+        """The reserved intervals of a servo that overlap [start, end)."""
+        first, last = self._range(label, start, end)
+        return self.intervals(label)[first:last]
+
+    def reserve(self, label: str, start: float, end: float) -> None:
+        """Reserve [start, end), merged with the intervals it overlaps."""
+        starts = self._starts.setdefault(label, [])
+        ends = self._ends.setdefault(label, [])
+        first, last = self._range(label, start, end)
+        if first < last:
+            start = min(start, starts[first])
+            end = max(end, ends[last - 1])
+        starts[first:last] = [start]
+        ends[first:last] = [end]
+
+    def replace(self, label: str, intervals: list[tuple[float, float]]) -> None:
+        """Replace all reservations of a servo with the given intervals."""
+        self._starts[label] = []
+        self._ends[label] = []
+        for start, end in intervals:
+            self.reserve(label, start, end)
+
+    def forget_before(self, timestamp: float) -> None:
+        """Drop the intervals of all servos that ended by the given time."""
+        for label, ends in self._ends.items():
+            count = bisect.bisect_right(ends, timestamp)
+            del self._starts[label][:count]
+            del ends[:count]
+
+
+class MotionPlanner:
+    """Schedules flap and kicker events on a ServoShelf."""
+
+    def __init__(
+        self,
+        shelf: Any,
+        conveyor_belt: Any,
+        motion: ServoMotion | None = None,
+        clearance: float = 30.0,  # mm
+        drop_time: float = 0.5,  # seconds
+        conflict_policy: str = "merge",
+        kick_reach: float = 10.0,  # mm
+        uncertainty: float = 2.0,  # standard deviations
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        """Initialize the planner.
+
+        Args:
+            shelf: Provides add_event() and cancel_event().
+            conveyor_belt: The ConveyorBelt, which predicts travel times
+                and keeps track of the bricks in flight.
+            motion: Travel time model for all servos.
+            clearance: Minimum distance between a brick and a kicker while
+                the kicker returns to rest (mm along the belt).
+            drop_time: Time for a kicked brick to fall into its drawer.
+            conflict_policy: "merge", "delay" or "reject", for bricks that
+                arrive while their kicker is busy with another brick.
+                "merge" only merges kicks into the same drawer, and delays
+                the others.
+            kick_reach: How far the belt may carry a brick past its kicker
+                while a kick still pushes it off, which limits "delay".
+            uncertainty: Flap windows are widened by this many standard
+                errors of the predicted travel time on both sides.
+            clock: Returns the current time in seconds.
+        """
+        assert conflict_policy in ("merge", "delay", "reject"), conflict_policy
+        self._shelf = shelf
+        self._belt = conveyor_belt
+        self.motion = motion or ServoMotion()
+        self._clearance = clearance
+        self._drop_time = drop_time
+        self._conflict_policy = conflict_policy
+        self._kick_reach = kick_reach
+        self._uncertainty = uncertainty
+        self._clock = clock
+        self.reservations = Reservations()
+        # How kicks were planned: without conflict, or by the conflict policy.
+        self.accepted = 0
+        self.merged = 0
+        self.delayed = 0
+        self.rejected = 0
+        # Called with the id of each rejected brick.
+        self.on_rejected: Callable[[int], None] | None = None
+        # Flap label => open windows, sorted by open time.
+        self._flap_windows: dict[str, list[FlapWindow]] = {}
+        # Kicker label => labels of the flaps in its column that were used.
+        self._column_flaps: dict[str, set[str]] = {}
+        # Kicker label => kicks whose reset may still change, sorted by time.
+        self._kicks: dict[str, list[Kick]] = {}
+        # Brick id => label of the kicker that pushes it off the belt.
+        self._leaving: dict[int, str] = {}
+
+    def add_brick(
+        self,
+        timestamp: float,
+        brick_id: int,
+        kicker_label: str | None = None,
+    ) -> None:
+        """Register a brick on the belt, whether or not it will be kicked.
+
+        Pending kicker resets that would hit the brick are moved, and kicks
+        that would keep a kicker out while the brick passes are called off.
+
+        Args:
+            timestamp: Time when the brick passed the camera mid-line.
+            brick_id: Unique id of the brick, e.g. its tracker track id.
+            kicker_label: The kicker that plan_sort() will be called for,
+                if any. The brick doesn't pass that kicker or the ones after.
+        """
+        self._belt.add_brick(timestamp, brick_id)
+        if kicker_label is not None:
+            self._leaving[brick_id] = kicker_label
+        self._belt.forget_passed(self._clock(), margin=self._clearance)
+        in_flight = {brick for _, brick in self._belt.bricks}
+        self._leaving = {
+            brick: label for brick, label in self._leaving.items() if brick in in_flight
+        }
+        self._replan()
+
+    def plan_sort(
+        self,
+        timestamp: float,
+        brick_id: int,
+        flap_label: str,
+        kicker_label: str,
+    ) -> bool:
+        """Schedule a flap window, a kick and a kicker reset for one brick.
+
+        Call add_brick() for the brick first.
+
+        Returns:
+            False if the brick won't be kicked: the belt speed isn't known
+            yet, its kicker is busy and the conflict policy rejected it, or
+            the kick was called off because another brick passes the kicker
+            right after it.
+        """
+        distance = self._belt.get_kicker_distance(kicker_label)
+        travel_time = self._belt.predict_travel_time(distance)
+        self._column_flaps.setdefault(kicker_label, set()).add(flap_label)
+
+        # The flap must be open before the brick arrives, and stays open
+        # until the brick has fallen into the drawer. The window is wider
+        # while the belt speed is uncertain.
+        margin = self._uncertainty * self._belt.travel_time_stddev(distance)
+        flap_lead = self.motion.travel_time(FLAP_CLOSED, FLAP_OPEN) + margin
+        flap_tail = self._drop_time + margin
+
+        kick_time = None
+        if travel_time > 0:
+            kick_time = self._reserve_kick(
+                kicker_label,
+                flap_label,
+                timestamp + travel_time,
+                flap_lead,
+                flap_tail,
+            )
+            if kick_time is None:
+                self._reject(brick_id)
+        if kick_time is None:
+            # The brick rides on past its kicker.
+            self._leaving.pop(brick_id, None)
+            self._replan()
+            return False
+        self._leaving[brick_id] = kicker_label
+
+        flap_span = (kick_time - flap_lead, kick_time + flap_tail)
+        self._add_flap_window(flap_label, *flap_span)
+
+        event_id = self._shelf.add_event(kick_time, kicker_label, KICKER_KICK)
+        bisect.insort(
+            self._kicks.setdefault(kicker_label, []),
+            Kick(brick_id, kick_time, event_id, flap_label, flap_span),
+            key=lambda kick: kick.time,
+        )
+        self._replan()
+        return brick_id in self._leaving
+
+    def _reserve_kick(
+        self,
+        kicker_label: str,
+        flap_label: str,
+        kick_time: float,
+        flap_lead: float,
+        flap_tail: float,
+    ) -> float | None:
+        """Reserve a kicker cycle, applying the conflict policy if it is busy.
+
+        The kicker is busy from each planned kick until it is back at rest,
+        see _plan_resets(). The flap is open from flap_lead before the kick
+        until flap_tail after it, which may not overlap the windows of the
+        other flaps of the column: the kicked brick would fall through
+        whichever is open. A kick can only be merged with the kicks of the
+        busy intervals if they all open the same flap.
+
+        Returns:
+            The planned kick time, or None if the brick is rejected.
+        """
+        self.reservations.forget_before(self._clock())
+        cycle = self.motion.travel_time(KICKER_REST, KICKER_KICK)
+        cycle += self.motion.travel_time(KICKER_KICK, KICKER_REST)
+        busy = self.reservations.conflicts(kicker_label, kick_time, kick_time + cycle)
+        other_flaps = self._column_flaps[kicker_label] - {flap_label}
+        flaps_busy = any(
+            self.reservations.conflicts(
+                label, kick_time - flap_lead, kick_time + flap_tail
+            )
+            for label in other_flaps
+        )
+        if not busy and not flaps_busy:
+            self.accepted += 1
+        elif (
+            self._conflict_policy == "merge"
+            and not flaps_busy
+            and all(
+                kick.flap == flap_label
+                for kick in self._kicks.get(kicker_label, [])
+                if any(start <= kick.time < end for start, end in busy)
+            )
+        ):
+            # The kicker stays out until the later kick, see _plan_resets().
+            self.merged += 1
+        else:
+            delayed = None
+            if self._conflict_policy != "reject":
+                max_delay = self._belt.predict_travel_time(self._kick_reach)
+                # The kick times at which the kicker or another flap is busy.
+                blocked = [
+                    (start - cycle, end)
+                    for start, end in self.reservations.intervals(kicker_label)
+                ]
+                for label in other_flaps:
+                    blocked += [
+                        (start - flap_tail, end + flap_lead)
+                        for start, end in self.reservations.intervals(label)
+                    ]
+                delayed = find_gap(
+                    sorted(blocked), kick_time, 0.0, latest=kick_time + max_delay
+                )
+            if delayed is None:
+                return None
+            kick_time = delayed
+            self.delayed += 1
+        self.reservations.reserve(kicker_label, kick_time, kick_time + cycle)
+        return kick_time
+
+    def report(self) -> str:
+        """Return a human-readable summary of the planned kicks."""
+        return (
+            f"planner: {self.accepted} kicks, {self.merged} merged,"
+            f" {self.delayed} delayed, {self.rejected} rejected"
+            f" ({self._conflict_policy} policy)"
+        )
+
+    def _add_flap_window(
+        self,
+        label: str,
+        open_time: float,
+        close_time: float,
+    ) -> None:
+        """Add an open window, merging it with windows that are too close.
+
+        A flap that closes must finish closing before it can reopen, so
+        windows closer than that are merged into one.
+        """
+        now = self._clock()
+        windows = [w for w in self._flap_windows.get(label, []) if w.close_time > now]
+        reopen_time = self.motion.travel_time(FLAP_OPEN, FLAP_CLOSED)
+        remaining = []
+        spans = [(open_time, close_time)]
+        already_open = False
+        for window in windows:
+            if not (
+                window.open_time < close_time + reopen_time
+                and open_time < window.close_time + reopen_time
+            ):
+                remaining.append(window)
+                continue
+            if window.open_time <= now:
+                # The flap is already open, and an open event can't be undone.
+                already_open = True
+                open_time = window.open_time
+            else:
+                open_time = min(open_time, window.open_time)
+                self._shelf.cancel_event(window.open_event)
+            close_time = max(close_time, window.close_time)
+            self._shelf.cancel_event(window.close_event)
+            spans += window.spans
+
+        open_event = -1
+        if not already_open:
+            open_event = self._shelf.add_event(open_time, label, FLAP_OPEN)
+        close_event = self._shelf.add_event(close_time, label, FLAP_CLOSED)
+        remaining.append(
+            FlapWindow(open_time, close_time, open_event, close_event, spans)
+        )
+        remaining.sort(key=lambda w: w.open_time)
+        self._flap_windows[label] = remaining
+        self.reservations.replace(
+            label, [(w.open_time, w.close_time) for w in remaining]
+        )
+
+    def _remove_flap_span(self, label: str, span: tuple[float, float]) -> None:
+        """Take a called-off kick out of its flap window.
+
+        An open flap in the column of a kicker makes another brick that it
+        kicks land in the wrong drawer, so the window shrinks to the other
+        kicks merged into it, or the flap closes.
+        """
+        now = self._clock()
+        windows = self._flap_windows.get(label, [])
+        window = next((w for w in windows if span in w.spans), None)
+        if window is None:
+            return
+        windows.remove(window)
+        window.spans.remove(span)
+        self._shelf.cancel_event(window.close_event)
+        if window.open_time > now:
+            self._shelf.cancel_event(window.open_event)
+        elif not window.spans:
+            self._shelf.add_event(now, label, FLAP_CLOSED)
+        for open_time, close_time in window.spans:
+            self._add_flap_window(label, open_time, close_time)
+        self.reservations.replace(
+            label, [(w.open_time, w.close_time) for w in self._flap_windows[label]]
+        )
+
+    def _find_reset(
+        self,
+        kicker_label: str,
+        earliest: float,
+        latest: float,
+    ) -> float | None:
+        """Find the earliest time the kicker can return to rest.
+
+        No brick may be within the clearance of the kicker while it moves,
+        and it must be back at rest by `latest`.
+        """
+        back_time = self.motion.travel_time(KICKER_KICK, KICKER_REST)
+        clearance_time = self._belt.predict_travel_time(self._clearance)
+        length = 2 * self._clearance + back_time * self._belt.speed
+        gap = self._belt.next_gap(kicker_label, earliest - clearance_time, length)
+        reset_time = gap + clearance_time
+        return reset_time if reset_time + back_time <= latest else None
+
+    def _crossing_bricks(
+        self, kicker_label: str, start: float, end: float
+    ) -> list[tuple[float, int]]:
+        """The bricks that pass a kicker in (start, end) and stay on the belt.
+
+        Bricks that are pushed off by this kicker or an earlier one don't
+        get there, or are the ones it kicks.
+
+        Returns:
+            (camera pass time, id) of the bricks, in order along the belt.
+        """
+        distance = self._belt.get_kicker_distance(kicker_label)
+        travel_time = self._belt.predict_travel_time(distance)
+        crossing = []
+        for timestamp, brick in self._belt.bricks_passing(kicker_label, start, end):
+            leaving = self._leaving.get(brick)
+            if (
+                leaving is not None
+                and self._belt.get_kicker_distance(leaving) <= distance
+            ):
+                continue
+            if start < timestamp + travel_time < end:
+                crossing.append((timestamp, brick))
+        return crossing
+
+    def _call_off(self, kick: Kick) -> None:
+        """Cancel a kick that hasn't fired, so the brick rides on."""
+        self._shelf.cancel_event(kick.event)
+        self._remove_flap_span(kick.flap, kick.flap_span)
+        self._leaving.pop(kick.brick, None)
+        self._reject(kick.brick)
+
+    def _reject(self, brick: int) -> None:
+        self.rejected += 1
+        if self.on_rejected is not None:
+            self.on_rejected(brick)
+
+    def _replan(self) -> None:
+        """Plan the resets of all kickers until no more kicks are called off."""
+        changed = True
+        while changed:
+            changed = False
+            for kicker_label in self._kicks:
+                changed |= self._plan_resets(kicker_label)
+
+    def _plan_resets(self, kicker_label: str) -> bool:
+        """(Re)schedule the reset after each kick, in a gap between bricks.
+
+        If there is no gap before the next kick of the same kicker, the
+        kicker stays out until then, unless another brick passes it in
+        between. Then the kicker must be back at rest before that brick
+        arrives, or the kick is called off. If the kick has already fired,
+        the kicker pushes the brick off too.
+
+        Returns:
+            True if a kick was called off or a brick will be pushed off, which
+            changes the bricks that pass the other kickers.
+        """
+        now = self._clock()
+        kicks = self._kicks[kicker_label]
+        out_time = self.motion.travel_time(KICKER_REST, KICKER_KICK)
+        back_time = self.motion.travel_time(KICKER_KICK, KICKER_REST)
+        travel_time = self._belt.predict_travel_time(
+            self._belt.get_kicker_distance(kicker_label)
+        )
+
+        changed = False
+        planned = []
+        for i, kick in enumerate(kicks):
+            if kick.reset_time is not None and kick.reset_time <= now:
+                # Already fired, or firing now. Kept until the kicker is back.
+                if kick.reset_time + back_time > now:
+                    planned.append(kick)
+                continue
+            if kick.reset_event >= 0:
+                self._shelf.cancel_event(kick.reset_event)
+                kick.reset_event = -1
+
+            next_kick = kicks[i + 1].time if i + 1 < len(kicks) else float("inf")
+            earliest = max(kick.time + out_time, now)
+            crossing = self._crossing_bricks(kicker_label, kick.time, next_kick)
+            latest = crossing[0][0] + travel_time if crossing else next_kick
+            kick.reset_time = self._find_reset(kicker_label, earliest, latest)
+            if kick.reset_time is None and crossing:
+                if kick.time > now:
+                    self._call_off(kick)
+                    changed = True
+                    continue
+                # The kicker is already out, and pushes the bricks off.
+                kick.reset_time = self._find_reset(kicker_label, earliest, next_kick)
+                out_until = next_kick if kick.reset_time is None else kick.reset_time
+                for timestamp, brick in crossing:
+                    if timestamp + travel_time < out_until:
+                        self._leaving[brick] = kicker_label
+                        self.merged += 1
+                        changed = True
+            if kick.reset_time is not None:
+                kick.reset_event = self._shelf.add_event(
+                    kick.reset_time, kicker_label, KICKER_REST
+                )
+            planned.append(kick)
+
+        self._kicks[kicker_label] = planned
+        # The kicker is busy until it is back at rest, or until the next kick.
+        intervals = []
+        for i, kick in enumerate(planned):
+            if kick.reset_time is not None:
+                end = kick.reset_time + back_time
+            elif i + 1 < len(planned):
+                end = planned[i + 1].time
+            else:
+                end = float("inf")  # The next kick was just called off.
+            intervals.append((kick.time, end))
+        self.reservations.replace(kicker_label, intervals)
+        return changed
@@ -0,0 +1,320 @@
+import pytest
+
+from conveyor_belt import ConveyorBelt
+from motion_planner import MotionPlanner, Reservations, ServoMotion, find_gap
+
+
+class FakeShelf:
+    """Records planned events like ServoShelf.add_event()/cancel_event()."""
+
+    def __init__(self) -> None:
+        self.events: dict[int, tuple[float, str, float]] = {}
+        self.next_id = 0
+
+    def add_event(self, timestamp: float, label: str, angle: float) -> int:
+        self.next_id += 1
+        self.events[self.next_id] = (timestamp, label, angle)
+        return self.next_id
+
+    def cancel_event(self, event_id: int) -> None:
+        self.events.pop(event_id, None)
+
+    def pending(self, label: str) -> list[tuple[float, float]]:
+        return sorted(
+            (round(t, 6), a) for t, lbl, a in self.events.values() if lbl == label
+        )
+
+
+def make_belt(calibrated: bool = True) -> ConveyorBelt:
+    """A belt at exactly 250 mm/s, with kickers at 500 and 1000 mm."""
+    belt = ConveyorBelt(
+        length=1000.0,
+        min_intervals=1,
+        kicker_distances={"A0": 500.0, "B0": 1000.0},
+        sighting_error=0.0,
+    )
+    if calibrated:
+        belt.observed_mark_at("m", 0.0)
+        belt.observed_mark_at("m", 4.0)
+    return belt
+
+
+def make_planner(
+    now: float = 0.0, belt: ConveyorBelt | None = None, **kwargs
+) -> tuple[MotionPlanner, FakeShelf]:
+    shelf = FakeShelf()
+    # No settle time, 0.1 s per 45 degrees.
+    motion = ServoMotion(seconds_per_degree=0.1 / 45, settle_time=0.0)
+    planner = MotionPlanner(
+        shelf, belt or make_belt(), motion=motion, clock=lambda: now, **kwargs
+    )
+    return planner, shelf
+
+
+def sort_brick(planner, timestamp, brick_id, flap="A3", kicker="A0"):
+    planner.add_brick(timestamp, brick_id, kicker)
+    return planner.plan_sort(timestamp, brick_id, flap, kicker)
+
+
+def test_servo_motion_travel_time():
+    motion = ServoMotion(seconds_per_degree=0.002, settle_time=0.02)
+    assert motion.travel_time(0, 90) == pytest.approx(0.2)
+    assert motion.travel_time(90, 45) == pytest.approx(0.11)
+
+
+def test_find_gap():
+    busy = [(1.0, 2.0), (2.5, 3.0), (3.1, 4.0)]
+    assert find_gap(busy, 0.0, 0.5) == 0.0
+    assert find_gap(busy, 0.8, 0.5) == 2.0
+    assert find_gap(busy, 2.6, 0.2) == 4.0
+    assert find_gap(busy, 2.6, 0.2, latest=4.1) is None
+    assert find_gap([], 5.0, 1.0) == 5.0
+
+
+def test_plan_sort_without_belt_speed():
+    planner, shelf = make_planner(belt=make_belt(calibrated=False))
+    assert not sort_brick(planner, 10.0, 1)
+    assert shelf.events == {}
+
+
+def test_flap_lead_time_scales_with_angle():
+    planner, shelf = make_planner()
+    assert sort_brick(planner, 10.0, 1)
+    # Opening by 90 degrees takes 0.2 s, the brick reaches A0 after 2 s.
+    assert shelf.pending("A3") == [(11.8, 90.0), (12.5, 0.0)]
+    # Kick, then reset once the brick is 30 mm (0.12 s) past the kicker.
+    assert shelf.pending("A0") == [(12.0, 45.0), (12.12, 0.0)]
+
+
+def test_flap_window_widens_with_speed_uncertainty():
+    planner, shelf = make_planner()
+    planner._belt.travel_time_stddev = lambda distance: 0.05
+    sort_brick(planner, 10.0, 1)
+    # Two standard errors on both sides.
+    assert shelf.pending("A3") == [(11.7, 90.0), (12.6, 0.0)]
+    assert shelf.pending("A0")[0] == (12.0, 45.0)
+
+
+def test_overlapping_flap_windows_are_merged():
+    planner, shelf = make_planner()
+    sort_brick(planner, 10.0, 1)
+    sort_brick(planner, 10.6, 2)  # Opens before the first window closes.
+    assert shelf.pending("A3") == [(11.8, 90.0), (13.1, 0.0)]
+
+    sort_brick(planner, 20.0, 3)  # Far enough apart for a separate window.
+    assert len(shelf.pending("A3")) == 4
+
+
+def test_merge_with_window_that_is_already_open():
+    planner, shelf = make_planner()
+    sort_brick(planner, 10.0, 1)
+    planner._clock = lambda: 12.0  # The flap opened at 11.8.
+    sort_brick(planner, 10.3, 2)
+    assert shelf.pending("A3") == [(11.8, 90.0), (12.8, 0.0)]
+
+
+def test_kicker_is_reset_before_next_brick():
+    planner, shelf = make_planner()
+    sort_brick(planner, 10.0, 1)
+    # A brick for another drawer passes A0 at 12.45, after the reset is done
+    # at 12.22 and the kicker is 30 mm (0.12 s) clear of it.
+    planner.add_brick(10.45, 2)
+    assert shelf.pending("A0") == [(12.0, 45.0), (12.12, 0.0)]
+    assert planner.rejected == 0
+
+
+def test_kick_is_called_off_before_close_brick():
+    planner, shelf = make_planner()
+    sort_brick(planner, 10.0, 1)
+    # A brick for another drawer passes A0 at 12.3, before the kicker can be
+    # back at rest, so it would be pushed off too.
+    planner.add_brick(10.3, 2)
+    assert shelf.pending("A0") == []
+    assert shelf.pending("A3") == []
+    assert planner.rejected == 1
+
+
+def test_called_off_kick_leaves_merged_flap_window():
+    planner, shelf = make_planner()
+    sort_brick(planner, 10.0, 1)
+    sort_brick(planner, 10.6, 2)
+    assert shelf.pending("A3") == [(11.8, 90.0), (13.1, 0.0)]
+    planner.add_brick(10.3, 3)
+    # Only the window of the second kick is left.
+    assert shelf.pending("A0") == [(12.6, 45.0), (12.72, 0.0)]
+    assert shelf.pending("A3") == [(12.4, 90.0), (13.1, 0.0)]
+
+
+def test_called_off_kick_closes_open_flap():
+    planner, shelf = make_planner()
+    sort_brick(planner, 10.0, 1)
+    planner._clock = lambda: 11.9  # The flap opened at 11.8.
+    planner.add_brick(10.3, 2)
+    assert shelf.pending("A3") == [(11.8, 90.0), (11.9, 0.0)]
+
+
+def test_fired_kick_pushes_off_close_brick():
+    planner, shelf = make_planner()
+    sort_brick(planner, 10.0, 1)
+    planner._clock = lambda: 12.05  # The kick has fired.
+    planner.add_brick(10.1, 2)
+    # The kicker stays out until the brick is 30 mm past.
+    assert shelf.pending("A0") == [(12.0, 45.0), (12.22, 0.0)]
+    assert (planner.merged, planner.rejected) == (1, 0)
+
+
+def test_kicker_stays_out_between_close_kicks():
+    planner, shelf = make_planner()
+    sort_brick(planner, 10.0, 1)
+    sort_brick(planner, 10.2, 2)
+    # There is no gap to reset between the kicks at 12.0 and 12.2.
+    assert shelf.pending("A0") == [(12.0, 45.0), (12.2, 45.0), (12.32, 0.0)]
+
+    # But it can't stay out while another brick passes in between.
+    planner.add_brick(10.1, 3)
+    assert shelf.pending("A0") == [(12.2, 45.0), (12.32, 0.0)]
+    assert planner.rejected == 1
+
+
+def test_fired_reset_is_not_moved():
+    planner, shelf = make_planner()
+    sort_brick(planner, 10.0, 1)
+    planner._clock = lambda: 12.2  # The reset at 12.12 has fired.
+    planner.add_brick(10.15, 2)
+    assert shelf.pending("A0") == [(12.0, 45.0), (12.12, 0.0)]
+
+
+def test_old_bricks_are_forgotten():
+    planner, _ = make_planner()
+    planner.add_brick(10.0, 1)
+    planner._clock = lambda: 14.5  # Past B0 at 1000 mm + 30 mm clearance.
+    planner.add_brick(13.0, 2)
+    assert planner._belt.bricks == [(13.0, 2)]
+
+
+def test_reservations():
+    reservations = Reservations()
+    reservations.reserve("A0", 1.0, 2.0)
+    reservations.reserve("A0", 3.0, 4.0)
+    assert reservations.conflicts("A0", 2.0, 3.0) == []
+    assert reservations.conflicts("A0", 1.5, 3.5) == [(1.0, 2.0), (3.0, 4.0)]
+    assert reservations.conflicts("B0", 0.0, 5.0) == []
+
+    reservations.reserve("A0", 1.5, 3.5)  # Merged with both.
+    assert reservations.intervals("A0") == [(1.0, 4.0)]
+    reservations.reserve("A0", 5.0, 6.0)
+    reservations.forget_before(4.0)
+    assert reservations.intervals("A0") == [(5.0, 6.0)]
+
+
+def test_kick_reserves_kicker_until_it_is_back():
+    planner, _ = make_planner()
+    sort_brick(planner, 10.0, 1)
+    # Reset at 12.12, back at rest 0.1 s later.
+    assert planner.reservations.intervals("A0") == [(12.0, pytest.approx(12.22))]
+    sort_brick(planner, 10.1, 2)
+    # The kicker stays out for the second brick, and the reset waits for it.
+    assert planner.reservations.intervals("A0") == [
+        (12.0, 12.1),
+        (12.1, pytest.approx(12.32)),
+    ]
+
+    # A brick arriving while the kicker returns is a conflict, even though
+    # it is a full cycle after the last kick.
+    sort_brick(planner, 10.3, 3)
+    assert (planner.accepted, planner.merged) == (1, 2)
+
+
+def test_conflict_merge_keeps_kicker_out():
+    planner, shelf = make_planner()
+    assert sort_brick(planner, 10.0, 1)
+    # The kicker cycle (out and back) takes 0.2 s.
+    assert sort_brick(planner, 10.1, 2)
+    assert shelf.pending("A0") == [(12.0, 45.0), (12.1, 45.0), (12.22, 0.0)]
+    assert (planner.accepted, planner.merged, planner.rejected) == (1, 1, 0)
+
+
+def test_conflict_merge_rejects_brick_for_other_drawer():
+    planner, shelf = make_planner(kick_reach=60.0)
+    sort_brick(planner, 10.0, 1)
+    # Staying out would push the second brick off while the A3 flap is open,
+    # which stays open until 12.5, out of reach for a delay.
+    assert not sort_brick(planner, 10.1, 2, flap="A4")
+    assert shelf.pending("A4") == []
+    assert (planner.merged, planner.delayed, planner.rejected) == (0, 0, 2)
+
+
+def test_conflict_reject_skips_brick():
+    planner, shelf = make_planner(conflict_policy="reject")
+    rejected = []
+    planner.on_rejected = rejected.append
+    sort_brick(planner, 10.0, 1)
+    assert not sort_brick(planner, 10.1, 2, flap="A4")
+    # The rejected brick would pass the kicker while it is out for the
+    # first brick, so that kick is called off too.
+    assert shelf.pending("A0") == []
+    assert shelf.pending("A4") == []
+    assert planner.rejected == 2
+    assert rejected == [2, 1]
+    assert "2 rejected" in planner.report()
+
+
+def test_conflict_delay_within_reach():
+    planner, shelf = make_planner(conflict_policy="delay", kick_reach=60.0)
+    sort_brick(planner, 10.0, 1)
+    assert sort_brick(planner, 10.1, 2)
+    # The first reset waits until the second brick is 30 mm past, so the
+    # kicker is busy until 12.32, when the second brick is 55 mm past it.
+    assert shelf.pending("A0") == [
+        (12.0, 45.0),
+        (12.22, 0.0),
+        (12.32, 45.0),
+        (12.42, 0.0),
+    ]
+    assert shelf.pending("A3") == [(11.8, 90.0), (12.82, 0.0)]
+    assert planner.delayed == 1
+
+
+def test_conflict_delay_out_of_reach_is_rejected():
+    planner, _ = make_planner(conflict_policy="delay", kick_reach=10.0)
+    sort_brick(planner, 10.0, 1)
+    assert not sort_brick(planner, 10.1, 2, flap="A4")
+    assert (planner.delayed, planner.rejected) == (0, 2)
+
+
+def test_flap_windows_of_a_column_conflict():
+    planner, shelf = make_planner(conflict_policy="reject")
+    sort_brick(planner, 10.0, 1)
+    assert planner.reservations.intervals("A3") == [(11.8, 12.5)]
+    # The kicker is back at rest for the kick at 12.4, but the A3 flap is
+    # still open, so the brick would fall into A3.
+    assert not sort_brick(planner, 10.4, 2, flap="A4")
+    assert shelf.pending("A0") == [(12.0, 45.0), (12.12, 0.0)]
+    assert shelf.pending("A4") == []
+
+    # A delayed kick waits until A4 can open as A3 closes.
+    planner, shelf = make_planner(conflict_policy="delay", kick_reach=100.0)
+    sort_brick(planner, 10.0, 1)
+    assert sort_brick(planner, 10.4, 2, flap="A4")
+    assert shelf.pending("A4") == [(12.5, 90.0), (13.2, 0.0)]
+    assert shelf.pending("A0")[2] == (12.7, 45.0)
+
+
+def test_called_off_kick_frees_its_flap_window():
+    planner, _ = make_planner()
+    sort_brick(planner, 10.0, 1)
+    planner.add_brick(10.3, 2)
+    assert planner.reservations.intervals("A3") == []
+
+
+def test_bricks_in_the_same_frame_are_told_apart():
+    planner, shelf = make_planner(conflict_policy="reject")
+    rejected = []
+    planner.on_rejected = rejected.append
+    assert sort_brick(planner, 10.0, 1)
+    # The second brick needs the kicker at the same time, and is rejected
+    # without forgetting that the first one leaves the belt at A0.
+    assert not sort_brick(planner, 10.0, 2)
+    assert rejected == [2]
+    assert planner._leaving == {1: "A0"}
+    assert shelf.pending("A0") == [(12.0, 45.0), (12.12, 0.0)]
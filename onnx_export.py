@@ -0,0 +1,87 @@
+#!/usr/bin/env -S uv run
+
+"""Converts yolov7 .pt weights to ONNX for use with onnx_model.py.
+
+Requires the onnx package in addition to torch (pip install onnx).
+"""
+
+import argparse
+import functools
+import json
+from pathlib import Path
+
+
+def export_onnx(
+    weights: Path,
+    output: Path,
+    input_size: int = 640,
+    opset: int = 12,
+) -> None:
+    """Export the detection network with a fixed input size and dynamic batch.
+
+    The class names are stored as JSON in the "names" metadata property.
+    """
+    import onnx
+    import torch
+    import yolov7
+
+    # yolov7 models often require loading custom objects restricted in PyTorch 2.6+.
+    original_load = torch.load
+    torch.load = functools.partial(original_load, weights_only=False)
+    try:
+        model = yolov7.load(str(weights), device="cpu")
+    finally:
+        torch.load = original_load
+
+    # yolov7.load() wraps the network with AutoShape, which does its own
+    # pre- and post-processing. Export the inner network only.
+    network = model.model.float().eval()
+
+    class RawPredictions(torch.nn.Module):
+        """Returns only the concatenated predictions, not the feature maps."""
+
+        def __init__(self) -> None:
+            super().__init__()
+            self.network = network
+
+        def forward(self, x: torch.Tensor) -> torch.Tensor:
+            return self.network(x)[0]
+
+    dummy = torch.zeros(1, 3, input_size, input_size)
+    torch.onnx.export(
+        RawPredictions(),
+        dummy,
+        str(output),
+        opset_version=opset,
+        input_names=["images"],
+        output_names=["output"],
+        dynamic_axes={"images": {0: "batch"}, "output": {0: "batch"}},
+        dynamo=False,
+    )
+
+    proto = onnx.load(str(output))
+    metadata = proto.metadata_props.add()
+    metadata.key = "names"
+    metadata.value = json.dumps(list(model.names))
+    onnx.save(proto, str(output))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export yolov7 weights to ONNX")
+    parser.add_argument("weights", type=Path, help="Path to .pt weights file")
+    parser.add_argument(
+        "--output", type=Path, default=None, help="Output path (default: .onnx)"
+    )
+    parser.add_argument(
+        "--input-size", type=int, default=640, help="Fixed input size in pixels"
+    )
+    parser.add_argument("--opset", type=int, default=12, help="ONNX opset version")
+    args = parser.parse_args()
+
+    output = args.output or args.weights.with_suffix(".onnx")
+    export_onnx(args.weights, output, args.input_size, args.opset)
+    print(f"Exported {args.weights} to {output}")
+
+
+if __name__ == "__main__":
+    main()
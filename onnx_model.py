@@ -0,0 +1,297 @@
+"""Runs exported YOLO models on CPU with ONNX Runtime or OpenCV DNN.
+
+This avoids importing torch at startup. Pre- and post-processing (letterbox,
+NMS and xywhn decoding) are done in NumPy, and the results have the same
+xywhn/names interface as yolov7 results, so BrickCamera works unchanged.
+Use onnx_export.py to convert .pt weights to ONNX.
+"""
+
+import json
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import cv2
+import cv2.typing
+import numpy as np
+
+# Offset to keep boxes of different classes apart during NMS (as in yolov7).
+_MAX_WH = 4096
+
+
+def load_class_names(path: Path) -> list[str]:
+    """Read class names from a YOLO dataset YAML file or a plain text file.
+
+    The YAML format is the one written by YoloExporter.write_yaml(), e.g.
+    bricks.yaml. Text files have one class name per line.
+    """
+    text = path.read_text(encoding="utf-8")
+    if path.suffix not in (".yaml", ".yml"):
+        return [line.strip() for line in text.splitlines() if line.strip()]
+
+    body = "\n".join(line.split("#")[0] for line in text.splitlines())
+    start = body.index("[", body.index("names:"))
+    end = body.index("]", start)
+    names = [name.strip().strip("'\"") for name in body[start + 1 : end].split(",")]
+    return [name for name in names if name]
+
+
+def letterbox(
+    img: cv2.typing.MatLike,
+    size: int,
+) -> tuple[np.ndarray, float, tuple[int, int]]:
+    """Resize an image to fit a square, keeping its aspect ratio, and pad it.
+
+    Returns:
+        A tuple of (padded image, scale ratio, (left, top) padding).
+    """
+    height, width = img.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = round(width * ratio), round(height * ratio)
+    if (new_width, new_height) != (width, height):
+        img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    pad_x = (size - new_width) / 2
+    pad_y = (size - new_height) / 2
+    left, right = round(pad_x - 0.1), round(pad_x + 0.1)
+    top, bottom = round(pad_y - 0.1), round(pad_y + 0.1)
+    padded = cv2.copyMakeBorder(
+        img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114)
+    )
+    return np.asarray(padded), ratio, (left, top)
+
+
+def make_blob(padded_images: list[np.ndarray]) -> np.ndarray:
+    """Stack letterboxed HWC uint8 images into an NCHW float32 network input."""
+    # Feed channels in the same order as BrickCamera passes them to the
+    # yolov7 model, so that both backends return the same detections.
+    blob = np.stack([padded.transpose(2, 0, 1) for padded in padded_images])
+    return np.ascontiguousarray(blob, dtype=np.float32) / 255.0
+
+
+def non_max_suppression(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float,
+) -> np.ndarray:
+    """Greedy NMS over (N, 4) xyxy boxes.
+
+    Returns:
+        Indices of the kept boxes, ordered by decreasing score.
+    """
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        width = np.clip(
+            np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None
+        )
+        height = np.clip(
+            np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None
+        )
+        intersection = width * height
+        iou = intersection / (areas[i] + areas[rest] - intersection + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.intp)
+
+
+def decode_predictions(
+    prediction: np.ndarray,
+    ratio: float,
+    pad: tuple[int, int],
+    image_width: int,
+    image_height: int,
+    conf_threshold: float = 0.25,
+    iou_threshold: float = 0.45,
+    max_det: int = 1000,
+) -> np.ndarray:
+    """Convert raw YOLO output for one image to normalized detections.
+
+    Args:
+        prediction: (N, 5 + num_classes) array of center x, center y, width,
+            height (in letterboxed input pixels), objectness, class scores.
+        ratio: Scale ratio returned by letterbox().
+        pad: (left, top) padding returned by letterbox().
+        image_width: Width of the original image in pixels.
+        image_height: Height of the original image in pixels.
+
+    Returns:
+        (M, 6) array of x_center, y_center, width, height (normalized to the
+        original image), confidence and class index, ordered by confidence.
+    """
+    prediction = prediction[prediction[:, 4] > conf_threshold]
+    scores = prediction[:, 5:] * prediction[:, 4:5]
+    class_ids = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(scores)), class_ids]
+    mask = confidences > conf_threshold
+    prediction = prediction[mask]
+    class_ids = class_ids[mask]
+    confidences = confidences[mask]
+
+    # Center xywh => corner xyxy in original image pixels.
+    xy = (prediction[:, :2] - pad) / ratio
+    half_wh = prediction[:, 2:4] / ratio / 2
+    boxes = np.concatenate([xy - half_wh, xy + half_wh], axis=1)
+    boxes[:, 0::2] = boxes[:, 0::2].clip(0, image_width)
+    boxes[:, 1::2] = boxes[:, 1::2].clip(0, image_height)
+
+    keep = non_max_suppression(
+        boxes + (class_ids * _MAX_WH)[:, None], confidences, iou_threshold
+    )[:max_det]
+    boxes = boxes[keep]
+    scale = np.array([image_width, image_height], dtype=np.float32)
+    return np.concatenate(
+        [
+            (boxes[:, :2] + boxes[:, 2:]) / 2 / scale,
+            (boxes[:, 2:] - boxes[:, :2]) / scale,
+            confidences[keep, None],
+            class_ids[keep, None],
+        ],
+        axis=1,
+    ).astype(np.float32)
+
+
+@dataclass
+class OnnxResults:
+    """Detections for a batch of images, like yolov7 results."""
+
+    xywhn: list[np.ndarray]
+    names: list[str]
+
+
+class OnnxModel:
+    """Callable replacement for a yolov7 model, for use with BrickCamera."""
+
+    def __init__(
+        self,
+        backend: Callable[[np.ndarray], np.ndarray],
+        names: list[str],
+        input_size: int = 640,
+        conf_threshold: float = 0.25,
+        iou_threshold: float = 0.45,
+    ) -> None:
+        """Initialize the model.
+
+        Args:
+            backend: Runs the network on a (batch, 3, size, size) float32 blob
+                and returns (batch, N, 5 + num_classes) raw predictions.
+            names: Class names, indexed by class id.
+            input_size: The fixed network input size chosen at export time.
+        """
+        self._backend = backend
+        self.names = names
+        self.input_size = input_size
+        self._conf_threshold = conf_threshold
+        self._iou_threshold = iou_threshold
+
+    def __call__(self, imgs: Any, size: int | None = None) -> OnnxResults:
+        """Detect objects in one BGR image or a list of BGR images."""
+        if size is not None and size != self.input_size:
+            raise ValueError(
+                f"ONNX model has a fixed input size of {self.input_size},"
+                f" re-export it to use size {size}"
+            )
+        if not isinstance(imgs, list):
+            imgs = [imgs]
+
+        letterboxed = [letterbox(img, self.input_size) for img in imgs]
+        blob = make_blob([padded for padded, _, _ in letterboxed])
+        predictions = self._backend(blob)
+
+        xywhn = []
+        for img, prediction, (_, ratio, pad) in zip(imgs, predictions, letterboxed):
+            image_height, image_width = img.shape[:2]
+            xywhn.append(
+                decode_predictions(
+                    prediction,
+                    ratio,
+                    pad,
+                    image_width,
+                    image_height,
+                    self._conf_threshold,
+                    self._iou_threshold,
+                )
+            )
+        return OnnxResults(xywhn=xywhn, names=self.names)
+
+
+class OnnxRuntimeBackend:
+    """Runs an ONNX model with onnxruntime on CPU."""
+
+    def __init__(self, path: Path, threads: int | None = None) -> None:
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("pip install onnxruntime to use this backend") from e
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self._session = onnxruntime.InferenceSession(
+            str(path), options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self._session.get_inputs()[0]
+        self._input_name = model_input.name
+        self.input_size = int(model_input.shape[2])
+        metadata = self._session.get_modelmeta().custom_metadata_map
+        self.names: list[str] | None = (
+            json.loads(metadata["names"]) if "names" in metadata else None
+        )
+
+    def __call__(self, blob: np.ndarray) -> np.ndarray:
+        return self._session.run(None, {self._input_name: blob})[0]
+
+
+class OpenCvBackend:
+    """Runs an ONNX model with the OpenCV DNN module on CPU."""
+
+    def __init__(
+        self,
+        path: Path,
+        threads: int | None = None,
+        input_size: int = 640,
+    ) -> None:
+        if threads:
+            cv2.setNumThreads(threads)
+        self._net = cv2.dnn.readNetFromONNX(str(path))
+        self.input_size = input_size
+        # OpenCV doesn't expose ONNX metadata, so names must be provided.
+        self.names: list[str] | None = None
+
+    def __call__(self, blob: np.ndarray) -> np.ndarray:
+        self._net.setInput(blob)
+        return self._net.forward()
+
+
+def load_onnx_model(
+    path: Path,
+    backend: str = "onnxruntime",
+    names: list[str] | None = None,
+    threads: int | None = None,
+    input_size: int = 640,
+) -> OnnxModel:
+    """Load an exported ONNX model with the given backend.
+
+    Args:
+        path: Path to the .onnx file written by onnx_export.py.
+        backend: Either "onnxruntime" or "opencv".
+        names: Class names. Defaults to the names stored in the model
+            metadata, which only the onnxruntime backend can read.
+        threads: Number of CPU threads for inference (default: all cores).
+        input_size: Input size chosen at export time. Only needed for the
+            opencv backend; onnxruntime reads it from the model.
+    """
+    if backend == "onnxruntime":
+        runner = OnnxRuntimeBackend(path, threads)
+    elif backend == "opencv":
+        runner = OpenCvBackend(path, threads, input_size)
+    else:
+        raise ValueError(f"unknown ONNX backend: {backend}")
+    names = names or runner.names
+    if not names:
+        raise ValueError(f"class names are required for the {backend} backend")
+    return OnnxModel(runner, names, input_size=runner.input_size)
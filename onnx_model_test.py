@@ -0,0 +1,116 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from brick_camera import BrickCamera
+from onnx_model import (
+    OnnxModel,
+    decode_predictions,
+    letterbox,
+    load_class_names,
+    non_max_suppression,
+)
+
+
+def raw_prediction(x, y, w, h, obj, class_scores):
+    """One row of raw YOLO output, in letterboxed input pixels."""
+    return [x, y, w, h, obj, *class_scores]
+
+
+def test_load_class_names_yaml():
+    names = load_class_names(Path("bricks.yaml"))
+    assert len(names) == 63
+    assert names[0] == "98302_engine_smooth_small_1x2_side_plate"
+    assert names[1] == "92950_arch_1x6_raised_arch"
+    assert all("#" not in name and "," not in name for name in names)
+
+
+def test_load_class_names_text(tmp_path):
+    path = tmp_path / "model.names"
+    path.write_text("3001_brick_2x4\n3003_brick_2x2\n\n")
+    assert load_class_names(path) == ["3001_brick_2x4", "3003_brick_2x2"]
+
+
+def test_letterbox_portrait():
+    img = np.zeros((640, 480, 3), dtype=np.uint8)
+    padded, ratio, pad = letterbox(img, 320)
+    assert padded.shape == (320, 320, 3)
+    assert ratio == 0.5
+    assert pad == (40, 0)
+    assert padded[0, 0, 0] == 114  # Gray padding on the left.
+    assert padded[0, 40, 0] == 0
+
+
+def test_non_max_suppression():
+    boxes = np.array(
+        [
+            [0, 0, 10, 10],
+            [1, 1, 11, 11],  # Overlaps the first box.
+            [20, 20, 30, 30],
+        ],
+        dtype=np.float32,
+    )
+    scores = np.array([0.8, 0.9, 0.7], dtype=np.float32)
+    assert non_max_suppression(boxes, scores, 0.45).tolist() == [1, 2]
+    assert non_max_suppression(boxes, scores, 0.9).tolist() == [1, 0, 2]
+
+
+def test_decode_predictions():
+    prediction = np.array(
+        [
+            raw_prediction(160, 160, 40, 20, 0.9, [0.1, 0.9]),
+            raw_prediction(161, 160, 40, 20, 0.8, [0.1, 0.9]),  # Duplicate.
+            raw_prediction(100, 100, 10, 10, 0.9, [0.9, 0.1]),
+            raw_prediction(200, 200, 10, 10, 0.1, [0.9, 0.1]),  # Low objectness.
+        ],
+        dtype=np.float32,
+    )
+    # A 480x640 image letterboxed to 320x320 has ratio 0.5 and pad (40, 0).
+    detections = decode_predictions(prediction, 0.5, (40, 0), 480, 640)
+
+    assert detections.shape == (2, 6)
+    x, y, w, h, conf, cls = detections[0]
+    assert x == pytest.approx((160 - 40) / 0.5 / 480)
+    assert y == pytest.approx(160 / 0.5 / 640)
+    assert w == pytest.approx(40 / 0.5 / 480)
+    assert h == pytest.approx(20 / 0.5 / 640)
+    assert conf == pytest.approx(0.81)
+    assert cls == 1
+    assert detections[1, 5] == 0
+
+
+def test_decode_predictions_empty():
+    prediction = np.zeros((0, 7), dtype=np.float32)
+    assert decode_predictions(prediction, 1.0, (0, 0), 640, 480).shape == (0, 6)
+
+
+def test_onnx_model_with_brick_camera():
+    blobs = []
+
+    def backend(blob):
+        blobs.append(blob)
+        row = raw_prediction(160, 160, 40, 20, 0.9, [0.1, 0.9])
+        return np.array([[row]] * len(blob), dtype=np.float32)
+
+    model = OnnxModel(backend, ["3001_brick_2x4", "3003_brick_2x2"], input_size=320)
+    camera = BrickCamera(model)
+    img = np.zeros((640, 480, 3), dtype=np.uint8)
+
+    hypotheses = camera.recognize(img, capture_timestamp=1.0)
+    assert blobs[0].shape == (1, 3, 320, 320)
+    assert blobs[0].dtype == np.float32
+    assert len(hypotheses) == 1
+    assert hypotheses[0].class_name == "3003_brick_2x2"
+    assert hypotheses[0].x_center == pytest.approx(0.5)
+    assert hypotheses[0].confidence == pytest.approx(0.81)
+
+    batch = camera.recognize_batch([img, img], [1.0, 2.0])
+    assert blobs[1].shape == (2, 3, 320, 320)
+    assert [len(hypotheses) for hypotheses in batch] == [1, 1]
+
+
+def test_onnx_model_fixed_input_size():
+    model = OnnxModel(lambda blob: blob, ["a"], input_size=320)
+    with pytest.raises(ValueError, match="fixed input size of 320"):
+        model(np.zeros((64, 48, 3), dtype=np.uint8), size=640)
@@ -0,0 +1,223 @@
+"""Multi-threaded processing pipeline joined by bounded queues."""
+
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Collection
+from dataclasses import dataclass
+from typing import Any
+
+
+class DropOldestQueue:
+    """A bounded FIFO queue that discards the oldest item when it is full.
+
+    Producers never block: when a slow consumer falls behind, stale items
+    (e.g. old camera frames) are dropped so that fresh ones get through.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        assert maxsize > 0
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items: deque[Any] = deque()
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._items)
+
+    @property
+    def closed(self) -> bool:
+        """True if close() was called and all items have been consumed."""
+        with self._cond:
+            return self._closed and not self._items
+
+    def put(self, item: Any) -> None:
+        """Append an item, dropping the oldest one if the queue is full."""
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout: float | None = None) -> Any:
+        """Remove and return the oldest item.
+
+        Returns:
+            The oldest item, or None on timeout or if the queue was closed
+            and all remaining items have already been consumed.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self._closed, timeout)
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def close(self) -> None:
+        """Wake up all consumers; get() returns None once the queue is empty."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class BlockingQueue(DropOldestQueue):
+    """A bounded FIFO queue whose producers wait while it is full.
+
+    For items that must never be dropped, e.g. recognized bricks on their
+    way to the servos. A slow consumer slows down the producer instead.
+    """
+
+    def put(self, item: Any) -> None:
+        """Append an item, waiting for space unless the queue was closed."""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._items) < self.maxsize or self._closed)
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def get(self, timeout: float | None = None) -> Any:
+        item = super().get(timeout)
+        with self._cond:
+            self._cond.notify_all()  # Wake up a waiting producer.
+        return item
+
+
+@dataclass
+class StageStats:
+    """Counters for a single pipeline stage."""
+
+    name: str
+    processed: int = 0
+    busy_seconds: float = 0.0
+
+
+class Pipeline:
+    """Runs a source and a chain of stages, each on its own thread.
+
+    The source is called repeatedly to produce items, e.g. camera frames.
+    It returns None at the end of the stream. Each stage transforms an item
+    and returns the input for the next stage, or None to drop the item.
+    Results of the last stage are put into the output queue, which can be
+    consumed from the main thread (e.g. for cv2.imshow).
+
+    Since every stage runs concurrently, the sustained throughput is limited
+    by the slowest stage, not by the sum of all stages. By default, each
+    queue drops its oldest item when it is full, so that a slow stage works
+    on fresh items; the inputs of blocking stages are never dropped.
+    """
+
+    def __init__(
+        self,
+        source: Callable[[], Any],
+        stages: list[tuple[str, Callable[[Any], Any]]],
+        maxsize: int = 2,
+        blocking_stages: Collection[str] = (),
+    ) -> None:
+        """Initialize the pipeline.
+
+        Args:
+            source: Called in a loop to produce items, returns None when done.
+            stages: List of (name, function) tuples, applied in order.
+            maxsize: Capacity of each queue between stages.
+            blocking_stages: Names of the stages whose input queue makes the
+                previous stage wait instead of dropping items.
+        """
+        self._source = source
+        self._stages = stages
+        self.stats = [StageStats("source")] + [StageStats(name) for name, _ in stages]
+        # queues[i] feeds stages[i]; the last queue is the pipeline output.
+        self.queues: list[DropOldestQueue] = [
+            BlockingQueue(maxsize)
+            if name in blocking_stages
+            else DropOldestQueue(maxsize)
+            for name, _ in stages
+        ]
+        self.queues.append(DropOldestQueue(maxsize))
+        self._stop_event = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._start_time = 0.0
+
+    @property
+    def output(self) -> DropOldestQueue:
+        """The queue that receives the results of the last stage."""
+        return self.queues[-1]
+
+    def start(self) -> None:
+        """Start one background thread for the source and each stage."""
+        if self._threads:
+            return
+        self._stop_event.clear()
+        self._start_time = time.monotonic()
+        self._threads.append(threading.Thread(target=self._run_source, daemon=True))
+        for index in range(len(self._stages)):
+            thread = threading.Thread(
+                target=self._run_stage, args=(index,), daemon=True
+            )
+            self._threads.append(thread)
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """Stop all threads and wait for them to finish."""
+        self._stop_event.set()
+        for queue in self.queues:
+            queue.close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _run_source(self) -> None:
+        """Background thread loop to produce items."""
+        stats = self.stats[0]
+        try:
+            while not self._stop_event.is_set():
+                start_time = time.perf_counter()
+                item = self._source()
+                stats.busy_seconds += time.perf_counter() - start_time
+                if item is None:
+                    break
+                stats.processed += 1
+                self.queues[0].put(item)
+        finally:
+            self.queues[0].close()
+
+    def _run_stage(self, index: int) -> None:
+        """Background thread loop for a single stage."""
+        _, function = self._stages[index]
+        stats = self.stats[index + 1]
+        input_queue = self.queues[index]
+        output_queue = self.queues[index + 1]
+        try:
+            while not self._stop_event.is_set():
+                item = input_queue.get()
+                if item is None:
+                    break  # Input queue was closed.
+                start_time = time.perf_counter()
+                result = function(item)
+                stats.busy_seconds += time.perf_counter() - start_time
+                stats.processed += 1
+                if result is not None:
+                    output_queue.put(result)
+        finally:
+            output_queue.close()
+
+    def throughput(self) -> dict[str, float]:
+        """Return the number of items per second processed by each stage."""
+        elapsed = time.monotonic() - self._start_time
+        if not self._start_time or elapsed <= 0:
+            return {stats.name: 0.0 for stats in self.stats}
+        return {stats.name: stats.processed / elapsed for stats in self.stats}
+
+    def report(self) -> str:
+        """Return a human-readable summary of throughput and queue depth."""
+        elapsed = time.monotonic() - self._start_time
+        throughput = self.throughput()
+        lines = []
+        for stats, queue in zip(self.stats, self.queues):
+            busy = stats.busy_seconds / elapsed if elapsed > 0 else 0.0
+            lines.append(
+                f"{stats.name}: {throughput[stats.name]:.1f}/s, busy {busy:.0%},"
+                f" queue {len(queue)}/{queue.maxsize}, dropped {queue.dropped}"
+            )
+        return "\n".join(lines)
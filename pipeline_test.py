@@ -0,0 +1,186 @@
+import threading
+import time
+
+from pipeline import BlockingQueue, DropOldestQueue, Pipeline
+
+
+def make_source(items):
+    """Return a source function that yields the given items, then None."""
+    iterator = iter(items)
+    return lambda: next(iterator, None)
+
+
+def drain(queue):
+    results = []
+    while (item := queue.get(timeout=1.0)) is not None:
+        results.append(item)
+    return results
+
+
+def test_drop_oldest_queue():
+    queue = DropOldestQueue(maxsize=2)
+    queue.put(1)
+    queue.put(2)
+    queue.put(3)  # Drops 1.
+    assert len(queue) == 2
+    assert queue.dropped == 1
+    assert queue.get() == 2
+    assert queue.get() == 3
+    assert queue.get(timeout=0.01) is None
+
+
+def test_drop_oldest_queue_close():
+    queue = DropOldestQueue(maxsize=2)
+    queue.put("a")
+    queue.close()
+    assert not queue.closed  # Still has an item.
+    assert queue.get() == "a"
+    assert queue.closed
+    assert queue.get() is None  # Doesn't block after close.
+
+
+def test_drop_oldest_queue_wakes_consumer():
+    queue = DropOldestQueue(maxsize=1)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(queue.get(timeout=1.0)))
+    thread.start()
+    time.sleep(0.01)
+    queue.put("frame")
+    thread.join()
+    assert results == ["frame"]
+
+
+def test_blocking_queue_waits_for_space():
+    queue = BlockingQueue(maxsize=1)
+    queue.put("a")
+    thread = threading.Thread(target=lambda: queue.put("b"))
+    thread.start()
+    time.sleep(0.01)
+    assert thread.is_alive()  # Waiting instead of dropping "a".
+    assert queue.get() == "a"
+    thread.join(timeout=1.0)
+    assert queue.get() == "b"
+    assert queue.dropped == 0
+
+    # Closing wakes up waiting producers.
+    queue.put("c")
+    thread = threading.Thread(target=lambda: queue.put("d"))
+    thread.start()
+    queue.close()
+    thread.join(timeout=1.0)
+    assert not thread.is_alive()
+
+
+def test_pipeline_processes_items_in_order():
+    pipeline = Pipeline(
+        source=make_source(range(10)),
+        stages=[("double", lambda x: 2 * x), ("plus_one", lambda x: x + 1)],
+        maxsize=100,
+    )
+    pipeline.start()
+    try:
+        assert drain(pipeline.output) == [2 * x + 1 for x in range(10)]
+    finally:
+        pipeline.stop()
+
+    assert [s.name for s in pipeline.stats] == ["source", "double", "plus_one"]
+    assert [s.processed for s in pipeline.stats] == [10, 10, 10]
+    assert all(q.dropped == 0 for q in pipeline.queues)
+
+
+def test_pipeline_stage_can_drop_items():
+    pipeline = Pipeline(
+        source=make_source(range(10)),
+        stages=[("even", lambda x: x if x % 2 == 0 else None)],
+        maxsize=100,
+    )
+    pipeline.start()
+    try:
+        assert drain(pipeline.output) == [0, 2, 4, 6, 8]
+    finally:
+        pipeline.stop()
+
+
+def test_pipeline_overlaps_stages():
+    def slow(x):
+        time.sleep(0.02)
+        return x
+
+    pipeline = Pipeline(
+        source=make_source(range(10)),
+        stages=[("first", slow), ("second", slow)],
+        maxsize=100,
+    )
+    start_time = time.monotonic()
+    pipeline.start()
+    try:
+        assert len(drain(pipeline.output)) == 10
+    finally:
+        pipeline.stop()
+    elapsed = time.monotonic() - start_time
+
+    # Sequential processing would take 10 * (0.02 + 0.02) = 0.4 seconds.
+    assert elapsed < 0.35
+    throughput = pipeline.throughput()
+    assert throughput["first"] > 0
+    assert "first:" in pipeline.report()
+    assert "queue" in pipeline.report()
+
+
+def test_pipeline_drops_oldest_when_consumer_is_slow():
+    def slow(x):
+        time.sleep(0.01)
+        return x
+
+    pipeline = Pipeline(
+        source=make_source(range(50)),
+        stages=[("slow", slow)],
+        maxsize=1,
+    )
+    pipeline.start()
+    try:
+        results = drain(pipeline.output)
+    finally:
+        pipeline.stop()
+
+    assert results[-1] == 49  # The most recent item always gets through.
+    assert pipeline.queues[0].dropped > 0
+    assert pipeline.stats[1].processed < 50
+
+
+def test_pipeline_blocking_stage_gets_all_items():
+    dispatched = []
+
+    def slow(x):
+        time.sleep(0.005)
+        dispatched.append(x)
+        return x
+
+    pipeline = Pipeline(
+        source=make_source(range(50)),
+        stages=[("inference", lambda x: x), ("dispatch", slow)],
+        maxsize=1,
+        blocking_stages=["dispatch"],
+    )
+    pipeline.start()
+    try:
+        drain(pipeline.output)
+    finally:
+        pipeline.stop()
+
+    assert isinstance(pipeline.queues[1], BlockingQueue)
+    assert pipeline.queues[0].dropped > 0  # Frames may be dropped,
+    assert pipeline.queues[1].dropped == 0  # but not inference results.
+    assert len(dispatched) == pipeline.stats[1].processed
+    assert dispatched == sorted(dispatched)
+
+
+def test_pipeline_stop_while_running():
+    pipeline = Pipeline(
+        source=lambda: time.sleep(0.001) or 1,
+        stages=[("identity", lambda x: x)],
+    )
+    pipeline.start()
+    time.sleep(0.02)
+    pipeline.stop()
+    assert pipeline.stats[0].processed > 0
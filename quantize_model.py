@@ -0,0 +1,241 @@
+#!/usr/bin/env -S uv run
+
+"""Post-training INT8 quantization of an exported ONNX brick detector.
+
+Calibrates on images from an exported dataset split (see cluster_images.py
+and YoloExporter), then compares per-class accuracy and latency of the INT8
+model against the FP32 model, using the same evaluation loop as
+brick_camera_demo.py.
+"""
+
+import argparse
+import json
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import cv2
+import numpy as np
+
+from brick_camera import BrickCamera
+from brick_evaluation import Evaluation, collect_images, evaluate
+from onnx_model import letterbox, load_onnx_model, make_blob
+
+
+def calibration_blobs(image_paths: list[Path], input_size: int) -> Iterator[np.ndarray]:
+    """Preprocess calibration images exactly like OnnxModel does at runtime."""
+    for path in image_paths:
+        img = cv2.imread(str(path))
+        if img is None:
+            print(f"Failed to load {path}")
+            continue
+        padded, _, _ = letterbox(img, input_size)
+        yield make_blob([padded])
+
+
+def exclude_calibration(
+    eval_paths: list[Path], calibration_paths: list[Path]
+) -> list[Path]:
+    """Drop calibration images from the evaluation images.
+
+    Images seen during calibration would inflate the INT8 accuracy, e.g.
+    when both are sampled from the same split.
+    """
+    calibration = {path.resolve() for path in calibration_paths}
+    kept = [path for path in eval_paths if path.resolve() not in calibration]
+    if len(kept) < len(eval_paths):
+        print(f"Excluding {len(eval_paths) - len(kept)} calibration images")
+    assert calibration.isdisjoint(path.resolve() for path in kept)
+    return kept
+
+
+def quantize(
+    fp32_path: Path,
+    int8_path: Path,
+    calibration_paths: list[Path],
+) -> None:
+    """Write a statically quantized INT8 copy of the FP32 model."""
+    import onnxruntime
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+
+    session = onnxruntime.InferenceSession(
+        str(fp32_path), providers=["CPUExecutionProvider"]
+    )
+    model_input = session.get_inputs()[0]
+    blobs = calibration_blobs(calibration_paths, int(model_input.shape[2]))
+
+    class ImageReader(CalibrationDataReader):
+        def get_next(self) -> dict[str, np.ndarray] | None:
+            blob = next(blobs, None)
+            return None if blob is None else {model_input.name: blob}
+
+    quantize_static(
+        str(fp32_path),
+        str(int8_path),
+        ImageReader(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+
+
+def summarize(evaluation: Evaluation) -> dict[str, Any]:
+    """Overall accuracy and latency of one model, for the JSON report."""
+    l_min, l_max, l_avg, l_med = evaluation.latency
+    return {
+        "accuracy": evaluation.accuracy,
+        "correct": evaluation.correct,
+        "total": evaluation.total,
+        "latency": {"min": l_min, "max": l_max, "avg": l_avg, "median": l_med},
+    }
+
+
+def compare(
+    fp32: Evaluation,
+    int8: Evaluation,
+    max_drop: float = 0.05,
+) -> dict[str, Any]:
+    """Compare two evaluations on the same images.
+
+    Args:
+        fp32: Evaluation of the original model.
+        int8: Evaluation of the quantized model.
+        max_drop: Classes whose accuracy drops by more than this fraction
+            are listed as regressions.
+    """
+    classes = []
+    regressions = []
+    for name in sorted(fp32.per_class.keys() | int8.per_class.keys()):
+        before = fp32.per_class.get(name)
+        after = int8.per_class.get(name)
+        fp32_accuracy = before.accuracy if before else 0.0
+        int8_accuracy = after.accuracy if after else 0.0
+        delta = int8_accuracy - fp32_accuracy
+        classes.append(
+            {
+                "name": name,
+                "images": before.total if before else 0,
+                "fp32": fp32_accuracy,
+                "int8": int8_accuracy,
+                "delta": delta,
+            }
+        )
+        if delta < -max_drop:
+            regressions.append(name)
+
+    fp32_median = fp32.latency[3]
+    int8_median = int8.latency[3]
+    return {
+        "fp32": summarize(fp32),
+        "int8": summarize(int8),
+        "speedup": fp32_median / int8_median if int8_median else 0.0,
+        "classes": classes,
+        "regressions": regressions,
+    }
+
+
+def format_report(report: dict[str, Any]) -> str:
+    """Format a report from compare() as a human-readable table."""
+    longest = max((len(c["name"]) for c in report["classes"]), default=5)
+    lines = [f"{'class':<{longest}}  images   fp32   int8   delta"]
+    for c in report["classes"]:
+        flag = "  <<<" if c["name"] in report["regressions"] else ""
+        lines.append(
+            f"{c['name']:<{longest}}  {c['images']:>6}  {c['fp32']:>5.1%}"
+            f"  {c['int8']:>5.1%}  {c['delta']:>+6.1%}{flag}"
+        )
+    for model in ("fp32", "int8"):
+        summary = report[model]
+        latency = summary["latency"]
+        lines.append(
+            f"{model}: accuracy {summary['accuracy']:.1%}"
+            f" ({summary['correct']}/{summary['total']}),"
+            f" median latency {latency['median'] * 1000:.1f}ms,"
+            f" max {latency['max'] * 1000:.1f}ms"
+        )
+    lines.append(f"speedup: {report['speedup']:.2f}x")
+    lines.append(f"regressions: {len(report['regressions'])} classes")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="INT8 quantization report")
+    parser.add_argument("model", type=Path, help="FP32 model from onnx_export.py")
+    parser.add_argument(
+        "--dataset",
+        type=Path,
+        default=Path("../exported"),
+        help="Dataset directory written by cluster_images.py",
+    )
+    parser.add_argument(
+        "--calibration-split", default="val2023", help="Split for calibration"
+    )
+    parser.add_argument(
+        "--calibration-per-class",
+        type=int,
+        default=4,
+        help="Number of calibration images per class",
+    )
+    parser.add_argument(
+        "--eval-split",
+        default="test2023",
+        help="Split to evaluate; calibration images are never evaluated",
+    )
+    parser.add_argument(
+        "--per-class", type=int, default=10, help="Evaluation images per class"
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument(
+        "--max-drop",
+        type=float,
+        default=0.05,
+        help="Flag classes whose accuracy drops by more than this fraction",
+    )
+    parser.add_argument(
+        "--threads", type=int, default=None, help="Number of inference threads"
+    )
+    parser.add_argument("--output", type=Path, default=None, help="INT8 model path")
+    parser.add_argument(
+        "--report", type=Path, default=None, help="Write JSON report to this path"
+    )
+    args = parser.parse_args()
+
+    int8_path = args.output or args.model.with_suffix(".int8.onnx")
+    images = args.dataset / "images"
+
+    calibration_paths = collect_images(
+        images / args.calibration_split,
+        per_class=args.calibration_per_class,
+        seed=args.seed,
+    )
+    print(f"Calibrating on {len(calibration_paths)} images...")
+    quantize(args.model, int8_path, calibration_paths)
+    print(f"Quantized model saved to {int8_path}")
+
+    eval_paths = collect_images(
+        images / args.eval_split, per_class=args.per_class, seed=args.seed + 1
+    )
+    eval_paths = exclude_calibration(eval_paths, calibration_paths)
+    print(f"Evaluating on {len(eval_paths)} images...")
+    fp32_model = load_onnx_model(args.model, threads=args.threads)
+    evaluations = {}
+    for name, path in [("fp32", args.model), ("int8", int8_path)]:
+        # The quantizer may drop metadata, so reuse the FP32 class names.
+        model = load_onnx_model(path, names=fp32_model.names, threads=args.threads)
+        evaluations[name] = evaluate(BrickCamera(model), eval_paths, verbose=False)
+
+    report = compare(evaluations["fp32"], evaluations["int8"], args.max_drop)
+    print(format_report(report))
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Report saved to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+import pytest
+
+from brick_evaluation import ClassAccuracy, Evaluation
+from quantize_model import (
+    calibration_blobs,
+    compare,
+    exclude_calibration,
+    format_report,
+)
+
+
+def make_evaluation(per_class, median_latency):
+    evaluation = Evaluation()
+    for name, (correct, total) in per_class.items():
+        evaluation.per_class[name] = ClassAccuracy(correct, total)
+    evaluation.latency = (
+        median_latency,
+        median_latency,
+        median_latency,
+        median_latency,
+    )
+    return evaluation
+
+
+def test_calibration_blobs(tmp_path):
+    path = tmp_path / "img.jpg"
+    cv2.imwrite(str(path), np.zeros((640, 480, 3), dtype=np.uint8))
+    blobs = list(calibration_blobs([path, tmp_path / "missing.jpg"], 320))
+    assert len(blobs) == 1
+    assert blobs[0].shape == (1, 3, 320, 320)
+    assert blobs[0].dtype == np.float32
+
+
+def test_exclude_calibration(tmp_path):
+    paths = [tmp_path / "val2023" / f"{i}.jpg" for i in range(4)]
+    kept = exclude_calibration(paths, [paths[1], tmp_path / "val2023/../val2023/3.jpg"])
+    assert kept == [paths[0], paths[2]]
+    assert exclude_calibration(paths, []) == paths
+
+
+def test_compare():
+    fp32 = make_evaluation(
+        {"3001_brick_2x4": (10, 10), "3003_brick_2x2": (9, 10)}, 0.04
+    )
+    int8 = make_evaluation(
+        {"3001_brick_2x4": (10, 10), "3003_brick_2x2": (7, 10)}, 0.01
+    )
+    report = compare(fp32, int8, max_drop=0.05)
+
+    assert report["fp32"]["accuracy"] == pytest.approx(0.95)
+    assert report["int8"]["accuracy"] == pytest.approx(0.85)
+    assert report["speedup"] == pytest.approx(4.0)
+    assert report["classes"][1] == {
+        "name": "3003_brick_2x2",
+        "images": 10,
+        "fp32": pytest.approx(0.9),
+        "int8": pytest.approx(0.7),
+        "delta": pytest.approx(-0.2),
+    }
+    assert report["regressions"] == ["3003_brick_2x2"]
+
+
+def test_format_report():
+    fp32 = make_evaluation({"3001_brick_2x4": (1, 1)}, 0.04)
+    int8 = make_evaluation({"3001_brick_2x4": (0, 1)}, 0.02)
+    text = format_report(compare(fp32, int8))
+    assert "3001_brick_2x4       1  100.0%   0.0%  -100.0%  <<<" in text
+    assert "int8: accuracy 0.0% (0/1), median latency 20.0ms" in text
+    assert "speedup: 2.00x" in text
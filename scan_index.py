@@ -0,0 +1,260 @@
+"""Persistent index of captured images, so the capture tree isn't rescanned.
+
+The capture tree holds millions of JPEG files whose names encode the
+capture time and the bounding box of the brick, e.g.
+20230523_105352366_l10_r20_t30_b40_w10_h10.jpg. ScanIndex stores each
+directory with its mtime, and each image with the fields parsed from its
+name, in an SQLite database. A directory's mtime changes whenever files are
+added to, removed from or renamed in it, so update() lists only directories
+whose mtime changed, and parses only the names that are new in them. The
+other directories each cost a single stat().
+"""
+
+import functools
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Self
+
+EPOCH = datetime(1970, 1, 1)
+
+# Directory mtimes have coarse resolution on some filesystems, so a file
+# added right after a scan may not change it. Directories modified this
+# recently are scanned again on the next update.
+RACY_MTIME_NS = 2_000_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,  -- relative to the root, "" for the root itself
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_by_parent ON dirs (parent);
+CREATE TABLE IF NOT EXISTS images (
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    timestamp_ms INTEGER,  -- NULL if the name has no capture time
+    bbox_left INTEGER,  -- NULL if the name has no bounding box
+    bbox_right INTEGER,
+    bbox_top INTEGER,
+    bbox_bottom INTEGER,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (dir, name)
+);
+"""
+
+
+@functools.lru_cache(maxsize=4096)
+def _days(date: str) -> int:
+    """Days since 1970 of a YYYYmmdd date; raises ValueError if it is invalid."""
+    return (
+        datetime(int(date[:4]), int(date[4:6]), int(date[6:8])).toordinal()
+        - EPOCH.toordinal()
+    )
+
+
+def timestamp_ms(filename: str) -> int:
+    """Parses the capture time from a filename, in milliseconds since 1970.
+
+    Example: 20230523_105352366_... -> 1684839232366
+
+    Raises:
+        ValueError: If the name doesn't start with a timestamp.
+        IndexError: If the name has no underscore.
+    """
+    # Fast path for the fixed-width YYYYmmdd_HHMMSSfff prefix.
+    head = filename[:18]
+    if (
+        len(head) == 18
+        and head[8] == "_"
+        and filename[18:19] in ("", "_")
+        and head.isascii()
+        and head[:8].isdigit()
+        and head[9:].isdigit()
+    ):
+        hours, minutes, seconds = int(head[9:11]), int(head[11:13]), int(head[13:15])
+        if hours < 24 and minutes < 60 and seconds < 60:
+            seconds += (_days(head[:8]) * 24 + hours) * 3600 + minutes * 60
+            return seconds * 1000 + int(head[15:])
+
+    parts = filename.split("_")
+    ts_str = parts[0] + parts[1]  # YYYYmmdd + HHMMSSfff
+    dt = datetime.strptime(ts_str, "%Y%m%d%H%M%S%f")
+    return (dt - EPOCH) // timedelta(milliseconds=1)
+
+
+def to_datetime(timestamp: int) -> datetime:
+    """Converts milliseconds since 1970 back to a naive datetime."""
+    return EPOCH + timedelta(milliseconds=timestamp)
+
+
+def parse_bbox(filename: str) -> tuple[int, int, int, int] | None:
+    """Parses (left, right, top, bottom) from a filename, or returns None."""
+    match = re.search(r"_l(\d+)_r(\d+)_t(\d+)_b(\d+)_", filename)
+    if not match:
+        return None
+    left, right, top, bottom = (int(number) for number in match.groups())
+    return left, right, top, bottom
+
+
+class ScanIndex:
+    """SQLite index of the JPEG files below one root directory."""
+
+    def __init__(self, db_path: Path, root: Path) -> None:
+        self.root = root
+        self.scanned_dirs = 0
+        self.unchanged_dirs = 0
+        self._db = sqlite3.connect(db_path)
+        self._db.executescript(SCHEMA)
+        # An index of a different tree is useless, start over.
+        resolved = str(root.resolve())
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'root'").fetchone()
+        if row is None or row[0] != resolved:
+            with self._db:
+                self._db.execute("DELETE FROM dirs")
+                self._db.execute("DELETE FROM images")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('root', ?)", (resolved,)
+                )
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _relative(self, path: Path) -> str:
+        relative = path.relative_to(self.root).as_posix()
+        return "" if relative == "." else relative
+
+    def update(self) -> None:
+        """Brings the index up to date with the directory tree."""
+        self.scanned_dirs = 0
+        self.unchanged_dirs = 0
+        with self._db:
+            self._update_dir("", None)
+
+    def _update_dir(self, relative: str, parent: str | None) -> None:
+        path = self.root / relative
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._forget_dir(relative)
+            return
+
+        row = self._db.execute(
+            "SELECT mtime_ns FROM dirs WHERE path = ?", (relative,)
+        ).fetchone()
+        if row is not None and row[0] == mtime_ns:
+            self.unchanged_dirs += 1
+            subdirs = [
+                subdir
+                for (subdir,) in self._db.execute(
+                    "SELECT path FROM dirs WHERE parent = ?", (relative,)
+                )
+            ]
+        else:
+            self.scanned_dirs += 1
+            subdirs = self._scan_dir(relative, path)
+            if time.time_ns() - mtime_ns < RACY_MTIME_NS:
+                mtime_ns = -1
+            self._db.execute(
+                "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)",
+                (relative, parent, mtime_ns),
+            )
+        for subdir in subdirs:
+            self._update_dir(subdir, relative)
+
+    def _scan_dir(self, relative: str, path: Path) -> list[str]:
+        """Updates the images of one directory and returns its subdirectories."""
+        prefix = f"{relative}/" if relative else ""
+        subdirs = []
+        names = {}
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    subdirs.append(prefix + entry.name)
+                elif entry.is_file() and entry.name.endswith(".jpg"):
+                    names[entry.name] = entry
+
+        known = {
+            name
+            for (name,) in self._db.execute(
+                "SELECT name FROM images WHERE dir = ?", (relative,)
+            )
+        }
+        self._db.executemany(
+            "DELETE FROM images WHERE dir = ? AND name = ?",
+            [(relative, name) for name in known - names.keys()],
+        )
+        rows = []
+        for name in names.keys() - known:
+            try:
+                timestamp = timestamp_ms(name)
+            except (ValueError, IndexError):
+                timestamp = None
+            bbox = parse_bbox(name) or (None, None, None, None)
+            mtime_ns = names[name].stat().st_mtime_ns
+            rows.append((relative, name, timestamp, *bbox, mtime_ns))
+        self._db.executemany("INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+        removed = {
+            subdir
+            for (subdir,) in self._db.execute(
+                "SELECT path FROM dirs WHERE parent = ?", (relative,)
+            )
+        } - set(subdirs)
+        for subdir in removed:
+            self._forget_dir(subdir)
+        return subdirs
+
+    def _forget_dir(self, relative: str) -> None:
+        """Removes a directory that no longer exists, and everything below it."""
+        # Paths below relative sort between "relative/" and "relative0".
+        below = (relative, f"{relative}/", f"{relative}0")
+        self._db.execute(
+            "DELETE FROM images WHERE dir = ? OR (dir >= ? AND dir < ?)", below
+        )
+        self._db.execute(
+            "DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", below
+        )
+
+    def dirs_with_jpg_files(self) -> list[Path]:
+        """Returns the indexed directories that contain JPG images."""
+        return [
+            self.root / relative
+            for (relative,) in self._db.execute(
+                "SELECT DISTINCT dir FROM images ORDER BY dir"
+            )
+        ]
+
+    def images(self, directory: Path) -> list[tuple[int, Path]]:
+        """Returns (timestamp_ms, path) of the timestamped images in directory.
+
+        The images are sorted by capture time, then by path.
+        """
+        rows = self._db.execute(
+            "SELECT timestamp_ms, name FROM images"
+            " WHERE dir = ? AND timestamp_ms IS NOT NULL",
+            (self._relative(directory),),
+        )
+        return sorted((timestamp, directory / name) for timestamp, name in rows)
+
+    def bbox(self, path: Path) -> tuple[int, int, int, int] | None:
+        """Returns (left, right, top, bottom) parsed from an image name."""
+        row = self._db.execute(
+            "SELECT bbox_left, bbox_right, bbox_top, bbox_bottom FROM images"
+            " WHERE dir = ? AND name = ? AND bbox_left IS NOT NULL",
+            (self._relative(path.parent), path.name),
+        ).fetchone()
+        return None if row is None else tuple(row)
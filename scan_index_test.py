@@ -0,0 +1,119 @@
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from scan_index import ScanIndex, parse_bbox, timestamp_ms, to_datetime
+
+
+def make_old(*paths: Path) -> None:
+    """Sets an mtime that isn't racy, so that the index trusts it."""
+    for path in paths:
+        os.utime(path, ns=(0, 0))
+
+
+def test_timestamp_ms():
+    ms = timestamp_ms("20230523_105352366_foo.jpg")
+    assert to_datetime(ms).isoformat() == "2023-05-23T10:53:52.366000"
+
+    with pytest.raises(ValueError):
+        timestamp_ms("invalid_filename.jpg")
+    with pytest.raises(IndexError):
+        timestamp_ms("20230523.jpg")
+
+
+@pytest.mark.parametrize(
+    "filename",
+    [
+        "20230523_105352366.jpg",  # Not the fixed-width prefix.
+        "20240229_235959999_a.jpg",
+        "19991231_000000000_a.jpg",
+        "20230523_1053523_a.jpg",
+        "20230523_105352366123_a.jpg",
+        "20230230_105352366_a.jpg",
+        "20230523_245352366_a.jpg",
+        "20230523_106052366_a.jpg",
+        "2023O523_105352366_a.jpg",
+        "20230523_１05352366_a.jpg",
+    ],
+)
+def test_timestamp_ms_like_strptime(filename):
+    parts = filename.split("_")
+    try:
+        dt = datetime.strptime(parts[0] + parts[1], "%Y%m%d%H%M%S%f")
+    except ValueError:
+        with pytest.raises(ValueError):
+            timestamp_ms(filename)
+        return
+    expected = (dt - datetime(1970, 1, 1)) // timedelta(milliseconds=1)
+    assert timestamp_ms(filename) == expected
+
+
+def test_parse_bbox():
+    assert parse_bbox("20230523_105352366_l10_r20_t30_b40_w10_h10.jpg") == (
+        10,
+        20,
+        30,
+        40,
+    )
+    assert parse_bbox("20230523_105352366_a.jpg") is None
+
+
+def test_update_incrementally(tmp_path):
+    a = tmp_path / "input" / "3001_brick_2x4"
+    b = tmp_path / "input" / "minifig" / "head"
+    a.mkdir(parents=True)
+    b.mkdir(parents=True)
+    (a / "20230523_105352000_l10_r20_t30_b40_w10_h10.jpg").touch()
+    (a / "20230523_105351000_a.jpg").touch()
+    (a / "invalid_name.jpg").touch()
+    (a / "notes.txt").touch()
+    (b / "20230523_110000000_a.jpg").touch()
+    root = tmp_path / "input"
+    make_old(root, a, b.parent, b)
+
+    with ScanIndex(tmp_path / "index.sqlite", root) as index:
+        index.update()
+        assert (index.scanned_dirs, index.unchanged_dirs) == (4, 0)
+        assert index.dirs_with_jpg_files() == [a, b]
+        assert [path.name for _, path in index.images(a)] == [
+            "20230523_105351000_a.jpg",
+            "20230523_105352000_l10_r20_t30_b40_w10_h10.jpg",
+        ]
+        assert index.bbox(a / "20230523_105352000_l10_r20_t30_b40_w10_h10.jpg") == (
+            10,
+            20,
+            30,
+            40,
+        )
+
+    # A new file changes only the mtime of its own directory.
+    (b / "20230523_110001000_a.jpg").touch()
+    with ScanIndex(tmp_path / "index.sqlite", root) as index:
+        index.update()
+        assert (index.scanned_dirs, index.unchanged_dirs) == (1, 3)
+        assert len(index.images(b)) == 2
+        make_old(b)
+
+    # Removing a directory forgets everything below it.
+    for path in b.iterdir():
+        path.unlink()
+    b.rmdir()
+    b.parent.rmdir()
+    with ScanIndex(tmp_path / "index.sqlite", root) as index:
+        index.update()
+        assert (index.scanned_dirs, index.unchanged_dirs) == (1, 1)
+        assert index.dirs_with_jpg_files() == [a]
+        assert index.images(b) == []
+
+
+def test_other_root_starts_over(tmp_path):
+    for name in ("first", "second"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / f"20230523_105352000_{name}.jpg").touch()
+
+    for name in ("first", "second"):
+        with ScanIndex(tmp_path / "index.sqlite", tmp_path / name) as index:
+            index.update()
+            assert index.dirs_with_jpg_files() == [tmp_path / name]
@@ -1,7 +1,16 @@
+import struct
+import time
 from typing import Any
 
 DEBUG = False
 
+# PCA9685 register of LED0_ON_L; each channel has 4 registers from here on.
+_LED0_ON_L = 0x06
+
+# Default servo pulse widths for 0 and 180 degrees.
+MIN_PULSE_USEC = 600.0
+MAX_PULSE_USEC = 2400.0
+
 
 class ServoController:
     """Interface for a multi-channel PWM servo controller."""
@@ -11,36 +20,176 @@ class ServoController:
         pca: Any,  # Real PCA9685 or MagicMock.
         num_channels: int = 16,
         frequency: float = 50.0,  # Hz
+        angle_resolution: float = 0.5,  # degrees
     ) -> None:
         self.pca = pca
         self.num_channels = num_channels
+        # (min, max) pulse width in microseconds of each channel, for 0 and
+        # 180 degrees. See calibrate().
+        self._pulse_ranges = [(MIN_PULSE_USEC, MAX_PULSE_USEC)] * num_channels
+        # Per-channel lookup tables from angle / angle_resolution to (on, off).
+        self._steps_per_degree = 1 / angle_resolution
+        self._tables: list[list[tuple[int, int]]] = []
         self.frequency = frequency
+        # I2C transactions and the time spent in them, for bus load reports.
+        self.transactions = 0
+        self.bus_seconds = 0.0
+        # Shadow copy of the (on, off) registers of each channel, or None if
+        # unknown. Writes of unchanged values are skipped and counted as hits.
+        self._shadow: list[tuple[int, int] | None] = [None] * num_channels
+        self.cache_hits = 0
+        self.cache_misses = 0
         self.send_frequency()
 
+    @property
+    def frequency(self) -> float:
+        return self._frequency
+
+    @frequency.setter
+    def frequency(self, frequency: float) -> None:
+        """Set the PWM frequency (Hz); call send_frequency() to transmit it."""
+        self._frequency = frequency
+        self._tables = [
+            self._build_table(channel) for channel in range(self.num_channels)
+        ]
+
+    def calibrate(
+        self,
+        channel: int,
+        min_pulse_usec: float = MIN_PULSE_USEC,
+        max_pulse_usec: float = MAX_PULSE_USEC,
+    ) -> None:
+        """Set the pulse widths at which a servo reaches 0 and 180 degrees."""
+        assert 0 <= channel < self.num_channels
+        assert 0 < min_pulse_usec < max_pulse_usec
+        self._pulse_ranges[channel] = (min_pulse_usec, max_pulse_usec)
+        self._tables[channel] = self._build_table(channel)
+
+    def _build_table(self, channel: int) -> list[tuple[int, int]]:
+        num_steps = round(180 * self._steps_per_degree)
+        return [
+            self._compute_pwm_values(channel, step / self._steps_per_degree)
+            for step in range(num_steps + 1)
+        ]
+
     def send_frequency(self) -> None:
         """Transmit frequency setting over I2C."""
         assert 40 < self.frequency < 200  # Hz
         self.pca.frequency = self.frequency
 
     def send_pwm_regs(self, channel: int, on: int, off: int) -> None:
-        """Transmit new 12-bit values for on/off duty cycle over I2C."""
+        """Transmit new 12-bit values for on/off duty cycle over I2C.
+
+        Does nothing if the channel already has these values.
+        """
         assert 0 <= channel < self.num_channels
         assert 0 <= on < 0xFFF
         assert 0 <= off < 0xFFF
+        if self._shadow[channel] == (on, off):
+            self.cache_hits += 1
+            return
+        self.cache_misses += 1
+        self._write_pwm_regs(channel, on, off)
+
+    def _write_pwm_regs(self, channel: int, on: int, off: int) -> None:
+        start_time = time.perf_counter()
         self.pca.pwm_regs[channel] = (on, off)
+        self._count_transaction(start_time)
+        self._shadow[channel] = (on, off)
 
-    def send_angle(self, channel: int, angle: float) -> None:
-        """Send a new angle for this servo."""
-        pulse_usec = 600 + 1800 * angle / 180
+    def send_pwm_burst(self, first_channel: int, values: list[tuple[int, int]]) -> None:
+        """Transmit (on, off) values for consecutive channels in one transaction.
+
+        Always writes, even if the values are unchanged. Relies on register
+        auto-increment, which the PCA9685 driver enables when the frequency
+        is set.
+        """
+        if len(values) == 1:
+            self._write_pwm_regs(first_channel, *values[0])
+            return
+        assert 0 <= first_channel
+        assert first_channel + len(values) <= self.num_channels
+        buffer = bytearray([_LED0_ON_L + 4 * first_channel])
+        for on, off in values:
+            assert 0 <= on < 0xFFF
+            assert 0 <= off < 0xFFF
+            buffer += struct.pack("<HH", on, off)
+        start_time = time.perf_counter()
+        with self.pca.i2c_device as i2c:
+            i2c.write(buffer)
+        self._count_transaction(start_time)
+        self._shadow[first_channel : first_channel + len(values)] = values
+
+    def _send_runs(self, values: dict[int, tuple[int, int]]) -> None:
+        """Write runs of consecutive channels in a single transaction each."""
+        channels = sorted(values)
+        start = 0
+        for end in range(1, len(channels) + 1):
+            if end < len(channels) and channels[end] == channels[end - 1] + 1:
+                continue
+            run = channels[start:end]
+            self.send_pwm_burst(run[0], [values[channel] for channel in run])
+            start = end
+
+    def resync(self) -> None:
+        """Rewrite all channels with known values, e.g. after a device reset."""
+        self._send_runs(
+            {
+                channel: values
+                for channel, values in enumerate(self._shadow)
+                if values is not None
+            }
+        )
+
+    def _count_transaction(self, start_time: float) -> None:
+        self.transactions += 1
+        self.bus_seconds += time.perf_counter() - start_time
+
+    def _compute_pwm_values(self, channel: int, angle: float) -> tuple[int, int]:
+        min_pulse_usec, max_pulse_usec = self._pulse_ranges[channel]
+        pulse_usec = min_pulse_usec + (max_pulse_usec - min_pulse_usec) * angle / 180
         period_usec = 1_000_000 / self.frequency
         # Distribute rising edges across the duty cycle.
         on = int(0xFFF * channel / 16) % 0xFFF
         # Tested on 2026-02-22: it's acceptable for the off time to wrap
         # around into the next cycle (as long as 0 <= off < 0xFFF).
         off = int(on + 0xFFF * pulse_usec / period_usec) % 0xFFF
+        assert 0 <= on < 0xFFF
+        assert 0 <= off < 0xFFF
+        return on, off
+
+    def pwm_values(self, channel: int, angle: float) -> tuple[int, int]:
+        """Look up the (on, off) register values for a servo angle.
+
+        The angle (0 to 180 degrees) is rounded to the angle resolution.
+        """
+        assert 0 <= angle <= 180
+        return self._tables[channel][round(angle * self._steps_per_degree)]
+
+    def send_angle(self, channel: int, angle: float) -> None:
+        """Send a new angle for this servo."""
+        assert 0 <= angle <= 180
+        on, off = self._tables[channel][round(angle * self._steps_per_degree)]
         if DEBUG:
-            print(
-                f"pulse={pulse_usec}us period={period_usec}us"
-                f" channel={channel} on={on} off={off} 0xFFF={0xFFF}"
-            )
-        self.send_pwm_regs(channel, on, off)
+            print(f"channel={channel} angle={angle} on={on} off={off}")
+        if self._shadow[channel] == (on, off):
+            self.cache_hits += 1
+            return
+        self.cache_misses += 1
+        self._write_pwm_regs(channel, on, off)
+
+    def send_angles(self, angles: dict[int, float]) -> None:
+        """Send new angles for several servos, keyed by channel.
+
+        Channels that already have the requested values are skipped. Runs of
+        consecutive channels are written in a single I2C transaction.
+        """
+        changed = {}
+        for channel, angle in angles.items():
+            values = self.pwm_values(channel, angle)
+            if self._shadow[channel] == values:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+                changed[channel] = values
+        self._send_runs(changed)
@@ -1,4 +1,7 @@
 from unittest.mock import MagicMock
+
+import pytest
+
 from servo_controller import ServoController
 
 
@@ -18,3 +21,112 @@ def test_servo_controller_send_angle():
         6,
         (1535, 1749),
     )
+
+
+def test_servo_controller_send_pwm_burst():
+    pca = MagicMock()
+    sc = ServoController(pca)
+    sc.send_pwm_burst(2, [(1, 2), (0x102, 0x304)])
+    i2c = pca.i2c_device.__enter__.return_value
+    i2c.write.assert_called_once_with(
+        bytearray([0x06 + 4 * 2, 1, 0, 2, 0, 0x02, 0x01, 0x04, 0x03])
+    )
+    pca.pwm_regs.__setitem__.assert_not_called()
+    assert sc.transactions == 1
+
+
+def test_servo_controller_send_angles_bursts_consecutive_channels():
+    pca = MagicMock()
+    sc = ServoController(pca)
+    sc.send_angles({7: 45, 5: 0, 6: 45, 12: 90})
+
+    # Channels 5..7 in one burst, channel 12 on its own.
+    i2c = pca.i2c_device.__enter__.return_value
+    i2c.write.assert_called_once()
+    buffer = i2c.write.call_args.args[0]
+    assert buffer[0] == 0x06 + 4 * 5
+    assert len(buffer) == 1 + 3 * 4
+    # Channel 6 gets the same values as with send_angle().
+    assert buffer[5:9] == bytearray([0xFF, 0x05, 0xD5, 0x06])  # 1535, 1749
+    MagicMock.assert_called_once_with(
+        pca.pwm_regs.__setitem__, 12, sc.pwm_values(12, 90)
+    )
+    assert sc.transactions == 2
+    assert sc.bus_seconds > 0.0
+
+
+def test_servo_controller_skips_unchanged_writes():
+    pca = MagicMock()
+    sc = ServoController(pca)
+    sc.send_angle(channel=6, angle=0)
+    sc.send_angle(channel=6, angle=0)
+    sc.send_angles({5: 90, 6: 0})
+    assert pca.pwm_regs.__setitem__.call_count == 2  # Channels 6 and 5.
+    assert (sc.cache_hits, sc.cache_misses) == (2, 2)
+
+    sc.send_angle(channel=6, angle=90)
+    assert pca.pwm_regs.__setitem__.call_count == 3
+    assert sc.transactions == 3
+
+
+def test_servo_controller_resync():
+    pca = MagicMock()
+    sc = ServoController(pca)
+    sc.send_angles({3: 0, 4: 90, 9: 45})
+    i2c = pca.i2c_device.__enter__.return_value
+    assert i2c.write.call_count == 1
+
+    sc.resync()
+    assert i2c.write.call_count == 2
+    assert i2c.write.call_args_list[0] == i2c.write.call_args_list[1]
+    assert pca.pwm_regs.__setitem__.call_count == 2
+    assert pca.pwm_regs.__setitem__.call_args_list[1].args == (
+        9,
+        sc.pwm_values(9, 45),
+    )
+
+
+def reference_pwm_values(channel, angle, frequency, min_pulse=600, max_pulse=2400):
+    pulse_usec = min_pulse + (max_pulse - min_pulse) * angle / 180
+    on = int(0xFFF * channel / 16) % 0xFFF
+    off = int(on + 0xFFF * pulse_usec / (1_000_000 / frequency)) % 0xFFF
+    return on, off
+
+
+def test_servo_controller_lookup_table():
+    sc = ServoController(MagicMock())
+    for channel in (0, 6, 15):
+        for angle in (0, 0.5, 45, 90, 127.5, 180):
+            assert sc.pwm_values(channel, angle) == reference_pwm_values(
+                channel, angle, 50.0
+            )
+    # Angles are rounded to the 0.5 degree resolution.
+    assert sc.pwm_values(6, 45.2) == sc.pwm_values(6, 45)
+    assert sc.pwm_values(6, 45.3) == sc.pwm_values(6, 45.5)
+
+
+def test_servo_controller_frequency_rebuilds_table():
+    sc = ServoController(MagicMock())
+    sc.frequency = 60.0
+    assert sc.pwm_values(6, 45) == reference_pwm_values(6, 45, 60.0)
+
+
+def test_servo_controller_calibrate():
+    pca = MagicMock()
+    sc = ServoController(pca)
+    sc.calibrate(6, min_pulse_usec=500, max_pulse_usec=2500)
+    assert sc.pwm_values(6, 90) == reference_pwm_values(6, 90, 50.0, 500, 2500)
+    assert sc.pwm_values(5, 90) == reference_pwm_values(5, 90, 50.0)
+
+    sc.send_angle(6, 0)
+    MagicMock.assert_called_once_with(
+        pca.pwm_regs.__setitem__, 6, reference_pwm_values(6, 0, 50.0, 500, 2500)
+    )
+
+
+def test_servo_controller_angle_out_of_range():
+    sc = ServoController(MagicMock())
+    with pytest.raises(AssertionError):
+        sc.send_angle(0, -1)
+    with pytest.raises(AssertionError):
+        sc.send_angles({0: 181})
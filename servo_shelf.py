@@ -1,12 +1,20 @@
-import bisect
+import heapq
+import itertools
+import queue
 import threading
-import time
 from typing import Any, Callable
 
+from capture_clock import monotonic
+from latency_histogram import StageLatencies
+from motion_planner import MotionPlanner
 from servo_channel import ServoChannel, parse_ranges
 from servo_controller import ServoController
 
 
+# Due events for one controller: channel => (timestamp, label, angle).
+Batch = dict[int, tuple[float, str, float]]
+
+
 class ServoShelf:
     """Holds all ServoChannel objects for the entire sorting shelf."""
 
@@ -16,6 +24,9 @@ class ServoShelf:
         pca_factory: Callable[[int], Any],
         conveyor_belt: Any,
         brick_mapping: Any,
+        clock: Callable[[], float] = monotonic,
+        conflict_policy: str = "merge",
+        event_log: Callable[[float, str, float], None] | None = None,
     ) -> None:
         """Initialize the sorting shelf with a configuration.
 
@@ -23,11 +34,23 @@ class ServoShelf:
         PCA9685 controller, and each value is a space-separated string of ranges
         for servo channels (e.g., "A1:A10 B1:B5"). Servo channels are assigned
         sequentially starting from 0 for each controller.
+
+        Event timestamps are in seconds on the given clock, which must be the
+        clock that frame capture timestamps are taken with.
+
+        The conflict policy decides what happens to a brick whose kicker is
+        still busy with the previous one, see MotionPlanner. If given,
+        event_log is called with (planned time, label, angle) for each sent
+        event, e.g. to record the servo timeline of a session.
         """
         self.controllers: dict[int, ServoController] = {}
         self.servos: dict[str, ServoChannel] = {}
+        # Servo label => I2C address of its controller.
+        self._addresses: dict[str, int] = {}
         self.conveyor_belt = conveyor_belt
         self.brick_mapping = brick_mapping
+        self._clock = clock
+        self._event_log = event_log
 
         for address, range_str in config.items():
             pca = pca_factory(address)
@@ -40,83 +63,213 @@ class ServoShelf:
                 label = str(servo)
                 assert label not in self.servos, f"Duplicate servo label: {label}"
                 self.servos[label] = servo
+                self._addresses[label] = address
 
-        self._queue: list[tuple[float, str, float]] = []
+        # Min-heap of (timestamp, sequence number, label, angle). The sequence
+        # number keeps events with equal timestamps in insertion order.
+        self._queue: list[tuple[float, int, str, float]] = []
+        self._sequence = itertools.count()
+        self._cancelled: set[int] = set()
         self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
         self._stop_event = threading.Event()
         self._thread: threading.Thread | None = None
+        # One I2C writer thread per controller, so that a slow transaction on
+        # one bus address doesn't delay events for the others.
+        self._batches: dict[int, queue.Queue[Batch | None]] = {}
+        self._writers: list[threading.Thread] = []
+        # Per-servo delay between the planned and the actual firing time.
+        self.jitter = StageLatencies()
+        # Events dropped because a later event for the same servo was due too.
+        self.superseded = 0
+        self.planner = MotionPlanner(
+            self, conveyor_belt, conflict_policy=conflict_policy, clock=clock
+        )
+
+    def add_event(self, timestamp: float, label: str, angle: float) -> int:
+        """Add a servo movement to the planner queue.
+
+        Returns:
+            An event id for cancel_event().
+        """
+        with self._wakeup:
+            event_id = next(self._sequence)
+            heapq.heappush(self._queue, (timestamp, event_id, label, angle))
+            # Wake up the worker if this is now the earliest event.
+            if self._queue[0][1] == event_id:
+                self._wakeup.notify()
+            return event_id
+
+    def cancel_event(self, event_id: int) -> None:
+        """Remove a planned event; does nothing if it has already fired."""
+        with self._wakeup:
+            if any(event[1] == event_id for event in self._queue):
+                self._cancelled.add(event_id)
 
-    def add_event(self, timestamp: float, label: str, angle: float) -> None:
-        """Add a servo movement to the sorted planner queue."""
-        with self._lock:
-            bisect.insort(self._queue, (timestamp, label, angle))
+    def pending_events(self) -> list[tuple[float, str, float]]:
+        """Return the planned (timestamp, label, angle) events in firing order."""
+        with self._wakeup:
+            return [
+                (timestamp, label, angle)
+                for timestamp, event_id, label, angle in sorted(self._queue)
+                if event_id not in self._cancelled
+            ]
+
+    def next_event_time(self) -> float | None:
+        """Return the time of the earliest planned event, or None."""
+        with self._wakeup:
+            while self._queue and self._queue[0][1] in self._cancelled:
+                self._cancelled.discard(heapq.heappop(self._queue)[1])
+            return self._queue[0][0] if self._queue else None
 
     def start(self) -> None:
-        """Start the background thread to process the queue."""
+        """Start the background threads to process the queue."""
         if self._thread is not None:
             return
         self._stop_event.clear()
+        for address in self.controllers:
+            batches: queue.Queue[Batch | None] = queue.Queue()
+            self._batches[address] = batches
+            writer = threading.Thread(
+                target=self._write_batches, args=(address, batches), daemon=True
+            )
+            writer.start()
+            self._writers.append(writer)
         self._thread = threading.Thread(target=self._process_queue, daemon=True)
         self._thread.start()
 
     def stop(self) -> None:
-        """Stop the background thread."""
-        self._stop_event.set()
+        """Stop the background threads."""
+        with self._wakeup:
+            self._stop_event.set()
+            self._wakeup.notify()
         if self._thread is not None:
             self._thread.join()
             self._thread = None
+        for batches in self._batches.values():
+            batches.put(None)
+        for writer in self._writers:
+            writer.join()
+        self._batches = {}
+        self._writers = []
 
-    def _process_queue(self) -> None:
-        """Background thread loop to process the queue."""
-        while not self._stop_event.is_set():
-            now = time.time()
-            event = None
-
-            with self._lock:
-                if self._queue and self._queue[0][0] <= now:
-                    event = self._queue.pop(0)
-
-            if event:
-                timestamp, label, angle = event
-                if label in self.servos:
-                    self.servos[label].send_angle(angle)
-                else:
-                    print(f"Warning: Servo label '{label}' not found in shelf.")
+    def _pop_due(self, now: float) -> list[tuple[float, str, float]]:
+        """Remove and return all events planned at or before now."""
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            timestamp, event_id, label, angle = heapq.heappop(self._queue)
+            if event_id in self._cancelled:
+                self._cancelled.discard(event_id)
+            else:
+                due.append((timestamp, label, angle))
+        return due
+
+    def fire_due(self, now: float) -> int:
+        """Send all events that are due, and return how many were sent.
+
+        Due events are grouped by controller. If several events for the same
+        servo are due, only the last one is sent. Each group is written by
+        the controller's writer thread, or directly if start() wasn't called,
+        e.g. when a simulation fires events at next_event_time() itself.
+        """
+        with self._wakeup:
+            due = self._pop_due(now)
+        batches: dict[int, Batch] = {}
+        for timestamp, label, angle in due:
+            if label not in self.servos:
+                print(f"Warning: Servo label '{label}' not found in shelf.")
+                continue
+            batch = batches.setdefault(self._addresses[label], {})
+            channel = self.servos[label].channel
+            if channel in batch:
+                self.superseded += 1
+            batch[channel] = (timestamp, label, angle)
+
+        for address, batch in batches.items():
+            if address in self._batches:
+                self._batches[address].put(batch)
             else:
-                # Sleep a bit to avoid busy waiting.
-                time.sleep(0.01)
+                self._send_batch(address, batch)
+        return sum(len(batch) for batch in batches.values())
+
+    def _send_batch(self, address: int, batch: Batch) -> None:
+        self.controllers[address].send_angles(
+            {channel: angle for channel, (_, _, angle) in batch.items()}
+        )
+        now = self._clock()
+        for timestamp, label, angle in batch.values():
+            self.jitter.record(label, now - timestamp)
+            if self._event_log is not None:
+                self._event_log(timestamp, label, angle)
+
+    def _write_batches(self, address: int, batches: queue.Queue[Batch | None]) -> None:
+        """Writer thread loop for one controller."""
+        while (batch := batches.get()) is not None:
+            self._send_batch(address, batch)
+
+    def bus_report(self) -> str:
+        """Return a human-readable summary of I2C traffic per controller."""
+        lines = []
+        for address, controller in self.controllers.items():
+            lines.append(
+                f"0x{address:02x}: {controller.transactions} transactions,"
+                f" {controller.bus_seconds * 1000:.1f}ms bus time,"
+                f" {controller.cache_hits} unchanged writes skipped"
+            )
+        lines.append(f"superseded events: {self.superseded}")
+        return "\n".join(lines)
+
+    def _process_queue(self) -> None:
+        """Background thread loop to process the queue.
+
+        Sleeps until the next planned event, or until add_event() inserts an
+        earlier one, instead of polling.
+        """
+        while True:
+            with self._wakeup:
+                # stop() sets the event while holding the lock, so it can't be
+                # missed between this check and wait().
+                if self._stop_event.is_set():
+                    return
+                if not self._queue:
+                    self._wakeup.wait()
+                    continue
+                delay = self._queue[0][0] - self._clock()
+                if delay > 0:
+                    self._wakeup.wait(delay)
+                    continue
+            self.fire_due(self._clock())
 
     def on_brick_recognized(
         self,
         timestamp: float,
+        brick_id: int,
         brick_class: str,
     ) -> None:
         """Handle a recognized brick by scheduling kicker and flap movements.
 
+        The flap opens early enough to be fully open when the brick arrives
+        at the kicker, and overlapping flap windows are merged. The kicker
+        returns to rest in the next gap between bricks. If the kicker is
+        still busy with another brick, the conflict policy may delay the
+        kick or not sort the brick at all. See MotionPlanner.
+
         Args:
             timestamp: Time when the brick was recognized.
+            brick_id: Unique id of the brick, e.g. its tracker track id.
             brick_class: The class name of the recognized brick.
+
+        Raises:
+            KeyError: If the brick class isn't mapped to a drawer. The brick
+                is still taken into account when planning kicker resets.
         """
-        cell_label = self.brick_mapping.get_cell(brick_class)
+        try:
+            cell_label = self.brick_mapping.get_cell(brick_class)
+        except KeyError:
+            self.planner.add_brick(timestamp, brick_id)
+            raise
         # Column is the first character of the cell label ('A1' => 'A').
         column = cell_label[0]
         kicker_label = column + "0"
-
-        distance = self.conveyor_belt.get_kicker_distance(kicker_label)
-        travel_time = self.conveyor_belt.predict_travel_time(distance)
-        if travel_time <= 0:
-            return
-
-        kick_time = timestamp + travel_time
-
-        # 1. Open the shelf box flap slightly before the brick arrives.
-        self.add_event(kick_time - 0.1, cell_label, 90.0)  # Open
-
-        # 2. Kick the brick at the right moment.
-        self.add_event(kick_time, kicker_label, 45.0)  # Kick
-        # TODO: The kicker servo needs to be reset, but this can only happen
-        # during a blank space on the conveyor belt, otherwise it would
-        # kick the wrong parts in the wrong direction.
-
-        # 3. Close the flap after the brick has fallen into the drawer.
-        self.add_event(kick_time + 0.5, cell_label, 0.0)  # Close
+        self.planner.add_brick(timestamp, brick_id, kicker_label)
+        self.planner.plan_sort(timestamp, brick_id, cell_label, kicker_label)
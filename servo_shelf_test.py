@@ -3,6 +3,7 @@ from unittest.mock import MagicMock
 
 import pytest
 
+from conveyor_belt import ConveyorBelt
 from servo_shelf import ServoShelf
 
 
@@ -114,7 +115,94 @@ def test_servo_shelf_add_event_sorting():
         (100.0, "A1", 90.0),
         (150.0, "A3", 0.0),
     ]
-    assert shelf._queue == expected
+    assert shelf.pending_events() == expected
+
+
+def test_servo_shelf_equal_timestamps_keep_insertion_order():
+    shelf = ServoShelf({0x41: "A1:A5"}, pca_factory, MagicMock(), MagicMock())
+    shelf.add_event(10.0, "A3", 0.0)
+    shelf.add_event(10.0, "A1", 90.0)
+    assert shelf.pending_events() == [(10.0, "A3", 0.0), (10.0, "A1", 90.0)]
+
+
+def test_servo_shelf_cancel_event():
+    pca = MagicMock()
+    shelf = ServoShelf({0x41: "A1:A5"}, lambda addr: pca, MagicMock(), MagicMock())
+    shelf.add_event(1.0, "A1", 90.0)
+    event_id = shelf.add_event(2.0, "A2", 45.0)
+    shelf.cancel_event(event_id)
+    assert shelf.pending_events() == [(1.0, "A1", 90.0)]
+
+    assert shelf.fire_due(5.0) == 1
+    assert [call.args[0] for call in pca.pwm_regs.__setitem__.call_args_list] == [0]
+    assert shelf.pending_events() == []
+
+
+def test_servo_shelf_fire_due_records_jitter():
+    shelf = ServoShelf({0x41: "A1:A5"}, pca_factory, MagicMock(), MagicMock())
+    now = time.monotonic()
+    shelf.add_event(now - 0.01, "A1", 90.0)
+    shelf.add_event(now + 60.0, "A2", 45.0)
+
+    assert shelf.fire_due(now) == 1
+    assert shelf.jitter.stages == ["A1"]
+    assert shelf.jitter.histogram("A1").min >= 0.01
+    assert shelf.pending_events() == [(now + 60.0, "A2", 45.0)]
+
+
+def test_servo_shelf_fire_due_groups_by_controller():
+    pcas = {0x41: MagicMock(name="pca_0x41"), 0x42: MagicMock(name="pca_0x42")}
+    config = {0x41: "A1:A5", 0x42: "B1:B5"}
+    shelf = ServoShelf(config, lambda addr: pcas[addr], MagicMock(), MagicMock())
+    shelf.add_event(1.0, "A1", 90.0)
+    shelf.add_event(1.1, "A2", 0.0)
+    shelf.add_event(1.2, "A1", 45.0)  # Supersedes the first event.
+    shelf.add_event(1.3, "B3", 90.0)
+
+    assert shelf.fire_due(2.0) == 3
+    assert shelf.superseded == 1
+
+    # A1 and A2 are channels 0 and 1, written in one burst.
+    controller = shelf.controllers[0x41]
+    i2c = pcas[0x41].i2c_device.__enter__.return_value
+    expected = bytearray([0x06])
+    for channel, angle in [(0, 45.0), (1, 0.0)]:
+        on, off = controller.pwm_values(channel, angle)
+        expected += bytearray([on & 0xFF, on >> 8, off & 0xFF, off >> 8])
+    i2c.write.assert_called_once_with(expected)
+    MagicMock.assert_called_once_with(
+        pcas[0x42].pwm_regs.__setitem__, 2, controller.pwm_values(2, 90.0)
+    )
+    assert shelf.bus_report().splitlines() == [
+        (
+            f"0x41: 1 transactions, {controller.bus_seconds * 1000:.1f}ms bus time,"
+            " 0 unchanged writes skipped"
+        ),
+        (
+            "0x42: 1 transactions, "
+            f"{shelf.controllers[0x42].bus_seconds * 1000:.1f}ms bus time,"
+            " 0 unchanged writes skipped"
+        ),
+        "superseded events: 1",
+    ]
+
+
+def test_servo_shelf_wakes_up_for_earlier_event():
+    pca = MagicMock()
+    shelf = ServoShelf({0x41: "A1:A5"}, lambda addr: pca, MagicMock(), MagicMock())
+    shelf.add_event(time.monotonic() + 60.0, "A1", 90.0)
+    shelf.start()
+    try:
+        time.sleep(0.02)  # The worker is now waiting for the event in 60 s.
+        planned = time.monotonic() + 0.05
+        shelf.add_event(planned, "A2", 45.0)
+        time.sleep(0.1)
+        assert [call.args[0] for call in pca.pwm_regs.__setitem__.call_args_list] == [1]
+        jitter = shelf.jitter.histogram("A2")
+        assert jitter.count == 1
+        assert jitter.max < 0.05
+    finally:
+        shelf.stop()
 
 
 def test_servo_shelf_process_queue():
@@ -124,7 +212,7 @@ def test_servo_shelf_process_queue():
     shelf = ServoShelf(config, lambda addr: pca, MagicMock(), MagicMock())
 
     # Plan events in the future and past
-    now = time.time()
+    now = time.monotonic()
     shelf.add_event(now - 1.0, "A1", 90.0)  # Past
     shelf.add_event(now + 0.1, "A2", 45.0)  # Near future
 
@@ -164,31 +252,65 @@ def test_servo_shelf_stop_thread():
     assert shelf._thread is None
 
 
+def make_conveyor(speed: float = 250.0) -> ConveyorBelt:
+    """A belt calibrated to an exact speed, with the kicker A0 at 500 mm."""
+    conveyor = ConveyorBelt(
+        length=1000.0,
+        min_intervals=1,
+        kicker_distances={"A0": 500.0},
+        sighting_error=0.0,
+    )
+    conveyor.observed_mark_at("m", 0.0)
+    conveyor.observed_mark_at("m", 1000.0 / speed)
+    return conveyor
+
+
 def test_servo_shelf_on_brick_recognized():
     config = {0x41: "A0:A10"}
-    conveyor = MagicMock()
-    conveyor.get_kicker_distance.return_value = 500.0
-    conveyor.predict_travel_time.return_value = 2.0
     mapping = MagicMock()
     mapping.get_cell.return_value = "A3"
-    shelf = ServoShelf(config, pca_factory, conveyor, mapping)
+    shelf = ServoShelf(
+        config, pca_factory, make_conveyor(), mapping, clock=lambda: 900.0
+    )
 
     now = 1000.0
     shelf.on_brick_recognized(
         timestamp=now,
+        brick_id=1,
         brick_class="3001_brick_2x4",
     )
 
-    # Expected events:
-    # 1. A3 open at 1000 + 2 - 0.1 = 1001.9
+    # Expected events, with a travel time of 2.0 s to the kicker:
+    # 1. A3 open at 1000 + 2 - 0.17 (time to open by 90 degrees) = 1001.83
     # 2. A0 kick at 1000 + 2 = 1002.0
-    # 3. A3 close at 1000 + 2 + 0.5 = 1002.5
+    # 3. A0 reset once the brick is 30 mm (0.12 s) past the kicker = 1002.12
+    # 4. A3 close at 1000 + 2 + 0.5 = 1002.5
+    events = shelf.pending_events()
+    assert [(label, angle) for _, label, angle in events] == [
+        ("A3", 90.0),
+        ("A0", 45.0),
+        ("A0", 0.0),
+        ("A3", 0.0),
+    ]
+    assert [timestamp for timestamp, _, _ in events] == pytest.approx(
+        [1001.83, 1002.0, 1002.12, 1002.5]
+    )
+    mapping.get_cell.assert_called_once_with("3001_brick_2x4")
 
-    assert len(shelf._queue) == 3
-    assert shelf._queue[0] == (1001.9, "A3", 90.0)
-    assert shelf._queue[1] == (1002.0, "A0", 45.0)
-    assert shelf._queue[2] == (1002.5, "A3", 0.0)
 
-    conveyor.get_kicker_distance.assert_called_once_with("A0")
-    conveyor.predict_travel_time.assert_called_once_with(500.0)
-    mapping.get_cell.assert_called_once_with("3001_brick_2x4")
+def test_servo_shelf_unmapped_brick_calls_off_kick():
+    mapping = MagicMock()
+    mapping.get_cell.side_effect = lambda brick_class: {"3001_brick_2x4": "A3"}[
+        brick_class
+    ]
+    shelf = ServoShelf(
+        {0x41: "A0:A10"}, pca_factory, make_conveyor(), mapping, clock=lambda: 0.0
+    )
+    shelf.on_brick_recognized(10.0, 1, "3001_brick_2x4")
+    # An unknown brick passes the kicker 0.15 s later, right when it would
+    # have been reset, so the kick is called off rather than pushing the
+    # unknown brick into the drawer too.
+    with pytest.raises(KeyError):
+        shelf.on_brick_recognized(10.15, 2, "unknown")
+    assert shelf.pending_events() == []
+    assert shelf.planner.rejected == 1
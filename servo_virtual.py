@@ -0,0 +1,102 @@
+"""Virtual time and servo controllers, to run ServoShelf without hardware.
+
+VirtualClock and fire_events_until drive a shelf's planned events in virtual
+time, and RecordingPCA stands in for a PCA9685, recording the register
+writes. Both the simulator and the sorter's replay and no-hardware modes use
+them.
+"""
+
+import struct
+from collections import deque
+from collections.abc import Callable
+from typing import Self
+
+from capture_clock import monotonic
+from servo_shelf import ServoShelf
+
+# PCA9685 register of LED0_ON_L, see ServoController.
+_LED0_ON_L = 0x06
+
+
+class VirtualClock:
+    """A clock that only moves when the simulation advances it."""
+
+    def __init__(self, start: float = 0.0) -> None:
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, timestamp: float) -> None:
+        """Move the clock forward to timestamp; it never goes back."""
+        self.now = max(self.now, timestamp)
+
+
+def fire_events_until(shelf: ServoShelf, clock: VirtualClock, timestamp: float) -> None:
+    """Fire the planned events of a shelf up to timestamp, each at its own time.
+
+    The shelf must use the virtual clock, and must not be started.
+    """
+    while (event_time := shelf.next_event_time()) is not None:
+        if event_time > timestamp:
+            return
+        clock.advance(event_time)
+        shelf.fire_due(clock())
+
+
+class _RecordingRegisters:
+    """Stand-in for PCA9685.pwm_regs."""
+
+    def __init__(self, pca: "RecordingPCA") -> None:
+        self._pca = pca
+
+    def __setitem__(self, channel: int, values: tuple[int, int]) -> None:
+        self._pca.record(channel, *values)
+
+
+class _RecordingI2C:
+    """Stand-in for PCA9685.i2c_device, decoding auto-increment bursts."""
+
+    def __init__(self, pca: "RecordingPCA") -> None:
+        self._pca = pca
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        pass
+
+    def write(self, buffer: bytes | bytearray) -> None:
+        first_channel = (buffer[0] - _LED0_ON_L) // 4
+        for i, (on, off) in enumerate(struct.iter_unpack("<HH", buffer[1:])):
+            self._pca.record(first_channel + i, on, off)
+
+
+class RecordingPCA:
+    """A PCA9685 stand-in that records channel writes with timestamps.
+
+    Args:
+        address: I2C address of the controller.
+        clock: Timestamps the writes.
+        max_writes: Keep only this many of the latest writes, or all if None.
+    """
+
+    def __init__(
+        self,
+        address: int,
+        clock: Callable[[], float] = monotonic,
+        max_writes: int | None = None,
+    ) -> None:
+        self.address = address
+        self.frequency = 0.0
+        self._clock = clock
+        # (timestamp, channel, on, off) of each register write.
+        self.writes: deque[tuple[float, int, int, int]] = deque(maxlen=max_writes)
+        self.pwm_regs = _RecordingRegisters(self)
+        self.i2c_device = _RecordingI2C(self)
+
+    def record(self, channel: int, on: int, off: int) -> None:
+        self.writes.append((self._clock(), channel, on, off))
+
+    def deinit(self) -> None:
+        pass
@@ -0,0 +1,48 @@
+from unittest.mock import MagicMock
+
+from servo_controller import ServoController
+from servo_virtual import RecordingPCA, VirtualClock, fire_events_until
+
+
+def test_recording_pca_records_writes_and_bursts():
+    clock = VirtualClock(5.0)
+    pca = RecordingPCA(0x40, clock=clock)
+    controller = ServoController(pca)
+    controller.send_angle(3, 90)
+    clock.advance(6.0)
+    controller.send_pwm_burst(1, [(1, 2), (3, 4)])
+    assert list(pca.writes) == [
+        (5.0, 3, *controller.pwm_values(3, 90)),
+        (6.0, 1, 1, 2),
+        (6.0, 2, 3, 4),
+    ]
+
+
+def test_recording_pca_keeps_latest_writes():
+    pca = RecordingPCA(0x40, clock=VirtualClock(), max_writes=2)
+    for channel in range(5):
+        pca.record(channel, 0, 100)
+    assert [channel for _, channel, _, _ in pca.writes] == [3, 4]
+
+
+def test_virtual_clock_never_goes_back():
+    clock = VirtualClock(2.0)
+    clock.advance(1.0)
+    assert clock() == 2.0
+
+
+def test_fire_events_until_fires_each_event_at_its_time():
+    clock = VirtualClock()
+    shelf = MagicMock()
+    events = [1.0, 2.0, 3.0]
+    shelf.next_event_time.side_effect = lambda: events[0] if events else None
+    fired = []
+
+    def fire_due(now):
+        fired.append(now)
+        events.pop(0)
+
+    shelf.fire_due.side_effect = fire_due
+    fire_events_until(shelf, clock, 2.5)
+    assert fired == [1.0, 2.0]
+    assert clock() == 2.0
@@ -0,0 +1,264 @@
+#!/usr/bin/env -S uv run
+
+"""Recording of sorter sessions, to replay them and compare servo timelines.
+
+A session file starts with a magic string, followed by records that are
+only ever appended: a header (kind, timestamp, payload length) and the
+payload. Frames are stored as JPEG, detections as JSON and servo events as
+an angle and a label. A file that was cut off by a crash is still readable
+up to the last complete record, and appending to it first drops the torn
+record. Readers index the record headers once, so they can seek to any frame
+by its capture time without decoding the rest.
+
+Run this script with two session files to compare their servo timelines,
+e.g. a live recording and a replay of it with a different model backend or
+scheduler.
+"""
+
+import argparse
+import bisect
+import json
+import math
+import struct
+import sys
+import threading
+from collections.abc import Iterator
+from pathlib import Path
+from typing import BinaryIO, Self
+
+import cv2
+import cv2.typing
+import numpy as np
+
+from brick_camera import Hypothesis
+
+MAGIC = b"SORTREC1"
+
+# Record kinds.
+FRAME = 1
+HYPOTHESES = 2
+SERVO_EVENT = 3
+
+# kind, timestamp (seconds), payload length.
+_HEADER = struct.Struct("<BdI")
+_ANGLE = struct.Struct("<d")
+
+
+def _read_records(file: BinaryIO, size: int) -> list[tuple[int, float, int, int]]:
+    """Index the complete records, reading from just after the magic string.
+
+    Returns:
+        (kind, timestamp, payload offset, payload length) of each record.
+    """
+    records = []
+    while len(header := file.read(_HEADER.size)) == _HEADER.size:
+        kind, timestamp, length = _HEADER.unpack(header)
+        offset = file.tell()
+        if offset + length > size:
+            break  # Cut off while writing.
+        records.append((kind, timestamp, offset, length))
+        file.seek(length, 1)
+    return records
+
+
+class SessionWriter:
+    """Appends frames, detections and servo events to a session file.
+
+    Thread-safe, so pipeline stages and servo writer threads can record
+    into the same file.
+    """
+
+    def __init__(self, path: Path, jpeg_quality: int = 90) -> None:
+        self._jpeg_quality = jpeg_quality
+        self._lock = threading.Lock()
+        is_new = not path.exists() or path.stat().st_size == 0
+        if not is_new:
+            # Drop a record that was cut off by a crash, so that new records
+            # aren't appended behind it.
+            with path.open("r+b") as f:
+                assert f.read(len(MAGIC)) == MAGIC, f"Not a session file: {path}"
+                end = len(MAGIC)
+                for _, _, offset, length in _read_records(f, path.stat().st_size):
+                    end = offset + length
+                f.truncate(end)
+        self._file = path.open("ab")
+        if is_new:
+            self._file.write(MAGIC)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def _write(self, kind: int, timestamp: float, payload: bytes) -> None:
+        with self._lock:
+            self._file.write(_HEADER.pack(kind, timestamp, len(payload)))
+            self._file.write(payload)
+
+    def write_frame(self, timestamp: float, image: cv2.typing.MatLike) -> None:
+        ok, jpeg = cv2.imencode(
+            ".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self._jpeg_quality]
+        )
+        assert ok
+        self._write(FRAME, timestamp, jpeg.tobytes())
+
+    def write_hypotheses(self, timestamp: float, hypotheses: list[Hypothesis]) -> None:
+        rows = [
+            [h.confidence, h.x_center, h.y_center, h.width, h.height]
+            + [h.class_id, h.class_name]
+            for h in hypotheses
+        ]
+        self._write(HYPOTHESES, timestamp, json.dumps(rows).encode())
+
+    def write_servo_event(self, timestamp: float, label: str, angle: float) -> None:
+        self._write(SERVO_EVENT, timestamp, _ANGLE.pack(angle) + label.encode())
+
+
+class SessionReader:
+    """Reads a session file written by SessionWriter."""
+
+    def __init__(self, path: Path) -> None:
+        self._file = path.open("rb")
+        assert self._file.read(len(MAGIC)) == MAGIC, f"Not a session file: {path}"
+        self._records = _read_records(self._file, path.stat().st_size)
+        self._frames = [record for record in self._records if record[0] == FRAME]
+        self._frame_times = [record[1] for record in self._frames]
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    @property
+    def frame_count(self) -> int:
+        return len(self._frames)
+
+    @property
+    def start_time(self) -> float:
+        """Timestamp of the first record, or 0.0 if the session is empty."""
+        return self._records[0][1] if self._records else 0.0
+
+    def _payload(self, offset: int, length: int) -> bytes:
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def frames(self, start: float = -math.inf) -> Iterator[tuple[float, np.ndarray]]:
+        """Yield (capture time, image) of the frames captured at or after start."""
+        first = bisect.bisect_left(self._frame_times, start)
+        for _, timestamp, offset, length in self._frames[first:]:
+            jpeg = np.frombuffer(self._payload(offset, length), dtype=np.uint8)
+            yield timestamp, cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+
+    def hypotheses(self) -> list[tuple[float, list[Hypothesis]]]:
+        """Return the (capture time, detections) of each inferred frame."""
+        results = []
+        for kind, timestamp, offset, length in self._records:
+            if kind == HYPOTHESES:
+                rows = json.loads(self._payload(offset, length))
+                results.append((timestamp, [Hypothesis(*row) for row in rows]))
+        return results
+
+    def servo_events(self) -> list[tuple[float, str, float]]:
+        """Return the (planned time, label, angle) of each sent servo event."""
+        events = []
+        for kind, timestamp, offset, length in self._records:
+            if kind == SERVO_EVENT:
+                payload = self._payload(offset, length)
+                (angle,) = _ANGLE.unpack_from(payload)
+                events.append((timestamp, payload[_ANGLE.size :].decode(), angle))
+        return sorted(events)
+
+
+def diff_timelines(
+    expected: list[tuple[float, str, float]],
+    actual: list[tuple[float, str, float]],
+    tolerance: float = 0.001,  # seconds
+) -> list[str]:
+    """Compare two servo timelines of (time, label, angle) events.
+
+    Events of the same servo match if they have the same angle and their
+    times differ by at most the tolerance. Up to ten times the tolerance,
+    they are reported as shifted rather than as missing and extra.
+
+    Returns:
+        A human-readable description of each missing, extra or shifted event.
+    """
+
+    def by_label(
+        events: list[tuple[float, str, float]],
+    ) -> dict[str, list[tuple[float, float]]]:
+        timelines: dict[str, list[tuple[float, float]]] = {}
+        for timestamp, label, angle in sorted(events):
+            timelines.setdefault(label, []).append((timestamp, angle))
+        return timelines
+
+    expected_timelines = by_label(expected)
+    actual_timelines = by_label(actual)
+    differences = []
+    for label in sorted(expected_timelines.keys() | actual_timelines.keys()):
+        before = expected_timelines.get(label, [])
+        after = actual_timelines.get(label, [])
+        i = j = 0
+        while i < len(before) or j < len(after):
+            if i < len(before) and j < len(after):
+                (t1, a1), (t2, a2) = before[i], after[j]
+                if a1 == a2 and abs(t1 - t2) <= tolerance:
+                    i += 1
+                    j += 1
+                    continue
+                if a1 == a2 and abs(t1 - t2) <= 10 * tolerance:
+                    differences.append(
+                        f"{label}: {a1:g} degrees shifted by"
+                        f" {(t2 - t1) * 1000:+.1f}ms at {t1:.3f}"
+                    )
+                    i += 1
+                    j += 1
+                    continue
+            if j >= len(after) or (i < len(before) and before[i][0] <= after[j][0]):
+                t1, a1 = before[i]
+                differences.append(f"{label}: missing {a1:g} degrees at {t1:.3f}")
+                i += 1
+            else:
+                t2, a2 = after[j]
+                differences.append(f"{label}: extra {a2:g} degrees at {t2:.3f}")
+                j += 1
+    return differences
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare Session Servo Timelines")
+    parser.add_argument("expected", type=Path, help="Session file, e.g. live")
+    parser.add_argument("actual", type=Path, help="Session file, e.g. a replay")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.001,
+        help="Maximum time difference of matching events (seconds)",
+    )
+    args = parser.parse_args()
+
+    with SessionReader(args.expected) as expected, SessionReader(args.actual) as actual:
+        expected_events = expected.servo_events()
+        actual_events = actual.servo_events()
+    differences = diff_timelines(expected_events, actual_events, args.tolerance)
+    for difference in differences:
+        print(difference)
+    print(
+        f"{len(expected_events)} => {len(actual_events)} servo events,"
+        f" {len(differences)} differences"
+    )
+    if differences:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
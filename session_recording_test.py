@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from brick_camera import Hypothesis
+from session_recording import SessionReader, SessionWriter, diff_timelines
+
+
+def make_image(value: int) -> np.ndarray:
+    return np.full((64, 48, 3), value, dtype=np.uint8)
+
+
+def write_session(path) -> None:
+    with SessionWriter(path) as writer:
+        for i in range(3):
+            writer.write_frame(10.0 + i, make_image(40 * i))
+        writer.write_hypotheses(
+            11.0, [Hypothesis(0.9, 0.5, 0.4, 0.1, 0.2, 3, "3001_brick_2x4")]
+        )
+        writer.write_servo_event(12.5, "A0", 45.0)
+        writer.write_servo_event(12.0, "A3", 90.0)
+
+
+def test_session_round_trip(tmp_path):
+    path = tmp_path / "session.rec"
+    write_session(path)
+    with SessionReader(path) as reader:
+        assert reader.frame_count == 3
+        assert reader.start_time == 10.0
+        frames = list(reader.frames())
+        assert [t for t, _ in frames] == [10.0, 11.0, 12.0]
+        # JPEG is lossy, but flat images survive nearly unchanged.
+        assert np.abs(frames[2][1].astype(int) - 80).max() <= 2
+        assert [t for t, _ in reader.frames(start=10.5)] == [11.0, 12.0]
+        ((timestamp, hypotheses),) = reader.hypotheses()
+        assert timestamp == 11.0
+        assert hypotheses[0].class_name == "3001_brick_2x4"
+        assert hypotheses[0].height == pytest.approx(0.2)
+        assert reader.servo_events() == [(12.0, "A3", 90.0), (12.5, "A0", 45.0)]
+
+
+def test_session_append_and_truncation(tmp_path):
+    path = tmp_path / "session.rec"
+    write_session(path)
+    with SessionWriter(path) as writer:
+        writer.write_servo_event(13.0, "A0", 0.0)
+    with SessionReader(path) as reader:
+        assert len(reader.servo_events()) == 3
+
+    # A crash in the middle of the last record loses only that record.
+    path.write_bytes(path.read_bytes()[:-3])
+    with SessionReader(path) as reader:
+        assert len(reader.servo_events()) == 2
+        assert reader.frame_count == 3
+
+
+def test_session_append_after_torn_record(tmp_path):
+    path = tmp_path / "session.rec"
+    write_session(path)
+    complete = path.read_bytes()
+    path.write_bytes(complete[:-3])
+    with SessionWriter(path) as writer:
+        writer.write_servo_event(13.0, "A0", 0.0)
+    # The torn record is gone, and the new one is readable behind the others.
+    with SessionReader(path) as reader:
+        assert reader.servo_events() == [(12.5, "A0", 45.0), (13.0, "A0", 0.0)]
+        assert reader.frame_count == 3
+
+    # A file with only a torn header starts over after the magic string.
+    path.write_bytes(complete[:10])
+    with SessionWriter(path) as writer:
+        writer.write_servo_event(14.0, "A1", 90.0)
+    with SessionReader(path) as reader:
+        assert reader.servo_events() == [(14.0, "A1", 90.0)]
+
+
+def test_session_rejects_other_files(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not a session")
+    with pytest.raises(AssertionError):
+        SessionReader(path)
+    with pytest.raises(AssertionError):
+        SessionWriter(path)
+
+
+def test_diff_timelines():
+    expected = [(1.0, "A0", 45.0), (1.2, "A0", 0.0), (2.0, "A3", 90.0)]
+    assert diff_timelines(expected, list(reversed(expected))) == []
+    actual = [(1.0005, "A0", 45.0), (1.205, "A0", 0.0), (3.0, "B0", 45.0)]
+    assert diff_timelines(expected, actual, tolerance=0.001) == [
+        "A0: 0 degrees shifted by +5.0ms at 1.200",
+        "A3: missing 90 degrees at 2.000",
+        "B0: extra 45 degrees at 3.000",
+    ]
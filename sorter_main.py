@@ -2,15 +2,27 @@
 
 import argparse
 import functools
+import math
 import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
 import cv2
-import torch
-import yolov7
+import cv2.typing
 
-from brick_camera import BrickCamera
+from brick_camera import BrickCamera, FrameBatcher, Hypothesis, Region
 from brick_mapping import BrickMapping
+from brick_tracker import BrickTracker, TrackDecision
+from capture_clock import CaptureClock
 from conveyor_belt import ConveyorBelt
+from motion_gate import MotionGate
+from onnx_model import load_class_names, load_onnx_model
+from pipeline import Pipeline
 from servo_shelf import ServoShelf
+from servo_virtual import RecordingPCA, VirtualClock, fire_events_until
+from session_recording import SessionReader, SessionWriter
 
 # PCA9685 controller addresses for the sorting shelf
 CONTROLLER_CONFIG = {
@@ -35,6 +47,12 @@ KICKER_DISTANCES = {
 
 BELT_LENGTH = 3600.0  # mm
 
+# Writes kept by each mock PCA9685 when running without hardware.
+MOCK_PCA_WRITES = 1000
+
+# Recognizer class of the permanent marks on the belt, used for calibration.
+MARK_CLASS = "3005_brick_1x1"
+
 
 def get_pca_factory():
     try:
@@ -47,18 +65,340 @@ def get_pca_factory():
     except (ImportError, ValueError, NotImplementedError):
         print("Warning: Hardware PCA9685 not detected. Using mock for testing.")
 
-        class MockPCA:
-            def __init__(self, addr):
-                self.addr = addr
+        return functools.partial(RecordingPCA, max_writes=MOCK_PCA_WRITES)
+
+
+@dataclass
+class CapturedFrame:
+    """A camera frame on its way through the sorter pipeline."""
+
+    image: cv2.typing.MatLike
+    capture_time: float
+    should_infer: bool = True
+    roi: Region | None = None
+    hypotheses: list[Hypothesis] = field(default_factory=list)
+
+
+def load_model(
+    weights: str,
+    backend: str,
+    device: str,
+    names: str | None,
+    threads: int | None,
+    input_size: int | None,
+) -> Any:
+    """Load a yolov7 model with torch, or an exported ONNX model without it."""
+    if backend != "torch":
+        return load_onnx_model(
+            Path(weights),
+            backend=backend,
+            names=load_class_names(Path(names)) if names else None,
+            threads=threads,
+            input_size=input_size or 640,
+        )
+
+    import torch
+    import yolov7
+
+    if threads:
+        torch.set_num_threads(threads)
+    original_load = torch.load
+    torch.load = functools.partial(original_load, weights_only=False)
+    try:
+        return yolov7.load(weights, device=device)
+    finally:
+        torch.load = original_load
+
+
+def read_frame(cap: cv2.VideoCapture, clock: CaptureClock) -> CapturedFrame | None:
+    """Grab a frame from the webcam and timestamp it at its exposure time.
+
+    Returns:
+        The captured frame, or None if the capture failed.
+    """
+    if not cap.grab():
+        return None
+    capture_time = clock.timestamp(cap)
+    ret, frame = cap.retrieve()
+    if not ret:
+        return None
+    # Match webcam.py rotation: bricks move top-to-bottom
+    frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return CapturedFrame(frame, capture_time)
+
+
+def recording_source(
+    source: Callable[[], CapturedFrame | None],
+    recorder: SessionWriter,
+) -> Callable[[], CapturedFrame | None]:
+    """Wrap a frame source to record each frame it returns."""
+
+    def read() -> CapturedFrame | None:
+        frame = source()
+        if frame is not None:
+            recorder.write_frame(frame.capture_time, frame.image)
+        return frame
+
+    return read
+
+
+def band_source(
+    source: Callable[[], CapturedFrame | None],
+) -> Callable[[], CapturedFrame | None]:
+    """Wrap a frame source to send only the central band of frames to the model."""
+
+    def read() -> CapturedFrame | None:
+        frame = source()
+        if frame is not None:
+            image_height, image_width = frame.image.shape[:2]
+            frame.roi = Region.central_band(image_width, image_height)
+        return frame
+
+    return read
+
+
+def replay_source(
+    reader: SessionReader,
+    shelf: ServoShelf,
+    clock: VirtualClock,
+    realtime: bool,
+) -> Callable[[], CapturedFrame | None]:
+    """Read recorded frames, with the shelf on the virtual clock.
 
-            def deinit(self):
+    Before each frame is returned, the clock is set to its capture time and
+    the servo events planned until then are fired. With realtime, frames are
+    paced like they were captured, otherwise they are read as fast as the
+    sorter can process them.
+    """
+    frames = reader.frames()
+    start_time = time.monotonic()
+
+    def read() -> CapturedFrame | None:
+        item = next(frames, None)
+        if item is None:
+            return None
+        capture_time, image = item
+        if realtime:
+            delay = capture_time - reader.start_time - (time.monotonic() - start_time)
+            if delay > 0:
+                time.sleep(delay)
+        fire_events_until(shelf, clock, capture_time)
+        clock.advance(capture_time)
+        return CapturedFrame(image, capture_time)
+
+    return read
+
+
+def draw_hypotheses(frame: cv2.typing.MatLike, hypotheses: list[Hypothesis]) -> None:
+    """Draw bounding boxes and class names for debug display."""
+    h_h, h_w = frame.shape[:2]
+    for h in hypotheses:
+        x1 = int((h.x_center - h.width / 2) * h_w)
+        y1 = int((h.y_center - h.height / 2) * h_h)
+        x2 = int((h.x_center + h.width / 2) * h_w)
+        y2 = int((h.y_center + h.height / 2) * h_h)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(
+            frame,
+            f"{h.class_name} {h.confidence:.2f}",
+            (x1, y1 - 10),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.5,
+            (0, 255, 0),
+            1,
+        )
+
+
+def apply_motion_gate(gate: MotionGate, frame: CapturedFrame, crop: bool) -> None:
+    """Decide whether to run inference, and optionally where to crop."""
+    frame.should_infer = gate.should_infer(frame.image, frame.capture_time)
+    _, _, width, height = gate.last_box
+    if crop and width and height:
+        image_height, image_width = frame.image.shape[:2]
+        frame.roi = Region.around(gate.last_box, image_width, image_height)
+
+
+def dispatch_hypotheses(
+    belt: ConveyorBelt,
+    shelf: ServoShelf,
+    tracker: BrickTracker,
+    hypotheses: list[Hypothesis],
+    capture_time: float,
+) -> None:
+    """Track bricks across frames and act once on each finished track."""
+    dispatch_decisions(belt, shelf, tracker.update(hypotheses, capture_time))
+
+
+def dispatch_decisions(
+    belt: ConveyorBelt,
+    shelf: ServoShelf,
+    decisions: list[TrackDecision],
+) -> None:
+    """Feed calibration marks to the belt and recognized bricks to the shelf."""
+    for decision in decisions:
+        # Special handling for belt marks (using 3005_brick_1x1 as a marker)
+        if decision.class_name == MARK_CLASS:
+            belt.observed_mark_at(decision.class_name, decision.timestamp)
+            print(f"Calibration mark seen. Speed: {belt.speed:.1f} mm/s")
+        else:
+            try:
+                shelf.on_brick_recognized(
+                    decision.timestamp, decision.track_id, decision.class_name
+                )
+                print(
+                    f"Recognized: {decision.class_name}"
+                    f" ({decision.confidence:.2f} over {decision.hits} frames)"
+                )
+            except KeyError:
+                # Skip if class not in mapping
                 pass
 
-            @property
-            def channels(self):
-                return [type("MockChannel", (), {"duty_cycle": 0})() for _ in range(16)]
 
-        return MockPCA
+def run_sequential(
+    source: Callable[[], CapturedFrame | None],
+    camera: BrickCamera,
+    belt: ConveyorBelt,
+    shelf: ServoShelf,
+    tracker: BrickTracker,
+    gate: MotionGate | None,
+    crop: bool,
+    recorder: SessionWriter | None = None,
+) -> None:
+    """Capture, recognize, dispatch and display one frame after another."""
+    while True:
+        frame = source()
+        if frame is None:
+            print("Failed to capture frame")
+            break
+
+        if gate is not None:
+            apply_motion_gate(gate, frame, crop)
+        if frame.should_infer:
+            frame.hypotheses = camera.recognize(
+                frame.image, frame.capture_time, frame.roi
+            )
+            if recorder is not None:
+                recorder.write_hypotheses(frame.capture_time, frame.hypotheses)
+        draw_hypotheses(frame.image, frame.hypotheses)
+        with camera.latencies.measure("dispatch"):
+            dispatch_hypotheses(
+                belt, shelf, tracker, frame.hypotheses, frame.capture_time
+            )
+
+        cv2.imshow("ConveyorBelt", frame.image)
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            break
+
+
+def run_pipelined(
+    source: Callable[[], CapturedFrame | None],
+    camera: BrickCamera,
+    belt: ConveyorBelt,
+    shelf: ServoShelf,
+    tracker: BrickTracker,
+    gate: MotionGate | None,
+    crop: bool,
+    queue_size: int,
+    recorder: SessionWriter | None = None,
+    batcher: FrameBatcher | None = None,
+    report_interval: float = 5.0,
+) -> None:
+    """Run capture, inference and dispatch concurrently on separate threads.
+
+    The main thread only displays the most recent results, because
+    cv2.imshow must be called from the main thread on some platforms.
+
+    With a batcher, the inference stage runs the model on batches of
+    frames. Frames leave the stage in capture order, so frames that skip
+    inference wait for the batch in front of them.
+    """
+
+    def motion(frame: CapturedFrame) -> CapturedFrame:
+        assert gate is not None
+        apply_motion_gate(gate, frame, crop)
+        return frame
+
+    def infer(frame: CapturedFrame) -> list[CapturedFrame]:
+        if frame.should_infer:
+            frame.hypotheses = camera.recognize(
+                frame.image, frame.capture_time, frame.roi
+            )
+            if recorder is not None:
+                recorder.write_hypotheses(frame.capture_time, frame.hypotheses)
+        return [frame]
+
+    # Frames in the inference stage, in capture order, and those of them
+    # that wait for their batch.
+    waiting: deque[CapturedFrame] = deque()
+    batched: deque[CapturedFrame] = deque()
+
+    def infer_batched(frame: CapturedFrame) -> list[CapturedFrame] | None:
+        assert batcher is not None
+        waiting.append(frame)
+        if frame.should_infer:
+            batched.append(frame)
+            results = batcher.add(frame.image, frame.capture_time, frame.roi)
+        else:
+            results = batcher.poll()
+        for _, _, hypotheses in results:
+            inferred = batched.popleft()
+            inferred.hypotheses = hypotheses
+            if recorder is not None:
+                recorder.write_hypotheses(inferred.capture_time, hypotheses)
+
+        ready = []
+        while waiting and not (batched and waiting[0] is batched[0]):
+            ready.append(waiting.popleft())
+        return ready or None
+
+    def dispatch(frames: list[CapturedFrame]) -> CapturedFrame:
+        with camera.latencies.measure("dispatch"):
+            for frame in frames:
+                dispatch_hypotheses(
+                    belt, shelf, tracker, frame.hypotheses, frame.capture_time
+                )
+        return frames[-1]
+
+    stages = [
+        ("inference", infer if batcher is None else infer_batched),
+        ("dispatch", dispatch),
+    ]
+    if gate is not None:
+        stages.insert(0, ("motion", motion))
+    pipeline = Pipeline(
+        source=source,
+        stages=stages,
+        maxsize=queue_size,
+        # Stale frames may be dropped, but never recognized bricks.
+        blocking_stages=["dispatch"],
+    )
+    pipeline.start()
+    next_report = time.monotonic() + report_interval
+    try:
+        while not pipeline.output.closed:
+            frame = pipeline.output.get(timeout=0.1)
+            if frame is not None:
+                draw_hypotheses(frame.image, frame.hypotheses)
+                cv2.imshow("ConveyorBelt", frame.image)
+            if cv2.waitKey(1) & 0xFF == ord("q"):
+                break
+            if time.monotonic() >= next_report:
+                print(pipeline.report())
+                print(camera.latencies.report(recent=True))
+                print(tracker.report())
+                if gate is not None:
+                    print(gate.report())
+                next_report += report_interval
+    finally:
+        pipeline.stop()
+        if batcher is not None and waiting:
+            # Finish the frames still waiting for a batch.
+            for frame, (_, _, hypotheses) in zip(batched, batcher.flush()):
+                frame.hypotheses = hypotheses
+            batched.clear()
+            dispatch(list(waiting))
+            waiting.clear()
+        print(pipeline.report())
 
 
 def main():
@@ -70,85 +410,222 @@ def main():
     parser.add_argument(
         "--device", type=str, default="cpu", help="Device (cpu, mps, 0 for cuda)"
     )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Run capture, inference and dispatch on separate threads",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=2,
+        help="Capacity of each queue between pipeline stages",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Maximum number of frames per forward pass with --pipeline; the"
+        " batch size adapts to the model latency",
+    )
+    parser.add_argument(
+        "--batch-deadline",
+        type=float,
+        default=0.1,
+        help="Maximum time (seconds) a frame waits for its batch to fill up,"
+        " checked whenever a frame arrives",
+    )
+    parser.add_argument(
+        "--motion-gate",
+        action="store_true",
+        help="Only run the model when something enters the region of interest",
+    )
+    parser.add_argument(
+        "--roi",
+        choices=["full", "band", "foreground"],
+        default="full",
+        help="Crop frames before inference: to the central band of the belt,"
+        " or around the foreground bounding box (requires --motion-gate)",
+    )
+    parser.add_argument(
+        "--input-size",
+        type=int,
+        default=None,
+        help="Model input size in pixels (default: model default)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["torch", "onnxruntime", "opencv"],
+        default="torch",
+        help="Inference backend; onnxruntime and opencv need .onnx weights",
+    )
+    parser.add_argument(
+        "--names",
+        type=str,
+        default=None,
+        help="Class names file for ONNX models (e.g. bricks.yaml)",
+    )
+    parser.add_argument(
+        "--threads", type=int, default=None, help="Number of inference threads"
+    )
+    parser.add_argument(
+        "--mm-per-pixel",
+        type=float,
+        default=0.5,
+        help="Size of one camera pixel on the belt (mm), to track moving bricks"
+        " and measure the belt speed from their motion",
+    )
+    parser.add_argument(
+        "--capture-latency",
+        type=float,
+        default=0.0,
+        help="Measured delay between frame exposure and delivery (seconds)",
+    )
+    parser.add_argument(
+        "--no-driver-timestamps",
+        action="store_true",
+        help="Ignore CAP_PROP_POS_MSEC frame timestamps from the camera driver",
+    )
+    parser.add_argument(
+        "--conflict-policy",
+        choices=["merge", "delay", "reject"],
+        default="merge",
+        help="What to do with a brick whose kicker is still busy with the"
+        " previous one: keep the kicker out, kick later, or let it pass",
+    )
+    parser.add_argument(
+        "--record",
+        type=Path,
+        default=None,
+        help="Append frames, detections and servo events to this session file",
+    )
+    parser.add_argument(
+        "--replay",
+        type=Path,
+        default=None,
+        help="Read frames from a session file instead of the webcam,"
+        " without servo hardware",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        choices=["original", "max"],
+        default="original",
+        help="Pace replayed frames like they were captured, or go as fast as"
+        " possible (use without --pipeline for a reproducible servo timeline)",
+    )
     args = parser.parse_args()
+    if args.roi == "foreground" and not args.motion_gate:
+        parser.error("--roi=foreground requires --motion-gate")
+    if args.batch_size > 1 and not args.pipeline:
+        parser.error("--batch-size requires --pipeline")
 
-    original_load = torch.load
-    torch.load = functools.partial(original_load, weights_only=False)
-    try:
-        model = yolov7.load(args.weights, device=args.device)
-    finally:
-        torch.load = original_load
+    model = load_model(
+        args.weights,
+        args.backend,
+        args.device,
+        args.names,
+        args.threads,
+        args.input_size,
+    )
 
-    camera = BrickCamera(model)
-    belt = ConveyorBelt(length=BELT_LENGTH, kicker_distances=KICKER_DISTANCES)
-    mapping = BrickMapping("drawers/brick_classes.csv")
-    shelf = ServoShelf(
-        config=CONTROLLER_CONFIG,
-        pca_factory=get_pca_factory(),
-        conveyor_belt=belt,
-        brick_mapping=mapping,
+    camera = BrickCamera(model, input_size=args.input_size)
+    batcher = None
+    if args.batch_size > 1:
+        batcher = FrameBatcher(
+            camera, max_batch_size=args.batch_size, deadline=args.batch_deadline
+        )
+    crop = args.roi == "foreground"
+    gate = MotionGate() if args.motion_gate else None
+    belt = ConveyorBelt(
+        length=BELT_LENGTH,
+        kicker_distances=KICKER_DISTANCES,
+        mm_per_pixel=args.mm_per_pixel,
     )
+    tracker = BrickTracker(belt, mm_per_pixel=args.mm_per_pixel)
+    mapping = BrickMapping("drawers/brick_classes.csv")
+    recorder = SessionWriter(args.record) if args.record else None
+    event_log = recorder.write_servo_event if recorder else None
 
-    shelf.start()
+    cap = None
+    if args.replay:
+        # Replayed sessions run on their recorded capture times.
+        reader = SessionReader(args.replay)
+        virtual_clock = VirtualClock(reader.start_time)
+        shelf = ServoShelf(
+            config=CONTROLLER_CONFIG,
+            pca_factory=functools.partial(RecordingPCA, clock=virtual_clock),
+            conveyor_belt=belt,
+            brick_mapping=mapping,
+            clock=virtual_clock,
+            conflict_policy=args.conflict_policy,
+            event_log=event_log,
+        )
+        source = replay_source(
+            reader, shelf, virtual_clock, realtime=args.replay_speed == "original"
+        )
+        print(f"Replaying {reader.frame_count} frames from {args.replay}")
+    else:
+        shelf = ServoShelf(
+            config=CONTROLLER_CONFIG,
+            pca_factory=get_pca_factory(),
+            conveyor_belt=belt,
+            brick_mapping=mapping,
+            conflict_policy=args.conflict_policy,
+            event_log=event_log,
+        )
+        shelf.start()
 
-    cap = cv2.VideoCapture(args.cam)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        cap = cv2.VideoCapture(args.cam)
+        clock = CaptureClock(
+            latency=args.capture_latency,
+            use_driver_timestamps=not args.no_driver_timestamps,
+        )
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        source = functools.partial(read_frame, cap, clock)
+    if recorder is not None:
+        source = recording_source(source, recorder)
+    if args.roi == "band":
+        source = band_source(source)
 
     print("Starting main loop. Press 'q' to quit.")
     try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                print("Failed to capture frame")
-                break
-
-            # Match webcam.py rotation: bricks move top-to-bottom
-            frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-            capture_time = time.time()
-
-            hypotheses = camera.recognize(frame, capture_time)
-
-            for h in hypotheses:
-                # Bounding box for debug display
-                h_h, h_w = frame.shape[:2]
-                x1 = int((h.x_center - h.width / 2) * h_w)
-                y1 = int((h.y_center - h.height / 2) * h_h)
-                x2 = int((h.x_center + h.width / 2) * h_w)
-                y2 = int((h.y_center + h.height / 2) * h_h)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                cv2.putText(
-                    frame,
-                    f"{h.class_name} {h.confidence:.2f}",
-                    (x1, y1 - 10),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.5,
-                    (0, 255, 0),
-                    1,
-                )
-
-                # Special handling for belt marks (using 3005_brick_1x1 as a marker)
-                if h.class_name == "3005_brick_1x1":
-                    belt.observed_mark_at(h.class_name, capture_time)
-                    print(f"Calibration mark seen. Speed: {belt.speed:.1f} mm/s")
-                else:
-                    try:
-                        shelf.on_brick_recognized(capture_time, h.class_name)
-                        print(f"Recognized: {h.class_name}")
-                    except KeyError:
-                        # Skip if class not in mapping
-                        pass
-
-            cv2.imshow("ConveyorBelt", frame)
-            if cv2.waitKey(1) & 0xFF == ord("q"):
-                break
-
+        if args.pipeline:
+            run_pipelined(
+                source,
+                camera,
+                belt,
+                shelf,
+                tracker,
+                gate,
+                crop,
+                args.queue_size,
+                recorder,
+                batcher,
+            )
+        else:
+            run_sequential(source, camera, belt, shelf, tracker, gate, crop, recorder)
     except KeyboardInterrupt:
         pass
     finally:
         print("Shutting down...")
+        if args.replay:
+            # Finish the bricks still in view, and fire all their events.
+            dispatch_decisions(belt, shelf, tracker.flush())
+            fire_events_until(shelf, virtual_clock, math.inf)
+            reader.close()
+        print(tracker.report())
+        print(camera.latencies.report())
+        if gate is not None:
+            print(gate.report())
         shelf.stop()
-        cap.release()
+        print(shelf.jitter.report())
+        print(shelf.bus_report())
+        print(shelf.planner.report())
+        if recorder is not None:
+            recorder.close()
+        if cap is not None:
+            cap.release()
         cv2.destroyAllWindows()
 
 
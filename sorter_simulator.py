@@ -0,0 +1,386 @@
+#!/usr/bin/env -S uv run
+
+"""Discrete-event simulation of the belt and shelf, for offline load tests.
+
+Bricks arrive at the camera from a synthetic (Poisson) or recorded stream.
+The simulator feeds them and the calibration mark to ConveyorBelt and
+ServoShelf as the sorter would, fires the planned servo events in virtual
+time, and records the resulting register writes with a RecordingPCA per
+controller. Replaying the writes against the true brick positions shows
+where each brick actually ended up, so the achievable throughput of the
+control software can be found without hardware. Runs are deterministic for
+a given seed and much faster than real time.
+"""
+
+import argparse
+import bisect
+import csv
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from brick_mapping import BrickMapping
+from conveyor_belt import ConveyorBelt
+from latency_histogram import LatencyHistogram
+from motion_planner import FLAP_CLOSED, FLAP_OPEN, KICKER_KICK, KICKER_REST
+from servo_shelf import ServoShelf
+from servo_virtual import RecordingPCA, VirtualClock, fire_events_until
+
+
+def synthetic_arrivals(
+    classes: list[str],
+    rate: float,  # bricks per minute
+    duration: float,  # seconds
+    min_spacing: float = 0.1,  # seconds
+    seed: int = 42,
+) -> list[tuple[float, str]]:
+    """Generate Poisson brick arrivals at the camera, with random classes.
+
+    Returns:
+        (timestamp, brick class) pairs, sorted by timestamp. Bricks are at
+        least min_spacing apart, because they can't overlap on the belt.
+    """
+    rng = random.Random(seed)
+    arrivals = []
+    timestamp = 0.0
+    while True:
+        timestamp += max(min_spacing, rng.expovariate(rate / 60))
+        if timestamp >= duration:
+            return arrivals
+        arrivals.append((timestamp, rng.choice(classes)))
+
+
+def load_arrivals(path: Path) -> list[tuple[float, str]]:
+    """Load recorded arrivals from a CSV file with timestamp,class rows."""
+    with path.open(newline="") as csvfile:
+        arrivals = [(float(row[0]), row[1].strip()) for row in csv.reader(csvfile)]
+    return sorted(arrivals)
+
+
+@dataclass
+class SimulationReport:
+    """Outcome of one simulation run."""
+
+    bricks: int
+    duration: float  # seconds of virtual time with arrivals
+    # Bricks that ended up in their drawer.
+    sorted_bricks: int = 0
+    # Bricks of unmapped classes that correctly rode to the overflow bin.
+    unknown: int = 0
+    # Mapped bricks that the planner didn't kick because of a conflict, and
+    # that rode to the overflow bin.
+    rejected: int = 0
+    # Mapped bricks that should have been kicked, but rode to the overflow bin.
+    mis_timed: int = 0
+    # Bricks in a wrong drawer, or kicked while no flap of the column was open.
+    misrouted: int = 0
+    max_queue_length: int = 0
+    mean_queue_length: float = 0.0
+    # Wall time of ServoShelf.on_brick_recognized(), i.e. planning.
+    scheduling_latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    @property
+    def bricks_per_minute(self) -> float:
+        """Sorted bricks per minute of belt time."""
+        return self.sorted_bricks / self.duration * 60 if self.duration > 0 else 0.0
+
+    def summary(self) -> str:
+        latency = self.scheduling_latency
+        return (
+            f"{self.bricks} bricks: {self.sorted_bricks} sorted"
+            f" ({self.bricks_per_minute:.1f}/min), {self.unknown} unknown,"
+            f" {self.rejected} rejected, {self.mis_timed} mis-timed,"
+            f" {self.misrouted} misrouted;"
+            f" queue max={self.max_queue_length}"
+            f" mean={self.mean_queue_length:.1f};"
+            f" scheduling p50={latency.percentile(50) * 1000:.2f}ms"
+            f" p99={latency.percentile(99) * 1000:.2f}ms"
+            f" max={max(latency.max, 0.0) * 1000:.2f}ms"
+        )
+
+
+class SorterSimulator:
+    """Runs arrival streams through ConveyorBelt and ServoShelf in virtual time."""
+
+    def __init__(
+        self,
+        controller_config: dict[int, str],
+        kicker_distances: dict[str, float],
+        belt_length: float,
+        brick_mapping: Any,
+        belt_speed: float = 250.0,  # mm/s
+        latency: float = 0.1,  # seconds
+        timing_noise: float = 0.0,  # seconds
+        kick_tolerance: float = 10.0,  # mm
+        conflict_policy: str = "merge",
+        mark_class: str = "3005_brick_1x1",
+        seed: int = 42,
+    ) -> None:
+        """Initialize the simulator.
+
+        Args:
+            controller_config: I2C address => servo ranges, see ServoShelf.
+            kicker_distances: Distances from the camera to each kicker (mm).
+            belt_length: Length of the belt, i.e. between mark sightings (mm).
+            brick_mapping: Maps brick classes to drawers.
+            belt_speed: The true belt speed.
+            latency: Delay between a brick passing the camera and the
+                sorter handling it, for tracking and inference.
+            timing_noise: Standard deviation of the error of the timestamps
+                the sorter sees.
+            kick_tolerance: How far a brick may be from a kicker when it
+                kicks and still be pushed off (mm along the belt).
+            conflict_policy: See MotionPlanner.
+            mark_class: Class name reported for the calibration mark.
+            seed: Seed for the timing noise.
+        """
+        self._controller_config = controller_config
+        self._kicker_distances = kicker_distances
+        self._belt_length = belt_length
+        self._mapping = brick_mapping
+        self._belt_speed = belt_speed
+        self._latency = latency
+        self._timing_noise = timing_noise
+        self._kick_tolerance = kick_tolerance / belt_speed
+        self._conflict_policy = conflict_policy
+        self._mark_class = mark_class
+        self._seed = seed
+        self.clock = VirtualClock()
+        self.pcas: dict[int, RecordingPCA] = {}
+        self.belt: ConveyorBelt | None = None
+        self.shelf: ServoShelf | None = None
+
+    def _make_pca(self, address: int) -> RecordingPCA:
+        pca = RecordingPCA(address, clock=self.clock)
+        self.pcas[address] = pca
+        return pca
+
+    def run(self, arrivals: list[tuple[float, str]]) -> SimulationReport:
+        """Simulate the given arrivals with a fresh belt and shelf.
+
+        Args:
+            arrivals: (timestamp, brick class) of each brick passing the
+                camera mid-line, in true time.
+        """
+        rng = random.Random(self._seed)
+        rotation = self._belt_length / self._belt_speed
+        # Start the mark early enough for the belt to be calibrated.
+        start = min((t for t, _ in arrivals), default=0.0) - 4 * rotation
+        end = max((t for t, _ in arrivals), default=0.0)
+        self.clock = VirtualClock(start)
+        self.pcas = {}
+        self.belt = ConveyorBelt(
+            length=self._belt_length, kicker_distances=self._kicker_distances
+        )
+        self.shelf = ServoShelf(
+            config=self._controller_config,
+            pca_factory=self._make_pca,
+            conveyor_belt=self.belt,
+            brick_mapping=self._mapping,
+            clock=self.clock,
+            conflict_policy=self._conflict_policy,
+        )
+
+        # (dispatch time, order, true timestamp, brick id, class or None for
+        # the mark). Bricks are identified by their index in arrivals.
+        dispatches = [
+            (start + i * rotation + self._latency, 0, start + i * rotation, -1, None)
+            for i in range(int((end - start) / rotation) + 1)
+        ]
+        dispatches += [
+            (timestamp + self._latency, 1, timestamp, brick_id, brick_class)
+            for brick_id, (timestamp, brick_class) in enumerate(arrivals)
+        ]
+        dispatches.sort()
+
+        # Ids of the bricks the planner rejected.
+        rejected: set[int] = set()
+        self.shelf.planner.on_rejected = rejected.add
+
+        report = SimulationReport(
+            bricks=len(arrivals),
+            duration=end - min((t for t, _ in arrivals), default=end),
+        )
+        total_queue_length = 0
+        for dispatch_time, _, timestamp, brick_id, brick_class in dispatches:
+            fire_events_until(self.shelf, self.clock, dispatch_time)
+            self.clock.advance(dispatch_time)
+            observed = timestamp + rng.gauss(0.0, self._timing_noise)
+            if brick_class is None:
+                self.belt.observed_mark_at(self._mark_class, observed)
+                continue
+            start_time = time.perf_counter()
+            try:
+                self.shelf.on_brick_recognized(observed, brick_id, brick_class)
+            except KeyError:
+                pass
+            report.scheduling_latency.record(time.perf_counter() - start_time)
+            queue_length = len(self.shelf.pending_events())
+            report.max_queue_length = max(report.max_queue_length, queue_length)
+            total_queue_length += queue_length
+        fire_events_until(self.shelf, self.clock, math.inf)
+
+        if arrivals:
+            report.mean_queue_length = total_queue_length / len(arrivals)
+        self._score(arrivals, rejected, report)
+        return report
+
+    def timelines(self) -> dict[str, tuple[list[float], list[float]]]:
+        """Decode the recorded writes into (times, angles) per servo label."""
+        assert self.shelf is not None
+        # (address, channel) => (label, register values => angle).
+        decoders = {}
+        for label, servo in self.shelf.servos.items():
+            address = servo.controller.pca.address
+            angles = {
+                servo.controller.pwm_values(servo.channel, angle): angle
+                for angle in (FLAP_CLOSED, FLAP_OPEN, KICKER_REST, KICKER_KICK)
+            }
+            decoders[address, servo.channel] = (label, angles)
+
+        timelines: dict[str, tuple[list[float], list[float]]] = {}
+        for address, pca in self.pcas.items():
+            for timestamp, channel, on, off in pca.writes:
+                label, angles = decoders[address, channel]
+                times, values = timelines.setdefault(label, ([], []))
+                times.append(timestamp)
+                values.append(angles.get((on, off), -1.0))
+        return timelines
+
+    def _score(
+        self,
+        arrivals: list[tuple[float, str]],
+        rejected: set[int],
+        report: SimulationReport,
+    ) -> None:
+        """Follow each brick along the true belt to see where it ended up.
+
+        Args:
+            arrivals: (true timestamp, brick class) of each brick.
+            rejected: Indices in arrivals of the bricks the planner rejected.
+            report: Receives the count of each outcome.
+        """
+        timelines = self.timelines()
+
+        def angle_at(label: str, timestamp: float) -> float:
+            times, angles = timelines.get(label, ([], []))
+            i = bisect.bisect_right(times, timestamp)
+            return angles[i - 1] if i else 0.0
+
+        def kicks_near(label: str, timestamp: float) -> bool:
+            if angle_at(label, timestamp - self._kick_tolerance) == KICKER_KICK:
+                return True
+            times, angles = timelines.get(label, ([], []))
+            first = bisect.bisect_right(times, timestamp - self._kick_tolerance)
+            last = bisect.bisect_right(times, timestamp + self._kick_tolerance)
+            return KICKER_KICK in angles[first:last]
+
+        kickers = sorted(self._kicker_distances, key=self._kicker_distances.get)
+        assert self.shelf is not None
+        flaps = [label for label, servo in self.shelf.servos.items() if servo.row > 0]
+        for brick_id, (timestamp, brick_class) in enumerate(arrivals):
+            target = self._mapping.class_to_cell.get(brick_class)
+            destination = None
+            for kicker in kickers:
+                passing_time = (
+                    timestamp + self._kicker_distances[kicker] / self._belt_speed
+                )
+                if kicks_near(kicker, passing_time):
+                    open_flaps = [
+                        flap
+                        for flap in flaps
+                        if flap[0] == kicker[0]
+                        and angle_at(flap, passing_time) == FLAP_OPEN
+                    ]
+                    destination = open_flaps[0] if len(open_flaps) == 1 else ""
+                    break
+
+            if destination == target:
+                if target is None:
+                    report.unknown += 1
+                else:
+                    report.sorted_bricks += 1
+            elif destination is not None:
+                report.misrouted += 1
+            elif brick_id in rejected:
+                # Rejected bricks ride to the overflow bin on purpose.
+                report.rejected += 1
+            else:
+                report.mis_timed += 1
+
+
+def parse_floats(text: str) -> list[float]:
+    return [float(part) for part in text.split(",")]
+
+
+def main() -> None:
+    from sorter_main import BELT_LENGTH, CONTROLLER_CONFIG, KICKER_DISTANCES
+
+    parser = argparse.ArgumentParser(description="Sorter Simulator")
+    parser.add_argument(
+        "--rates",
+        type=parse_floats,
+        default=[30.0, 60.0, 120.0, 240.0],
+        help="Comma-separated synthetic arrival rates (bricks per minute)",
+    )
+    parser.add_argument(
+        "--arrivals",
+        type=Path,
+        default=None,
+        help="CSV file of recorded timestamp,class arrivals instead of --rates",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=600.0, help="Virtual seconds per run"
+    )
+    parser.add_argument("--speed", type=float, default=250.0, help="Belt mm/s")
+    parser.add_argument(
+        "--latency", type=float, default=0.1, help="Recognition delay (seconds)"
+    )
+    parser.add_argument(
+        "--timing-noise",
+        type=float,
+        default=0.005,
+        help="Standard deviation of timestamp errors (seconds)",
+    )
+    parser.add_argument(
+        "--conflict-policy", choices=["merge", "delay", "reject"], default="merge"
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    mapping = BrickMapping("drawers/brick_classes.csv")
+    simulator = SorterSimulator(
+        CONTROLLER_CONFIG,
+        KICKER_DISTANCES,
+        BELT_LENGTH,
+        mapping,
+        belt_speed=args.speed,
+        latency=args.latency,
+        timing_noise=args.timing_noise,
+        conflict_policy=args.conflict_policy,
+        seed=args.seed,
+    )
+    if args.arrivals:
+        streams = {str(args.arrivals): load_arrivals(args.arrivals)}
+    else:
+        classes = list(mapping.class_to_cell)
+        streams = {
+            f"{rate:g}/min": synthetic_arrivals(
+                classes, rate, args.duration, seed=args.seed
+            )
+            for rate in args.rates
+        }
+    for name, arrivals in streams.items():
+        start_time = time.perf_counter()
+        report = simulator.run(arrivals)
+        elapsed = time.perf_counter() - start_time
+        print(f"{name}: {report.summary()} ({elapsed:.1f}s wall time)")
+        assert simulator.shelf is not None
+        print(simulator.shelf.planner.report())
+
+
+if __name__ == "__main__":
+    main()
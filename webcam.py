@@ -8,6 +8,8 @@ import time
 
 import cv2
 
+from motion_gate import detect_edges
+
 RED = (0, 0, 255)
 GREEN = (0, 255, 0)
 BLUE = (255, 0, 0)
@@ -82,12 +84,7 @@ while True:
     img = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
     image_height, image_width, image_channels = img.shape
 
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-    hue, saturation, value = cv2.split(hsv)
-    gray = cv2.max(saturation, 255 - value)
-
-    blur = cv2.blur(gray, (5, 5))
-    thresh = cv2.Canny(blur, threshold1=80, threshold2=160)
+    blur, thresh = detect_edges(img)
     x, y, width, height = cv2.boundingRect(thresh)
 
     key = cv2.waitKey(1) & 0xFF
@@ -3,26 +3,112 @@
 """Exports training/evaluation/test datasets to YOLO format."""
 
 from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
 import os
 import pathlib
 import re
+import threading
 from PIL import Image
 
+# JPEG start-of-frame markers, which hold the image dimensions. The others
+# in 0xC0..0xCF are DHT (0xC4), JPG (0xC8) and DAC (0xCC).
+SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(path: pathlib.Path) -> tuple[int, int] | None:
+    """Reads (width, height) from the JPEG headers, without decoding the image.
+
+    Returns None if the file isn't a JPEG or its headers can't be parsed.
+    """
+    with open(path, "rb") as infile:
+        if infile.read(2) != b"\xff\xd8":
+            return None
+        while True:
+            marker = infile.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            if marker[1] == 0xFF:
+                # Fill byte before a marker.
+                infile.seek(-1, os.SEEK_CUR)
+                continue
+            if marker[1] == 0x01 or 0xD0 <= marker[1] <= 0xD7:
+                # Markers without a payload.
+                continue
+            length_bytes = infile.read(2)
+            if len(length_bytes) < 2:
+                return None
+            length = int.from_bytes(length_bytes, "big")
+            if marker[1] in SOF_MARKERS:
+                payload = infile.read(5)
+                if len(payload) < 5:
+                    return None
+                height = int.from_bytes(payload[1:3], "big")
+                width = int.from_bytes(payload[3:5], "big")
+                return width, height
+            if marker[1] in (0xD9, 0xDA) or length < 2:
+                # End of image or start of scan before any frame header.
+                return None
+            infile.seek(length - 2, os.SEEK_CUR)
+
+
+def image_size(path: pathlib.Path) -> tuple[int, int]:
+    """Returns (width, height) of an image, reading only JPEG headers if possible."""
+    size = jpeg_size(path)
+    if size is not None:
+        return size
+    with Image.open(path) as image:
+        return image.width, image.height
+
 
 class YoloExporter:
-    """Class to export dataset to YOLO format."""
+    """Class to export dataset to YOLO format.
+
+    With workers > 1, images are probed, linked and labeled on a thread pool;
+    call finish() before write_yaml() to wait for them. In incremental mode,
+    images whose label file already has the right class id are skipped, so
+    that re-exporting a dataset only touches the changed files.
+    """
 
     def __init__(
         self,
         input_dir: pathlib.Path,
         output_dir: pathlib.Path,
+        workers: int = 1,
+        incremental: bool = False,
     ):
         self.input_dir = input_dir
         self.output_dir = output_dir
+        self.incremental = incremental
         self.class_names = []
         self.num_train_per_class = defaultdict(int)
         self.num_val_per_class = defaultdict(int)
         self.num_test_per_class = defaultdict(int)
+        self.num_exported = 0
+        self.num_skipped = 0
+        self._created_dirs = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._futures = []
+        if workers > 1:
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    @property
+    def class_names(self) -> list[str]:
+        return self._class_names
+
+    @class_names.setter
+    def class_names(self, class_names: list[str]) -> None:
+        self._class_names = list(class_names)
+        self._class_ids = {name: i for i, name in enumerate(self._class_names)}
+
+    def class_id(self, class_name: str) -> int:
+        """Returns the YOLO class id, adding the class if it is new."""
+        class_id = self._class_ids.get(class_name)
+        if class_id is None:
+            class_id = len(self._class_names)
+            self._class_names.append(class_name)
+            self._class_ids[class_name] = class_id
+        return class_id
 
     def path_to_class(self, path: pathlib.Path) -> str:
         """Converts a directory path to a human-readable sorter class name.
@@ -79,11 +165,7 @@ class YoloExporter:
         split: str,
     ) -> None:
         """Exports a single image file with labels to YOLO dataset format."""
-        try:
-            class_id = self.class_names.index(class_name)
-        except ValueError:
-            class_id = len(self.class_names)
-            self.class_names.append(class_name)
+        class_id = self.class_id(class_name)
 
         date_match = re.search(r"^\d{8}_\d{9}", child.name)
         if not date_match:
@@ -95,42 +177,82 @@ class YoloExporter:
         if not bbox_match:
             print(f"failed to parse l_r_t_b numbers from {child.name}")
             return
-        left = int(bbox_match.group(1))
-        right = int(bbox_match.group(2))
-        top = int(bbox_match.group(3))
-        bottom = int(bbox_match.group(4))
-
-        with Image.open(child) as image:
-            width = image.width
-            height = image.height
+        bbox = tuple(int(number) for number in bbox_match.groups())
+        output_base = f"{base}_{class_name}"
+
+        images = self.output_dir / "images" / split / class_name
+        labels = self.output_dir / "labels" / split / class_name
+        for directory in (images, labels):
+            if directory not in self._created_dirs:
+                directory.mkdir(parents=True, exist_ok=True)
+                self._created_dirs.add(directory)
+
+        args = (
+            child,
+            images / f"{output_base}.jpg",
+            labels / f"{output_base}.txt",
+            class_id,
+            bbox,
+        )
+        if self._executor is None:
+            self._write_files(*args)
+        else:
+            self._futures.append(self._executor.submit(self._write_files, *args))
+
+        if "train" in split:
+            self.num_train_per_class[class_name] += 1
+        elif "val" in split:
+            self.num_val_per_class[class_name] += 1
+        elif "test" in split:
+            self.num_test_per_class[class_name] += 1
+        else:
+            print("unexpected split:", split)
+
+    def _write_files(
+        self,
+        child: pathlib.Path,
+        output_jpg: pathlib.Path,
+        output_txt: pathlib.Path,
+        class_id: int,
+        bbox: tuple[int, ...],
+    ) -> None:
+        """Links the image and writes its label, unless it is up to date."""
+        if self.incremental and output_jpg.exists():
+            try:
+                label = output_txt.read_text(encoding="utf-8")
+            except FileNotFoundError:
+                label = ""
+            if label.startswith(f"{class_id:d} "):
+                with self._lock:
+                    self.num_skipped += 1
+                return
+
+        left, right, top, bottom = bbox
+        width, height = image_size(child)
         assert width * height == 640 * 480
 
         center_x = (left + right) / 2 / width
         center_y = (top + bottom) / 2 / height
         box_width = (right - left) / width
         box_height = (bottom - top) / height
-        output_base = f"{base}_{class_name}"
 
-        images = self.output_dir / "images" / split / class_name
-        output_jpg = images / f"{output_base}.jpg"
         if not output_jpg.exists():
-            images.mkdir(parents=True, exist_ok=True)
             os.link(child, output_jpg)
 
-        labels = self.output_dir / "labels" / split / class_name
-        labels.mkdir(parents=True, exist_ok=True)
-        output_txt = labels / f"{output_base}.txt"
         with open(output_txt, "wt", encoding="utf-8") as txt:
             txt.write(
                 f"{class_id:d} {center_x:.3f} {center_y:.3f} "
                 f"{box_width:.3f} {box_height:.3f}\n"
             )
+        with self._lock:
+            self.num_exported += 1
 
-        if "train" in split:
-            self.num_train_per_class[class_name] += 1
-        elif "val" in split:
-            self.num_val_per_class[class_name] += 1
-        elif "test" in split:
-            self.num_test_per_class[class_name] += 1
-        else:
-            print("unexpected split:", split)
+    def finish(self) -> None:
+        """Waits for pending exports and re-raises the first error, if any."""
+        futures: list[Future] = self._futures
+        self._futures = []
+        for future in futures:
+            future.result()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -1,6 +1,7 @@
 from unittest.mock import MagicMock, patch
 import pytest
-from yolo_exporter import YoloExporter
+from PIL import Image
+from yolo_exporter import YoloExporter, image_size, jpeg_size
 
 
 @pytest.fixture
@@ -88,3 +89,50 @@ def test_export_file(exporter, tmp_path, output_dir):
         assert "0 0.023 0.073 0.016 0.021" in content
         assert exporter.num_train_per_class["3001_brick_2x4"] == 1
         assert "3001_brick_2x4" in exporter.class_names
+
+
+def test_jpeg_size(tmp_path):
+    jpg_file = tmp_path / "portrait.jpg"
+    Image.new("RGB", (480, 640)).save(jpg_file, quality=50)
+    assert jpeg_size(jpg_file) == (480, 640)
+
+    png_file = tmp_path / "image.png"
+    Image.new("RGB", (64, 48)).save(png_file)
+    assert jpeg_size(png_file) is None
+    assert image_size(png_file) == (64, 48)
+
+
+def test_export_parallel_incremental(tmp_path, output_dir):
+    src_dir = tmp_path / "src"
+    src_dir.mkdir()
+    for i in range(10):
+        Image.new("RGB", (640, 480)).save(
+            src_dir / f"20231026_1200{i:02d}000_l10_r20_t30_b40_.jpg"
+        )
+    children = sorted(src_dir.glob("*.jpg"))
+
+    exporter = YoloExporter(tmp_path, output_dir, workers=4)
+    for child in children:
+        exporter.export_file(child, "3001_brick_2x4", "train2023")
+    exporter.finish()
+    assert exporter.num_exported == 10
+    labels = sorted((output_dir / "labels" / "train2023").glob("*/*.txt"))
+    assert len(labels) == 10
+    assert labels[0].read_text() == "0 0.023 0.073 0.016 0.021\n"
+
+    # Adding a class in front shifts the class ids, so all labels change.
+    exporter = YoloExporter(tmp_path, output_dir, workers=4, incremental=True)
+    exporter.class_names = ["3001_brick_2x4"]
+    for child in children:
+        exporter.export_file(child, "3001_brick_2x4", "train2023")
+    exporter.finish()
+    assert (exporter.num_exported, exporter.num_skipped) == (0, 10)
+
+    exporter = YoloExporter(tmp_path, output_dir, workers=4, incremental=True)
+    exporter.class_names = ["3000_new_brick", "3001_brick_2x4"]
+    for child in children:
+        exporter.export_file(child, "3001_brick_2x4", "train2023")
+    exporter.finish()
+    assert (exporter.num_exported, exporter.num_skipped) == (10, 0)
+    assert labels[0].read_text().startswith("1 ")
+    assert exporter.num_train_per_class["3001_brick_2x4"] == 10